@@ -0,0 +1,48 @@
+// Lector de Server-Sent Events sobre POST (EventSource només admet GET)
+//
+// Crida onEvent(nom, dades) per cada "event: ...\ndata: {...}\n\n" rebut.
+
+function dispatch(block, onEvent) {
+  let event = 'message';
+  const data = [];
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      data.push(line.slice(5).trimStart());
+    }
+  }
+  if (data.length > 0) {
+    onEvent(event, JSON.parse(data.join('\n')));
+  }
+}
+
+export async function postEventStream(url, body, onEvent) {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify(body)
+  });
+
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}));
+    throw new Error(error.error || `HTTP ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let separator;
+    while ((separator = buffer.indexOf('\n\n')) !== -1) {
+      dispatch(buffer.slice(0, separator), onEvent);
+      buffer = buffer.slice(separator + 2);
+    }
+  }
+}
@@ -0,0 +1,53 @@
+// Decodificador del format binari de graelles del servidor (server/wire_format.py)
+//
+// [uint32 LE: mida capçalera][capçalera JSON][dades float32 / uint16 / uint8]
+//
+// Els deltas (capçalera amb delta_count) porten [uint32 índexs][valors] i es
+// retornen com a header.indices i header.values.
+
+const TYPED_ARRAYS = {
+  f32: Float32Array,
+  u16: Uint16Array,
+  u8: Uint8Array
+};
+
+// Converteix un array pla en llistes niades segons la forma, p. ex. [20, 20, 11]
+function reshape(values, shape) {
+  if (shape.length === 1) {
+    return Array.from(values);
+  }
+  const [size, ...rest] = shape;
+  const stride = rest.reduce((a, b) => a * b, 1);
+  const result = new Array(size);
+  for (let i = 0; i < size; i++) {
+    result[i] = reshape(values.subarray(i * stride, (i + 1) * stride), rest);
+  }
+  return result;
+}
+
+// Retorna la capçalera amb la graella desquantitzada sota la clau header.grid_key
+export function decodeGridPayload(buffer) {
+  const headerLength = new DataView(buffer).getUint32(0, true);
+  const headerText = new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength));
+  const header = JSON.parse(headerText);
+
+  let dataOffset = 4 + headerLength;
+  // Delta: índexs plans (uint32) de les cel·les canviades i després els valors
+  if (header.delta_count !== undefined) {
+    header.indices = new Uint32Array(buffer, dataOffset, header.delta_count);
+    dataOffset += 4 * header.delta_count;
+  }
+
+  let values = new TYPED_ARRAYS[header.dtype](buffer, dataOffset);
+  if (header.dtype !== 'f32') {
+    const { offset, scale } = header;
+    values = Float32Array.from(values, q => offset + q * scale);
+  }
+
+  if (header.delta_count !== undefined) {
+    header.values = values;
+  } else {
+    header[header.grid_key || 'grid'] = reshape(values, header.shape);
+  }
+  return header;
+}
@@ -1,13 +1,95 @@
 """
 Google AI Studio (Gemini) API Integration
 """
+import asyncio
+import inspect
+import logging
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import google.generativeai as genai
 from dotenv import load_dotenv
+from google.generativeai import client as genai_client
+from google.generativeai.types import generation_types
+from latency import LatencyRegistry
+from metrics import Counter
+from prompt_cache import PromptContextRegistry
+from tracing import current_span, in_context, traced
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Safety settings to avoid blocking content
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_NONE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_NONE"
+    },
+]
+
+
+def build_generation_config(kwargs: dict) -> dict:
+    """Default generation config, overridable through kwargs"""
+    return {
+        'temperature': kwargs.get('temperature', 0.7),
+        'top_p': kwargs.get('top_p', 0.95),
+        'top_k': kwargs.get('top_k', 40),
+        'max_output_tokens': int(kwargs.get('max_output_tokens', 2048)),
+    }
+
+
+# Model principal i models de reserva (més ràpids) per quan s'acosta el deadline
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'models/gemini-2.0-flash')
+GEMINI_FALLBACK_MODELS = [
+    name.strip() for name in os.getenv('GEMINI_FALLBACK_MODELS', 'models/gemini-2.0-flash-lite').split(',')
+    if name.strip()
+]
+# Endpoint alternatiu (p. ex. el servidor fals de benchmarks/fake_llm.py) i transport ('rest' o 'grpc')
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT')
+# El transport REST de google-generativeai no té client asíncron: les crides async
+# s'executen en un fil
+ASYNC_CLIENT = GEMINI_TRANSPORT != 'rest'
+# Timeout per crida: request_options existeix a partir de google-generativeai 0.4;
+# abans (la 0.3.2 de requirements.txt) el timeout només l'accepta el client gapic
+REQUEST_OPTIONS = 'request_options' in inspect.signature(genai.GenerativeModel.generate_content).parameters
+
+# Peticions duplicades (hedging): retard abans de duplicar mentre no hi ha prou mostres
+# per calcular el p95 del model, i mostres mínimes per fer-lo servir
+LLM_HEDGE = os.getenv('LLM_HEDGE', '1') == '1'
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '2.0'))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count (~4 bytes per token) when the API doesn't report usage"""
+    return round(len(text.encode('utf-8')) / 4)
+
+
+def extract_text(response) -> str:
+    """Robust text extraction from a (possibly multipart) Gemini response or chunk"""
+    try:
+        return response.text
+    except ValueError:
+        # Handle cases where response.text fails (multipart or other issues)
+        if response.candidates and response.candidates[0].content.parts:
+            return "".join(part.text for part in response.candidates[0].content.parts)
+    return ""
+
 class GeminiAPI:
     """
     Wrapper class for Google's Gemini API (Google AI Studio)
@@ -24,161 +106,425 @@ class GeminiAPI:
             )
         
         # Configure the API
-        genai.configure(api_key=self.api_key)
+        options = {}
+        if GEMINI_API_ENDPOINT:
+            options['client_options'] = {'api_endpoint': GEMINI_API_ENDPOINT}
+        if GEMINI_TRANSPORT:
+            options['transport'] = GEMINI_TRANSPORT
+        genai.configure(api_key=self.api_key, **options)
         
         # Initialize the model (using gemini-2.0-flash - stable, fast model)
         # Other good options: models/gemini-2.5-flash, models/gemini-flash-latest
-        self.model = genai.GenerativeModel('models/gemini-2.0-flash')
+        self.model_name = GEMINI_MODEL
+        self.fallback_models = [name for name in GEMINI_FALLBACK_MODELS if name != self.model_name]
+        self.models = {
+            name: genai.GenerativeModel(name) for name in [self.model_name] + self.fallback_models
+        }
+        self.model = self.models[self.model_name]
+        
+        # Prompts de sistema preparats un sol cop i reutilitzats (vegeu prompt_cache.py)
+        self.contexts = {
+            name: PromptContextRegistry(name, safety_settings=SAFETY_SETTINGS) for name in self.models
+        }
+        
+        # Latència de cada model (successos) i errors
+        self.latency = LatencyRegistry()
+        # Tokens per model i tipus ('prompt' o 'output'), exportats a /metrics
+        self.tokens = Counter('llm_tokens_total', 'Tokens de la LLM per model i tipus (estimats si l\'API no els dóna)',
+                              ('model', 'kind'))
+        # Fils per a les peticions duplicades del camí síncron
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('LLM_HEDGE_WORKERS', '32')), thread_name_prefix='llm-hedge'
+        )
+    
+    async def _in_thread(self, func, *args, **kwargs):
+        """Run a blocking Gemini call on the hedge pool (transports without an async client)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._hedge_executor, in_context(lambda: func(*args, **kwargs)))
+    
+    def _generate_content(self, model, contents, timeout=None, **options):
+        """model.generate_content amb un timeout (segons) per a la crida HTTP/gRPC"""
+        if timeout is None or options.get('stream'):
+            return model.generate_content(contents, **options)
+        if REQUEST_OPTIONS:
+            return model.generate_content(contents, request_options={'timeout': timeout}, **options)
+        if model._client is None:
+            model._client = genai_client.get_default_generative_client()
+        response = model._client.generate_content(model._prepare_request(contents=contents, **options),
+                                                  timeout=timeout)
+        return generation_types.GenerateContentResponse.from_response(response)
+    
+    async def _generate_content_async(self, model, contents, timeout=None, **options):
+        if not ASYNC_CLIENT:
+            return await self._in_thread(self._generate_content, model, contents, timeout, **options)
+        if timeout is None or options.get('stream'):
+            return await model.generate_content_async(contents, **options)
+        if REQUEST_OPTIONS:
+            return await model.generate_content_async(contents, request_options={'timeout': timeout}, **options)
+        if model._async_client is None:
+            model._async_client = genai_client.get_default_generative_async_client()
+        response = await model._async_client.generate_content(model._prepare_request(contents=contents, **options),
+                                                              timeout=timeout)
+        return generation_types.AsyncGenerateContentResponse.from_response(response)
+    
+    def _request(self, prompt: str, system_prompt: str = None, model_name: str = None):
+        """Model i contingut per a una petició, amb el prompt de sistema del registre si n'hi ha"""
+        model_name = model_name or self.model_name
+        if system_prompt is None:
+            return self.models[model_name], prompt
+        context = self.contexts[model_name].get(system_prompt)
+        return context.model, context.contents(prompt)
+    
+    def _count_tokens(self, model_name: str, contents: str, text: str, response=None):
+        """Suma els tokens d'una crida: els de usage_metadata si n'hi ha, si no estimats"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            prompt_tokens, output_tokens = usage.prompt_token_count, usage.candidates_token_count
+        else:
+            prompt_tokens, output_tokens = estimate_tokens(contents), estimate_tokens(text or '')
+        self.tokens.inc(model_name, 'prompt', amount=prompt_tokens)
+        self.tokens.inc(model_name, 'output', amount=output_tokens)
     
-    def generate_text(self, prompt: str, **kwargs) -> dict:
+    def _observe(self, model_name: str, start: float, result: dict, contents: str = None, response=None) -> dict:
+        """Registra la latència (o l'error) i els tokens d'una crida i anota el model al resultat"""
+        histogram = self.latency.get(model_name)
+        span = current_span()
+        if span is not None:
+            span.set_attribute('llm.model', model_name)
+            span.set_attribute('llm.success', result['success'])
+        if result['success']:
+            histogram.observe(time.monotonic() - start)
+            if contents is not None:
+                self._count_tokens(model_name, contents, result['text'], response)
+        else:
+            histogram.observe_error()
+        result['model'] = model_name
+        return result
+    
+    def hedge_delay(self, model_name: str = None) -> float:
+        """Temps d'espera abans de duplicar una petició: el p95 recent del model"""
+        p95 = self.latency.get(model_name or self.model_name).percentile(95, LLM_HEDGE_MIN_SAMPLES)
+        return max(0.05, p95) if p95 is not None else LLM_HEDGE_DELAY
+    
+    def expected_latency(self, model_name: str) -> float:
+        """Latència mediana recent d'un model (o el retard de hedging per defecte si no se sap)"""
+        p50 = self.latency.get(model_name).percentile(50, LLM_HEDGE_MIN_SAMPLES)
+        return p50 if p50 is not None else LLM_HEDGE_DELAY
+    
+    def _hedge_plan(self, start: float, deadline: float):
+        """
+        Accions programades per a una petició amb deadline: (instant, model, motiu).
+        
+        - 'hedge': duplicat del model principal quan supera el seu p95
+        - 'fallback': model de reserva quan el temps restant és el que aquest sol trigar
+        """
+        plan = []
+        if LLM_HEDGE:
+            plan.append((start + self.hedge_delay(), self.model_name, 'hedge'))
+        if self.fallback_models:
+            fallback = self.fallback_models[0]
+            plan.append((max(start, start + deadline - self.expected_latency(fallback)), fallback, 'fallback'))
+        return sorted(plan)
+    
+    def _generation_result(self, response) -> dict:
+        """Build the generate_text result dict from a complete response"""
+        text_content = extract_text(response)
+        
+        # Check if text is empty and why
+        if not text_content:
+            finish_reason = "UNKNOWN"
+            if response.candidates:
+                finish_reason = response.candidates[0].finish_reason
+                
+            logger.warning("Empty text content from Gemini", extra={
+                'finish_reason': str(finish_reason),
+                'prompt_feedback': str(response.prompt_feedback) if response.prompt_feedback else None
+            })
+            
+            # If finish_reason is MAX_TOKENS (2), it means we hit the limit.
+            # But if text is empty, it's strange. 
+            
+            if finish_reason != 1: # 1 is STOP
+                 return {
+                    'success': False,
+                    'error': f"Generation stopped. Finish reason: {finish_reason}",
+                    'text': None
+                }
+
+        return {
+            'success': True,
+            'text': text_content,
+            'candidates': len(response.candidates) if hasattr(response, 'candidates') else 1,
+            'prompt_feedback': response.prompt_feedback if hasattr(response, 'prompt_feedback') else None
+        }
+    
+    @traced('llm.generate')
+    def generate_text(self, prompt: str, system_prompt: str = None, model_name: str = None,
+                      timeout: float = None, **kwargs) -> dict:
         """
         Generate text using the Gemini API
         
         Args:
             prompt (str): The input prompt for text generation
+            system_prompt (str): Static instructions, kept as a reusable cached context
+            model_name (str): Model to use (defaults to the primary model)
+            timeout (float): Seconds before the call is abandoned (defaults to the SDK's)
             **kwargs: Additional parameters for generation (temperature, max_tokens, etc.)
             
         Returns:
             dict: Response containing the generated text and metadata
         """
+        model_name = model_name or self.model_name
+        start = time.monotonic()
         try:
-            # Set default generation config
-            generation_config = {
-                'temperature': kwargs.get('temperature', 0.7),
-                'top_p': kwargs.get('top_p', 0.95),
-                'top_k': kwargs.get('top_k', 40),
-                'max_output_tokens': int(kwargs.get('max_output_tokens', 2048)),
-            }
-            
-            # Safety settings to avoid blocking content
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                },
-            ]
-            
             # Generate content
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
+            model, contents = self._request(prompt, system_prompt, model_name)
+            response = self._generate_content(
+                model,
+                contents,
+                timeout,
+                generation_config=build_generation_config(kwargs),
+                safety_settings=SAFETY_SETTINGS
             )
+            return self._observe(model_name, start, self._generation_result(response), contents, response)
             
-            # Robust text extraction
-            text_content = ""
-            try:
-                text_content = response.text
-            except ValueError:
-                # Handle cases where response.text fails (multipart or other issues)
-                if response.candidates and response.candidates[0].content.parts:
-                    text_content = "".join(part.text for part in response.candidates[0].content.parts)
-            
-            # Check if text is empty and why
-            if not text_content:
-                finish_reason = "UNKNOWN"
-                if response.candidates:
-                    finish_reason = response.candidates[0].finish_reason
-                    
-                print(f"DEBUG: Empty text content. Finish reason: {finish_reason}")
-                if response.prompt_feedback:
-                    print(f"DEBUG: Prompt feedback: {response.prompt_feedback}")
-                
-                # If finish_reason is MAX_TOKENS (2), it means we hit the limit.
-                # But if text is empty, it's strange. 
-                
-                if finish_reason != 1: # 1 is STOP
-                     return {
-                        'success': False,
-                        'error': f"Generation stopped. Finish reason: {finish_reason}",
-                        'text': None
-                    }
-
-            return {
-                'success': True,
-                'text': text_content,
-                'candidates': len(response.candidates) if hasattr(response, 'candidates') else 1,
-                'prompt_feedback': response.prompt_feedback if hasattr(response, 'prompt_feedback') else None
-            }
+        except Exception as e:
+            return self._observe(model_name, start, {
+                'success': False,
+                'error': str(e),
+                'text': None
+            })
+    
+    @traced('llm.generate')
+    async def generate_text_async(self, prompt: str, system_prompt: str = None, model_name: str = None,
+                                  timeout: float = None, **kwargs) -> dict:
+        """
+        Async version of generate_text: awaits the Gemini call without holding a thread
+        
+        Args:
+            prompt (str): The input prompt for text generation
+            system_prompt (str): Static instructions, kept as a reusable cached context
+            model_name (str): Model to use (defaults to the primary model)
+            timeout (float): Seconds before the call is abandoned (defaults to the SDK's)
+            **kwargs: Additional parameters for generation (temperature, max_tokens, etc.)
+            
+        Returns:
+            dict: Response containing the generated text and metadata
+        """
+        model_name = model_name or self.model_name
+        start = time.monotonic()
+        try:
+            model, contents = self._request(prompt, system_prompt, model_name)
+            response = await self._generate_content_async(
+                model,
+                contents,
+                timeout,
+                generation_config=build_generation_config(kwargs),
+                safety_settings=SAFETY_SETTINGS
+            )
+            return self._observe(model_name, start, self._generation_result(response), contents, response)
             
+        except asyncio.CancelledError:
+            # Perdedora d'un duplicat: com a mínim ha trigat fins ara (mostra censurada)
+            self.latency.get(model_name).observe_censored(time.monotonic() - start)
+            raise
         except Exception as e:
-            return {
+            return self._observe(model_name, start, {
                 'success': False,
                 'error': str(e),
                 'text': None
-            }
+            })
+    
+    @traced('llm.hedged')
+    def generate_text_hedged(self, prompt: str, deadline: float, system_prompt: str = None, **kwargs) -> dict:
+        """
+        generate_text amb deadline, petició duplicada i model de reserva.
+        
+        Envia la petició al model principal; si no ha respost quan supera el seu p95
+        recent, n'envia un duplicat, i quan el temps restant és el que sol trigar el
+        model de reserva, l'hi envia també. Retorna el primer resultat correcte. Cada
+        intent té com a timeout el temps que queda fins al deadline, de manera que cap
+        fil del pool no queda ocupat més enllà.
+        
+        Args:
+            prompt (str): The input prompt for text generation
+            deadline (float): Segons màxims per a tota la petició
+            system_prompt (str): Static instructions, kept as a reusable cached context
+            **kwargs: Additional parameters for generation
+            
+        Returns:
+            dict: Com generate_text, amb 'model', 'attempts' i 'hedged'. Si s'esgota el
+            deadline: success False i 'timeout' True.
+        """
+        start = time.monotonic()
+        deadline_at = start + deadline
+        plan = self._hedge_plan(start, deadline)
+        
+        def submit(model_name):
+            return self._hedge_executor.submit(
+                in_context(self.generate_text), prompt, system_prompt=system_prompt, model_name=model_name,
+                timeout=max(0.001, deadline_at - time.monotonic()), **kwargs
+            )
+        
+        pending = {submit(self.model_name): 'primary'}
+        attempts = ['primary']
+        last_error = None
+        
+        while True:
+            now = time.monotonic()
+            # Accions que toca llançar (o totes si ja no queda cap petició en curs)
+            while plan and (plan[0][0] <= now or not pending):
+                _, model_name, reason = plan.pop(0)
+                pending[submit(model_name)] = reason
+                attempts.append(reason)
+            
+            if not pending:
+                return {'success': False, 'error': last_error or 'No LLM request succeeded', 'text': None,
+                        'attempts': attempts}
+            
+            wake_at = min([deadline_at] + [action[0] for action in plan[:1]])
+            done, _ = wait(pending, timeout=max(0.0, wake_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                reason = pending.pop(future)
+                result = future.result()
+                if result['success']:
+                    return dict(result, attempts=attempts, hedged=reason != 'primary')
+                last_error = result.get('error')
+            
+            if time.monotonic() >= deadline_at:
+                # Les peticions en curs no es poden cancel·lar, però el seu timeout acaba ara
+                return {'success': False, 'error': f'LLM deadline of {deadline}s exceeded', 'text': None,
+                        'timeout': True, 'attempts': attempts}
+    
+    @traced('llm.hedged')
+    async def generate_text_hedged_async(self, prompt: str, deadline: float, system_prompt: str = None,
+                                         **kwargs) -> dict:
+        """
+        Async version of generate_text_hedged: les peticions perdedores es cancel·len
+        i el temps que portaven es registra com a mostra censurada del seu model
+        """
+        start = time.monotonic()
+        deadline_at = start + deadline
+        plan = self._hedge_plan(start, deadline)
+        
+        def submit(model_name):
+            return asyncio.ensure_future(self.generate_text_async(
+                prompt, system_prompt=system_prompt, model_name=model_name,
+                timeout=max(0.001, deadline_at - time.monotonic()), **kwargs
+            ))
+        
+        pending = {submit(self.model_name): 'primary'}
+        attempts = ['primary']
+        last_error = None
+        
+        try:
+            while True:
+                now = time.monotonic()
+                while plan and (plan[0][0] <= now or not pending):
+                    _, model_name, reason = plan.pop(0)
+                    pending[submit(model_name)] = reason
+                    attempts.append(reason)
+                
+                if not pending:
+                    return {'success': False, 'error': last_error or 'No LLM request succeeded', 'text': None,
+                            'attempts': attempts}
+                
+                wake_at = min([deadline_at] + [action[0] for action in plan[:1]])
+                done, _ = await asyncio.wait(
+                    pending, timeout=max(0.0, wake_at - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    reason = pending.pop(task)
+                    result = task.result()
+                    if result['success']:
+                        return dict(result, attempts=attempts, hedged=reason != 'primary')
+                    last_error = result.get('error')
+                
+                if time.monotonic() >= deadline_at:
+                    return {'success': False, 'error': f'LLM deadline of {deadline}s exceeded', 'text': None,
+                            'timeout': True, 'attempts': attempts}
+        finally:
+            for task in pending:
+                task.cancel()
     
-    def generate_text_stream(self, prompt: str, **kwargs):
+    def generate_text_stream(self, prompt: str, system_prompt: str = None, **kwargs):
         """
         Generate text using streaming for real-time responses
         
         Args:
             prompt (str): The input prompt for text generation
+            system_prompt (str): Static instructions, kept as a reusable cached context
             **kwargs: Additional parameters for generation
             
         Yields:
             str: Chunks of generated text
         """
         try:
-            generation_config = {
-                'temperature': kwargs.get('temperature', 0.7),
-                'top_p': kwargs.get('top_p', 0.95),
-                'top_k': kwargs.get('top_k', 40),
-                'max_output_tokens': kwargs.get('max_output_tokens', 2048),
-            }
-            
-            # Safety settings to avoid blocking content
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                },
-            ]
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings,
+            model, contents = self._request(prompt, system_prompt)
+            response = model.generate_content(
+                contents,
+                generation_config=build_generation_config(kwargs),
+                safety_settings=SAFETY_SETTINGS,
                 stream=True
             )
             
+            parts = []
             for chunk in response:
-                try:
-                    text_chunk = chunk.text
+                text_chunk = extract_text(chunk)
+                if text_chunk:
+                    parts.append(text_chunk)
                     yield text_chunk
-                except ValueError:
-                    # Handle cases where chunk.text fails (multipart or other issues)
-                    if chunk.candidates and chunk.candidates[0].content.parts:
-                        for part in chunk.candidates[0].content.parts:
-                            yield part.text
+            self._count_tokens(self.model_name, contents, ''.join(parts))
                     
         except Exception as e:
             yield f"Error: {str(e)}"
     
+    async def generate_text_stream_async(self, prompt: str, system_prompt: str = None, **kwargs):
+        """
+        Async version of generate_text_stream
+        
+        Args:
+            prompt (str): The input prompt for text generation
+            system_prompt (str): Static instructions, kept as a reusable cached context
+            **kwargs: Additional parameters for generation
+            
+        Yields:
+            str: Chunks of generated text
+        """
+        try:
+            model, contents = self._request(prompt, system_prompt)
+            response = await self._generate_content_async(
+                model,
+                contents,
+                generation_config=build_generation_config(kwargs),
+                safety_settings=SAFETY_SETTINGS,
+                stream=True
+            )
+            
+            parts = []
+            if ASYNC_CLIENT:
+                async for chunk in response:
+                    text_chunk = extract_text(chunk)
+                    if text_chunk:
+                        parts.append(text_chunk)
+                        yield text_chunk
+            else:
+                # Iterador síncron: cada fragment es llegeix en un fil
+                chunks = iter(response)
+                while True:
+                    chunk = await self._in_thread(next, chunks, None)
+                    if chunk is None:
+                        break
+                    text_chunk = extract_text(chunk)
+                    if text_chunk:
+                        parts.append(text_chunk)
+                        yield text_chunk
+            self._count_tokens(self.model_name, contents, ''.join(parts))
+                    
+        except Exception as e:
+            yield f"Error: {str(e)}"
+    
+    @traced('llm.chat')
     def chat(self, messages: list, **kwargs) -> dict:
         """
         Create a chat conversation with the model
@@ -202,43 +548,60 @@ class GeminiAPI:
             # Send the final message and get response
             final_message = messages[-1]['content'] if messages else ""
             
-            # Safety settings to avoid blocking content
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                },
-            ]
-            
             response = chat.send_message(
                 final_message,
-                safety_settings=safety_settings
+                safety_settings=SAFETY_SETTINGS
             )
             
-            # Robust text extraction
-            text_content = ""
-            try:
-                text_content = response.text
-            except ValueError:
-                # Handle cases where response.text fails (multipart or other issues)
-                if response.candidates and response.candidates[0].content.parts:
-                    text_content = "".join(part.text for part in response.candidates[0].content.parts)
+            text = extract_text(response)
+            self._count_tokens(self.model_name, '\n'.join(m['content'] for m in messages), text, response)
+            return {
+                'success': True,
+                'text': text,
+                'history': chat.history
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'text': None
+            }
+    
+    @traced('llm.chat')
+    async def chat_async(self, messages: list, **kwargs) -> dict:
+        """
+        Async version of chat
+        
+        Args:
+            messages (list): List of message dictionaries with 'role' and 'content'
+            **kwargs: Additional parameters for generation
+            
+        Returns:
+            dict: Response containing the chat reply
+        """
+        if not ASYNC_CLIENT:
+            return await self._in_thread(self.chat, messages, **kwargs)
+        
+        try:
+            chat = self.model.start_chat(history=[])
+            
+            for message in messages[:-1]:  # All but the last message
+                if message['role'] == 'user':
+                    await chat.send_message_async(message['content'])
+            
+            final_message = messages[-1]['content'] if messages else ""
+            
+            response = await chat.send_message_async(
+                final_message,
+                safety_settings=SAFETY_SETTINGS
+            )
             
+            text = extract_text(response)
+            self._count_tokens(self.model_name, '\n'.join(m['content'] for m in messages), text, response)
             return {
                 'success': True,
-                'text': text_content,
+                'text': text,
                 'history': chat.history
             }
             
@@ -1,11 +1,38 @@
-from flask import Flask, request, jsonify, Response, stream_with_context, send_from_directory
+from flask import Flask, g, request, jsonify, Response, stream_with_context, send_from_directory
 from flask_cors import CORS
+import hmac
+import logging
+import math
 import os
 import time
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from api import GeminiAPI
 import json
-from pathlib import Path
 import numpy as np
+from similarity import METHODS, similarity_grid, top_k_cells
+from heatmap_pyramid import PYRAMID_SIZES, level_for_zoom, viewport_window, window_rectangle
+from wire_format import (BINARY_MIMETYPE, DTYPES, decode_header, dequantize, encode_delta, encode_grid,
+                         encode_quantized, quantize, requested_format)
+from response_cache import PrecompressedResponse, ResponseCache
+from feature_store import LayerWatcher, build_feature_store, request_reload
+from snapshot import load_snapshot
+from vector_stream import VectorStreamParser, sse_event
+from prompt_cache import compact_prompt
+from local_vectorizer import vectorize
+from semantic_cache import SemanticCache
+from batch import RateLimiter, read_prompts_csv, run_batch
+from archetype_cache import ArchetypeHeatmaps
+from incremental_heatmap import HeatmapSessions, newest_seq
+from persona_catalog import PersonaCatalogReader
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, gauge_lines, render_histogram
+from tracing import end_request, in_context, span, start_request, traced
+from profiler import profile_call, profile_for
+from structured_log import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Configurar Flask para servir archivos estáticos de Vue
 app = Flask(__name__, 
@@ -22,11 +49,75 @@ CORS(app, resources={
     }
 })
 
+# Mètriques del procés, exportades a /metrics
+metrics = MetricsRegistry()
+http_requests = metrics.counter('http_requests_total', 'Peticions HTTP per ruta, mètode i estat',
+                                ('route', 'method', 'status'))
+http_request_duration = metrics.histogram('http_request_duration_seconds',
+                                          'Temps fins a la resposta (capçaleres) per ruta', ('route', 'method'))
+http_in_flight = metrics.gauge('http_requests_in_flight', 'Peticions en curs per ruta', ('route',))
+
+def record_request(route, method, status, seconds):
+    """Registra una petició acabada (també des del front-end ASGI)."""
+    http_requests.inc(route, method, str(status))
+    http_request_duration.observe(seconds, route, method)
+
+@app.before_request
+def start_request_metrics():
+    # Plantilla de la ruta (no el camí) per no crear una sèrie per URL
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    http_in_flight.inc(g.metrics_route)
+
+@app.after_request
+def finish_request_metrics(response):
+    if 'metrics_start' in g:
+        http_in_flight.dec(g.metrics_route)
+        record_request(g.metrics_route, request.method, response.status_code,
+                       time.perf_counter() - g.metrics_start)
+    return response
+
+@app.before_request
+def start_request_trace():
+    # Span arrel de la petició; continua la traça del client si envia traceparent
+    g.trace_span, g.trace_token = start_request(
+        f"{request.method} {g.metrics_route}", request.headers.get('traceparent'),
+        {'http.method': request.method, 'http.route': g.metrics_route}
+    )
+
+@app.after_request
+def trace_response_headers(response):
+    if 'trace_span' in g:
+        g.trace_status = response.status_code
+        response.headers['traceparent'] = g.trace_span.traceparent()
+        response.headers['X-Trace-Id'] = g.trace_span.trace_id
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    # Després del cos: en les respostes en streaming el span inclou tot l'stream
+    if 'trace_span' in g:
+        end_request(g.trace_span, g.trace_token, g.get('trace_status', 500 if error else None))
+        g.pop('trace_span')
+
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Expose-Headers', 'traceparent,X-Trace-Id')
+    return response
+
+def to_flask_response(body, status=200, headers=None):
+    """
+    Converteix el resultat (body, status, headers) de la lògica comuna dels endpoints
+    en una resposta Flask. body és un dict (JSON) o bytes.
+    """
+    if isinstance(body, (bytes, bytearray)):
+        return Response(body, status=status, headers=headers)
+    response = jsonify(body)
+    response.status_code = status
+    response.headers.extend(headers or {})
     return response
 
 # System prompt for Real Estate Recommendation Engine
@@ -135,777 +226,736 @@ PERFIL DE L'USUARI A ANALITZAR:
 
 OUTPUT:"""
 
+# El prompt es divideix en la part estàtica (prompt de sistema, compactada i reutilitzada
+# com a context a la cache, vegeu prompt_cache.py) i la part que canvia per petició
+USER_PROMPT_MARKER = "PERFIL DE L'USUARI A ANALITZAR:"
+SYSTEM_PROMPT = compact_prompt(SYSTEM_PROMPT_TEMPLATE[:SYSTEM_PROMPT_TEMPLATE.index(USER_PROMPT_MARKER)])
+USER_PROMPT_TEMPLATE = SYSTEM_PROMPT_TEMPLATE[SYSTEM_PROMPT_TEMPLATE.index(USER_PROMPT_MARKER):]
+
 # Initialize Gemini API
 try:
     gemini_api = GeminiAPI()
-    print("✓ Gemini API initialized successfully")
+    logger.info("Gemini API initialized successfully", extra={'model': gemini_api.model_name})
 except Exception as e:
-    print(f"✗ Error initializing Gemini API: {e}")
+    logger.error("Error initializing Gemini API: %s", e)
     gemini_api = None
 
 # Variable global para almacenar el vector de preferencias generado por la LLM
 user_preference_vector = []
 
-@app.route('/api/generate', methods=['POST'])
-def generate():
+# Vectoritzador local (local_vectorizer.py): confiança a partir de la qual es respon
+# sense LLM, i temps màxim d'espera de la LLM abans de respondre amb el vector local
+LOCAL_VECTOR_MIN_CONFIDENCE = float(os.getenv('LOCAL_VECTOR_MIN_CONFIDENCE', '0.8'))
+LLM_LATENCY_BUDGET = float(os.getenv('LLM_LATENCY_BUDGET', '10'))
+# Consultar igualment la LLM en segon pla quan s'ha respost amb el vector local
+LLM_BACKGROUND_REFINE = os.getenv('LLM_BACKGROUND_REFINE', '0') == '1'
+
+# Cache semàntica descripció -> vector (semantic_cache.py): llindar de similitud
+# (mesurat amb python -m benchmarks.semantic_cache_pairs), entrades màximes
+# (0 = desactivada), política d'expulsió i caducitat en segons
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92')),
+    max_entries=int(os.getenv('SEMANTIC_CACHE_SIZE', '10000')),
+    eviction=os.getenv('SEMANTIC_CACHE_EVICTION', 'lru'),
+    ttl=float(os.getenv('SEMANTIC_CACHE_TTL', '0'))
+)
+
+# Fils per a les consultes a la LLM en segon pla
+llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_WORKERS', '8')), thread_name_prefix='llm')
+
+def generate_request_error(data):
     """
-    Endpoint to process user prompts and return AI-generated output using Google's Gemini API.
+    Valida el cos de /api/generate i /api/generate/stream.
+    
+    Retorna (body, status, headers) amb l'error, o None si la petició és vàlida.
     """
-    global user_preference_vector
+    # Sense Gemini es respon amb el vector local (vegeu generate_plan)
+    if not data or 'prompt' not in data:
+        return {'error': 'No prompt provided'}, 400, {}
     
-    try:
-        # Check if API is initialized
-        if gemini_api is None:
-            return jsonify({
-                'error': 'Gemini API not initialized. Please check your GOOGLE_API_KEY in .env file.'
-            }), 500
-        
-        data = request.get_json()
-        
-        if not data or 'prompt' not in data:
-            return jsonify({'error': 'No prompt provided'}), 400
-        
-        user_prompt = data['prompt']
-        
-        if not user_prompt.strip():
-            return jsonify({'error': 'Prompt cannot be empty'}), 400
-        
-        # Get optional parameters
-        temperature = data.get('temperature', 0.1)  # Lower temperature for more deterministic output
-        max_tokens = data.get('max_tokens', 2048)
-        
-        # Construct the full prompt with the system instructions
-        full_prompt = SYSTEM_PROMPT_TEMPLATE.replace("{TEXT_INPUT_USUARI}", user_prompt)
-        
-        # Generate response using Gemini API
-        result = gemini_api.generate_text(
-            prompt=full_prompt,
-            temperature=temperature,
-            max_output_tokens=max_tokens
-        )
-        
-        if not result['success']:
-            error_msg = result.get('error', 'Unknown error')
-            print(f"✗ API Error: {error_msg}")
-            return jsonify({
-                'error': f"API Error: {error_msg}"
-            }), 500
-        
-        # Parsear el vector de salida
-        try:
-            llm_output = result['text'].strip()
-            # Intentar parsear como JSON array
-            user_preference_vector = json.loads(llm_output)
-            print(f"✓ Vector de preferences guardado: {user_preference_vector}")
-        except json.JSONDecodeError as e:
-            print(f"⚠ Error parseando vector JSON: {e}")
-            print(f"⚠ Output recibido: {llm_output}")
-            user_preference_vector = []
-        
-        return jsonify({
-            'output': result['text'],
-            'vector': user_preference_vector,
-            'timestamp': time.time(),
-            'model': 'gemini-2.5-flash'
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    if not data['prompt'].strip():
+        return {'error': 'Prompt cannot be empty'}, 400, {}
+    
+    if data.get('mode', 'auto') not in ('auto', 'llm', 'local'):
+        return {'error': "mode must be 'auto', 'llm' or 'local'"}, 400, {}
+    
+    return None
 
-@app.route('/api/generate/stream', methods=['POST'])
-def generate_stream():
+@traced('generate.cache_lookup')
+def cached_result_response(data, remember=True):
     """
-    Endpoint for streaming AI-generated output (Server-Sent Events).
+    Busca a la cache semàntica un vector de la LLM per a una descripció semblant.
+    El mode 'llm' no hi busca. Amb remember=False no es desa com a vector de l'usuari.
+    
+    Retorna (body, status, headers), o None si no hi ha cap encert.
     """
-    try:
-        if gemini_api is None:
-            return jsonify({
-                'error': 'Gemini API not initialized. Please check your GOOGLE_API_KEY in .env file.'
-            }), 500
-        
-        data = request.get_json()
-        
-        if not data or 'prompt' not in data:
-            return jsonify({'error': 'No prompt provided'}), 400
-        
-        user_prompt = data['prompt']
-        
-        if not user_prompt.strip():
-            return jsonify({'error': 'Prompt cannot be empty'}), 400
-        
-        def generate_response():
-            for chunk in gemini_api.generate_text_stream(prompt=user_prompt):
-                yield f"data: {chunk}\n\n"
-        
-        return Response(
-            stream_with_context(generate_response()),
-            mimetype='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'X-Accel-Buffering': 'no'
-            }
-        )
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    global user_preference_vector
+    
+    if data.get('mode', 'auto') == 'llm':
+        return None
+    hit = semantic_cache.lookup(data['prompt'])
+    if hit is None:
+        return None
+    
+    if remember:
+        user_preference_vector = hit['vector']
+        logger.info("Vector de la cache semàntica", extra={'vector': user_preference_vector,
+                                                          'similarity': hit['similarity']})
+    
+    return {
+        'output': json.dumps(hit['vector']),
+        'vector': hit['vector'],
+        'timestamp': time.time(),
+        'model': hit.get('model', 'gemini-2.5-flash'),
+        'source': 'cache',
+        'similarity': hit['similarity'],
+        'cached_prompt': hit['prompt']
+    }, 200, {}
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
+@traced('generate.local_vectorize')
+def generate_plan(data):
     """
-    Endpoint for chat-based interactions with conversation history.
+    Calcula el vector local i decideix si cal la LLM.
+    
+    El cos pot incloure 'mode': 'auto' (per defecte: LLM només si la confiança local
+    és baixa), 'llm' (sempre la LLM, amb el vector local com a reserva) o 'local'.
+    
+    Retorna (local, reason): si reason no és None es respon amb el vector local.
     """
-    try:
-        if gemini_api is None:
-            return jsonify({
-                'error': 'Gemini API not initialized. Please check your GOOGLE_API_KEY in .env file.'
-            }), 500
-        
-        data = request.get_json()
-        
-        if not data or 'messages' not in data:
-            return jsonify({'error': 'No messages provided'}), 400
-        
-        messages = data['messages']
-        
-        if not isinstance(messages, list) or len(messages) == 0:
-            return jsonify({'error': 'Messages must be a non-empty array'}), 400
-        
-        # Generate chat response
-        result = gemini_api.chat(messages=messages)
-        
-        if not result['success']:
-            return jsonify({
-                'error': f"API Error: {result.get('error', 'Unknown error')}"
-            }), 500
-        
-        return jsonify({
-            'output': result['text'],
-            'timestamp': time.time(),
-            'model': 'gemini-1.5-flash'
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    local = vectorize(data['prompt'])
+    mode = data.get('mode', 'auto')
+    
+    if gemini_api is None:
+        return local, 'llm_unavailable'
+    if mode == 'local':
+        return local, 'requested'
+    if mode == 'auto' and local.confidence >= LOCAL_VECTOR_MIN_CONFIDENCE:
+        return local, 'confident'
+    return local, None
 
-@app.route('/api/health', methods=['GET'])
-def health():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy'}), 200
+def local_result_response(local, reason, remember=True):
+    """
+    Resposta de /api/generate amb el vector del vectoritzador local.
+    
+    Retorna (body, status, headers).
+    """
+    global user_preference_vector
+    
+    if remember:
+        user_preference_vector = local.vector
+        logger.info("Vector local", extra={'vector': user_preference_vector, 'reason': reason,
+                                           'confidence': local.confidence, 'elapsed_ms': local.elapsed_ms})
+    
+    return {
+        'output': json.dumps(local.vector),
+        'vector': local.vector,
+        'timestamp': time.time(),
+        'model': 'local-rules',
+        'source': 'local',
+        'confidence': local.confidence,
+        'reason': reason
+    }, 200, {}
 
-@app.route('/api/models', methods=['GET'])
-def list_models():
-    """List available Gemini models"""
+def refine_in_background(user_prompt, local):
+    """
+    Consulta la LLM després d'haver respost amb el vector local i registra la
+    diferència (per ajustar les regles del vectoritzador local).
+    """
+    result = gemini_api.generate_text(
+        prompt=build_vector_prompt(user_prompt),
+        system_prompt=SYSTEM_PROMPT,
+        temperature=0.1
+    )
     try:
-        from api import GeminiAPI
-        models = GeminiAPI.list_available_models()
-        return jsonify({'models': models}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
+        vector = json.loads(result['text'].strip())
+    except (TypeError, AttributeError, json.JSONDecodeError):
+        return None
+    if validate_preference_vector(vector):
+        return None
+    semantic_cache.insert(user_prompt, vector, model='gemini-2.5-flash')
+    distance = sum(abs(a - b) for a, b in zip(vector, local.vector))
+    logger.info("LLM en segon pla: diferència L1 amb el vector local %.2f", distance,
+                extra={'archetypes': local.archetypes})
+    return vector
 
-# Crear matriz 20x20 donde cada celda contiene un vector [income, crimes, connectivity, noise, walkability, accessibility, wellbeing, ...]
-# Formato de cada celda: [income, crimes, connectivity, noise, walkability, accessibility, wellbeing, 0, 0, 0, community_vibe]
-matrix_LA_alldata_20x20 = [[[0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0] for _ in range(20)] for _ in range(20)]
+@traced('generate.build_prompt')
+def build_vector_prompt(user_prompt):
+    """Part del prompt que viatja per petició (el prompt de sistema va a SYSTEM_PROMPT)"""
+    return USER_PROMPT_TEMPLATE.replace("{TEXT_INPUT_USUARI}", user_prompt)
 
-def load_crime_data():
+@traced('generate.parse_output')
+def generate_result_response(result, local=None, user_prompt=None, remember=True):
     """
-    Carga el JSON de criminalidad y llena la matriz 20x20.
-    Cada celda contendrà una lista on l'índex 0 està buit i l'índex 1 
-    conté el valor de criminalitat del JSON.
+    Processa el resultat de la LLM per a /api/generate: parseja el vector i el desa
+    (també a la cache semàntica si es passa user_prompt).
+    Si la LLM falla o no retorna un vector vàlid i hi ha vector local, es respon amb aquest.
+    Amb remember=False no es desa com a vector de l'usuari (p. ex. per a /api/generate/batch).
+    
+    Retorna (body, status, headers).
     """
-    json_path = Path(__file__).parent / 'city_stats' / 'jsons' / 'crime_matrix_20x20_20251122T194040Z.json'
+    global user_preference_vector
     
-    try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        crime_data = data[0]
-        crime_matrix = crime_data['CrimeMatrix']
-        
-        # Verificar dimensions i ajustar si és necessari
-        rows = len(crime_matrix)
-        cols = len(crime_matrix[0]) if rows > 0 else 0
-        
-        # Llenar la matriz 20x20 unificada - índex 1 = crimes
-        for i in range(20):
-            for j in range(20):
-                # Ajustar índexs si les dimensions no coincideixen
-                row_idx = min(i, rows - 1) if rows > 0 else 0
-                col_idx = min(j, cols - 1) if cols > 0 else 0
-                
-                # Índex 1: valor de criminalitat
-                crime_value = crime_matrix[row_idx][col_idx] if rows > 0 and cols > 0 else 0.0
-                matrix_LA_alldata_20x20[i][j][1] = crime_value
-        
+    if not result['success']:
+        error_msg = result.get('error', 'Unknown error')
+        logger.error("API Error: %s", error_msg, extra={'timeout': bool(result.get('timeout'))})
+        if local is not None:
+            return local_result_response(local, 'llm_timeout' if result.get('timeout') else 'llm_error', remember)
         return {
-            'success': True,
-            'origin': {
-                'north': crime_data['Norigin'],
-                'west': crime_data['WOrigin']
-            },
-            'steps': {
-                'vertical': crime_data['VerticalStep'],
-                'horizontal': crime_data['HorizontalStep']
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            }
-        }
+            'error': f"API Error: {error_msg}"
+        }, 500, {}
     
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    except Exception as e:
-        print(f"Error al cargar datos de criminalidad: {e}")
-        return {'success': False, 'error': str(e)}
+    # Parsear el vector de salida
+    try:
+        llm_output = result['text'].strip()
+        # Intentar parsear como JSON array
+        vector = json.loads(llm_output)
+    except json.JSONDecodeError as e:
+        logger.warning("Error parseando vector JSON: %s", e, extra={'output': llm_output})
+        vector = []
+    
+    if validate_preference_vector(vector):
+        if local is not None:
+            return local_result_response(local, 'llm_invalid_output', remember)
+    elif user_prompt is not None:
+        semantic_cache.insert(user_prompt, vector, model=result.get('model', 'gemini-2.5-flash'))
+    
+    if remember:
+        user_preference_vector = vector
+        logger.info("Vector de preferences guardado", extra={'vector': user_preference_vector, 'source': 'llm'})
+    
+    return {
+        'output': result['text'],
+        'vector': vector,
+        'timestamp': time.time(),
+        'model': result.get('model', 'gemini-2.5-flash'),
+        'source': 'llm',
+        'attempts': result.get('attempts', ['primary'])
+    }, 200, {}
+
+def request_deadline(data):
+    """Deadline de la crida a la LLM: camp 'deadline' del cos (segons) o LLM_LATENCY_BUDGET."""
+    try:
+        deadline = float(data.get('deadline', LLM_LATENCY_BUDGET))
+    except (TypeError, ValueError):
+        return LLM_LATENCY_BUDGET
+    return min(max(deadline, 0.1), LLM_LATENCY_BUDGET)
 
-def load_connectivity_data():
+def vectorize_prompt(data, remember=True, before_llm=None):
     """
-    Carga el JSON de conectivitat i llena una segona matriz 20x20.
-    Cada celda contendrà una lista on l'índex 0 està buit i l'índex 1 
-    conté el valor de conectivitat del JSON.
+    Cadena completa de /api/generate: cache semàntica, vectoritzador local i,
+    si cal, la LLM amb deadline i duplicats.
+    
+    Args:
+        data: Cos de la petició ('prompt' i opcionalment 'mode', 'deadline'...)
+        remember: Desar el resultat com a vector de l'usuari (global)
+        before_llm: Funció cridada just abans de la LLM (p. ex. un limitador de ritme)
+    
+    Retorna (body, status, headers).
     """
-    json_path = Path(__file__).parent / 'city_stats' / 'jsons' / 'connectivity_matrix_20x20_20251122T214807Z.json'
+    cached = cached_result_response(data, remember)
+    if cached:
+        return cached
     
-    try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        connectivity_data = data[0]
-        connectivity_matrix = connectivity_data['ConnectivityMatrix']
-        
-        # Verificar dimensions
-        rows = len(connectivity_matrix)
-        cols = len(connectivity_matrix[0]) if rows > 0 else 0
-        
-        # Llenar la matriz unificada - índex 2 = connectivity
-        for i in range(20):
-            for j in range(20):
-                row_idx = min(i, rows - 1) if rows > 0 else 0
-                col_idx = min(j, cols - 1) if cols > 0 else 0
-                
-                # Índex 2: valor de conectivitat
-                connectivity_value = connectivity_matrix[row_idx][col_idx] if rows > 0 and cols > 0 else 0.0
-                matrix_LA_alldata_20x20[i][j][2] = connectivity_value
-        
-        return {
-            'success': True,
-            'origin': {
-                'north': connectivity_data['Norigin'],
-                'west': connectivity_data['WOrigin']
-            },
-            'steps': {
-                'vertical': connectivity_data['VerticalStep'],
-                'horizontal': connectivity_data['HorizontalStep']
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            },
-            'max_speed': connectivity_data.get('MaxSpeed', 1.0)
-        }
+    local, reason = generate_plan(data)
+    if reason:
+        if reason == 'confident' and LLM_BACKGROUND_REFINE:
+            llm_executor.submit(in_context(refine_in_background), data['prompt'], local)
+        return local_result_response(local, reason, remember)
     
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    except Exception as e:
-        print(f"Error al cargar datos de conectivitat: {e}")
-        return {'success': False, 'error': str(e)}
+    if before_llm is not None:
+        before_llm()
+    
+    # Generate response using Gemini API
+    # Lower temperature for more deterministic output
+    result = gemini_api.generate_text_hedged(
+        prompt=build_vector_prompt(data['prompt']),
+        deadline=request_deadline(data),
+        system_prompt=SYSTEM_PROMPT,
+        temperature=data.get('temperature', 0.1),
+        max_output_tokens=data.get('max_tokens', 2048)
+    )
+    
+    return generate_result_response(result, local, data['prompt'], remember)
 
-def load_income_data():
-    """
-    Carga el JSON de income i llena una tercera matriz 20x20.
-    Cada celda contendrà una lista on l'índex 0 està buit i l'índex 1 
-    conté el valor de income del JSON.
+@traced('generate.heatmap')
+def with_generate_heatmap(response, data):
     """
-    json_path = Path(__file__).parent / 'city_stats' / 'jsons' / 'income_matrix_20x20.json'
+    Afegeix a una resposta correcta de /api/generate l'arquetip del vector i, si el cos
+    inclou 'heatmap' (true o paràmetres de /api/heatmap), el mapa de calor. Per als
+    vectors d'arquetip el mapa ja està precalculat.
     
-    try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        income_data = data[0]
-        income_matrix = income_data['matrix']
-        
-        # Verificar dimensions
-        rows = len(income_matrix)
-        cols = len(income_matrix[0]) if rows > 0 else 0
-        
-        # Llenar la matriz unificada - índex 0 = income
-        for i in range(20):
-            for j in range(20):
-                row_idx = min(i, rows - 1) if rows > 0 else 0
-                col_idx = min(j, cols - 1) if cols > 0 else 0
-                
-                # Índex 0: valor de income
-                income_value = income_matrix[row_idx][col_idx] if rows > 0 and cols > 0 else 0.0
-                matrix_LA_alldata_20x20[i][j][0] = income_value
-        
-        return {
-            'success': True,
-            'origin': {
-                'north': income_data['Norigin'],
-                'west': income_data['WOrigin']
-            },
-            'steps': {
-                'vertical': income_data['VerticalStep'],
-                'horizontal': income_data['HorizontalStep']
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            }
-        }
+    Retorna (body, status, headers).
+    """
+    body, status, headers = response
+    if status != 200 or validate_preference_vector(body.get('vector')):
+        return response
     
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    except Exception as e:
-        print(f"Error al cargar datos de income: {e}")
-        return {'success': False, 'error': str(e)}
+    body['archetype'] = match_archetype(body['vector'])
+    heatmap_args = stream_heatmap_args(data)
+    if heatmap_args is not None:
+        args = dict(heatmap_args, vector=','.join(str(val) for val in body['vector']), format='json')
+        heatmap, heatmap_status, _ = heatmap_request(args)
+        body['heatmap'] = heatmap if heatmap_status == 200 else None
+    return body, status, headers
 
-def load_noise_data():
+@app.route('/api/generate', methods=['POST'])
+def generate():
     """
-    Carga el JSON de noise i llena el índex 3 de la matriz unificada.
-    Cada celda contendrà el valor de noise en el índex 3 del vector.
+    Endpoint to process user prompts and return AI-generated output using Google's Gemini API.
     """
-    json_path = Path(__file__).parent / 'city_stats' / 'jsons' / 'noise_matrix_20x20_20251122T233126Z.json'
-    
     try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        noise_data = data[0]
-        noise_matrix = noise_data['NoiseMatrix']
+        data = request.get_json()
         
-        # Verificar dimensions
-        rows = len(noise_matrix)
-        cols = len(noise_matrix[0]) if rows > 0 else 0
+        error = generate_request_error(data)
+        if error:
+            return to_flask_response(*error)
         
-        # Llenar la matriz unificada - índex 3 = noise
-        for i in range(20):
-            for j in range(20):
-                row_idx = min(i, rows - 1) if rows > 0 else 0
-                col_idx = min(j, cols - 1) if cols > 0 else 0
-                
-                # Índex 3: valor de noise
-                noise_value = noise_matrix[row_idx][col_idx] if rows > 0 and cols > 0 else 0.0
-                matrix_LA_alldata_20x20[i][j][3] = noise_value
+        return to_flask_response(*with_generate_heatmap(vectorize_prompt(data), data))
         
-        return {
-            'success': True,
-            'origin': {
-                'north': noise_data['Norigin'],
-                'west': noise_data['WOrigin']
-            },
-            'steps': {
-                'vertical': noise_data['VerticalStep'],
-                'horizontal': noise_data['HorizontalStep']
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            }
-        }
-    
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
     except Exception as e:
-        print(f"Error al cargar datos de noise: {e}")
-        return {'success': False, 'error': str(e)}
+        return jsonify({'error': str(e)}), 500
+
+def stream_heatmap_args(data):
+    """
+    Paràmetres del mapa de calor opcional de /api/generate i /api/generate/stream.
+    
+    El camp 'heatmap' del cos pot ser true (mapa 20x20 amb cosine) o un objecte amb
+    els mateixos paràmetres que /api/heatmap (method, zoom, north, south...).
+    Retorna None si no se n'ha demanat cap.
+    """
+    options = data.get('heatmap')
+    if not options:
+        return None
+    if not isinstance(options, dict):
+        options = {}
+    return {key: str(value) for key, value in options.items() if key not in ('vector', 'format')}
 
-def load_accessibility_data():
+def stream_vector_events(vector, heatmap_args=None):
     """
-    Carga el JSON de accessibility i llena el índex 5 de la matriz unificada.
-    Cada celda contendrà el valor de accessibility en el índex 5 del vector.
+    Esdeveniments SSE quan el parser completa el vector: 'vector' i, si s'ha
+    demanat, 'heatmap' calculat amb aquest mateix vector.
     """
-    # Buscar el archivo más reciente de accessibility
-    json_dir = Path(__file__).parent / 'city_stats' / 'jsons'
-    accessibility_files = list(json_dir.glob('accessibility_matrix_20x20_*.json'))
+    global user_preference_vector
     
-    if not accessibility_files:
-        print("Error: No se encontró ningún archivo de accessibility")
-        return {'success': False, 'error': 'Archivo no encontrado'}
+    error = validate_preference_vector(vector)
+    if error:
+        logger.warning("Vector invàlid al stream", extra={'vector': vector})
+        return [sse_event('error', {'error': error})]
     
-    # Usar el archivo más reciente
-    json_path = sorted(accessibility_files)[-1]
-    print(f"Cargando accessibility desde: {json_path}")
+    user_preference_vector = vector
+    logger.info("Vector de preferences guardado", extra={'vector': user_preference_vector, 'source': 'stream'})
+    events = [sse_event('vector', {'vector': vector})]
     
-    try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        accessibility_data = data[0]
-        accessibility_matrix = accessibility_data['AccessibilityMatrix']
-        
-        # Verificar dimensions
-        rows = len(accessibility_matrix)
-        cols = len(accessibility_matrix[0]) if rows > 0 else 0
-        
-        # Llenar la matriz unificada - índex 5 = accessibility
-        for i in range(20):
-            for j in range(20):
-                if i < rows and j < cols:
-                    matrix_LA_alldata_20x20[i][j][5] = accessibility_matrix[i][j]
-        
-        return {
-            'success': True,
-            'origin': {
-                'north': accessibility_data['Norigin'],
-                'west': accessibility_data['WOrigin']
-            },
-            'steps': {
-                'vertical': accessibility_data['VerticalStep'],
-                'horizontal': accessibility_data['HorizontalStep']
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            },
-            'max_score': accessibility_data.get('MaxScore', 1.0)
-        }
+    if heatmap_args is not None:
+        args = dict(heatmap_args, vector=','.join(str(val) for val in vector), format='json')
+        body, status, _ = heatmap_request(args)
+        events.append(sse_event('heatmap' if status == 200 else 'error', body))
     
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    except Exception as e:
-        print(f"Error al cargar datos de accessibility: {e}")
-        return {'success': False, 'error': str(e)}
+    return events
+
+def stream_result_events(body, heatmap_args=None):
+    """Esdeveniments SSE per a un resultat complet que no ve del stream de la LLM (local o cache)."""
+    events = stream_vector_events(body['vector'], heatmap_args)
+    events.append(sse_event('done', body))
+    return events
 
-def load_wellbeing_data():
+def stream_local_events(local, reason, heatmap_args=None):
+    """Esdeveniments SSE quan es respon amb el vector local en lloc del stream de la LLM."""
+    body, _, _ = local_result_response(local, reason)
+    return stream_result_events(body, heatmap_args)
+
+def stream_end_events(parser, local=None, heatmap_args=None, user_prompt=None):
     """
-    Carga el JSON de wellbeing i llena el índex 6 de la matriz unificada.
-    Cada celda contendrà el valor de wellbeing en el índex 6 del vector.
+    Esdeveniment final del stream amb la sortida completa (com /api/generate).
+    Si la LLM no ha donat cap vector vàlid i hi ha vector local, s'envia aquest.
     """
-    # Buscar el archivo más reciente de wellbeing
-    json_dir = Path(__file__).parent / 'city_stats' / 'jsons'
-    wellbeing_files = list(json_dir.glob('wellbeing_matrix_20x20_*.json'))
+    global user_preference_vector
     
-    if not wellbeing_files:
-        print("Error: No se encontró ningún archivo de wellbeing")
-        return {'success': False, 'error': 'Archivo no encontrado'}
+    if parser.done and user_prompt is not None and not validate_preference_vector(parser.vector):
+        semantic_cache.insert(user_prompt, parser.vector, model='gemini-2.5-flash')
     
-    # Usar el archivo más reciente
-    json_path = sorted(wellbeing_files)[-1]
-    print(f"Cargando wellbeing desde: {json_path}")
+    if not parser.done and local is not None:
+        logger.warning("No s'ha trobat cap vector al stream", extra={'output': parser.text})
+        return stream_local_events(local, 'llm_invalid_output', heatmap_args)
     
-    try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        wellbeing_data = data[0]
-        wellbeing_matrix = wellbeing_data['WellbeingMatrix']
-        
-        # Verificar dimensions
-        rows = len(wellbeing_matrix)
-        cols = len(wellbeing_matrix[0]) if rows > 0 else 0
-        
-        # Llenar la matriz unificada - índex 6 = wellbeing
-        for i in range(20):
-            for j in range(20):
-                if i < rows and j < cols:
-                    matrix_LA_alldata_20x20[i][j][6] = wellbeing_matrix[i][j]
-        
-        return {
-            'success': True,
-            'origin': {
-                'north': wellbeing_data['Norigin'],
-                'west': wellbeing_data['WOrigin']
-            },
-            'steps': {
-                'vertical': wellbeing_data['VerticalStep'],
-                'horizontal': wellbeing_data['HorizontalStep']
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            },
-            'max_score': wellbeing_data.get('MaxScore', 1.0)
-        }
+    events = []
+    if not parser.done:
+        logger.warning("No s'ha trobat cap vector al stream", extra={'output': parser.text})
+        user_preference_vector = []
+        events.append(sse_event('error', {'error': 'No s\'ha rebut un vector vàlid de la IA'}))
     
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    except Exception as e:
-        print(f"Error al cargar datos de wellbeing: {e}")
-        return {'success': False, 'error': str(e)}
+    events.append(sse_event('done', {
+        'output': parser.text,
+        'vector': parser.vector or [],
+        'timestamp': time.time(),
+        'model': 'gemini-2.5-flash',
+        'source': 'llm'
+    }))
+    return events
 
-def load_mobility_data():
-    """
-    Carga el JSON de mobility i llena el índex 7 de la matriz unificada.
-    Cada celda contendrà el valor de mobility en el índex 7 del vector.
+@app.route('/api/generate/stream', methods=['POST'])
+def generate_stream():
     """
-    # Buscar el archivo mobility
-    json_dir = Path(__file__).parent / 'city_stats' / 'jsons'
-    mobility_files = list(json_dir.glob('mobility*.json'))
-    
-    if not mobility_files:
-        return {'success': False, 'error': 'Archivo mobility no encontrado'}
+    Endpoint for streaming AI-generated output (Server-Sent Events).
     
-    # Usar el archivo más reciente
-    json_path = sorted(mobility_files)[-1]
-    print(f"Cargando mobility desde: {json_path}")
+    Aplica el mateix prompt de sistema que /api/generate i envia:
+        event: token    -> {"text": fragment} per cada fragment de la LLM
+        event: vector   -> {"vector": [...]} tan bon punt es tanca el ']'
+        event: heatmap  -> payload de /api/heatmap (només si el cos inclou 'heatmap')
+        event: error    -> {"error": ...} si el vector no és vàlid
+        event: done     -> {"output", "vector", "timestamp", "model", "source"}
     
+    Sense Gemini, amb 'mode': 'local' o si el vector local té prou confiança (com a
+    /api/generate) s'envien directament 'vector' i 'done' amb el vector local; si la
+    LLM no dóna cap vector vàlid, el local el substitueix al final.
+    """
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = request.get_json()
         
-        mobility_matrix = data[0]['MobilityMatrix']
-        vertical_step = data[0]['VerticalStep']
-        horizontal_step = data[0]['HorizontalStep']
+        error = generate_request_error(data)
+        if error:
+            return to_flask_response(*error)
+        
+        prompt = build_vector_prompt(data['prompt'])
+        heatmap_args = stream_heatmap_args(data)
+        
+        cached = cached_result_response(data)
+        if cached:
+            return Response(
+                stream_result_events(cached[0], heatmap_args),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache'}
+            )
+        
+        local, reason = generate_plan(data)
+        if reason:
+            # Mateix camí ràpid que /api/generate (també per a 'confident')
+            if reason == 'confident' and LLM_BACKGROUND_REFINE:
+                llm_executor.submit(in_context(refine_in_background), data['prompt'], local)
+            return Response(
+                stream_local_events(local, reason, heatmap_args),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache'}
+            )
         
-        # Llenar el índex 7 de la matriz unificada
-        for i in range(20):
-            for j in range(20):
-                matrix_LA_alldata_20x20[i][j][7] = mobility_matrix[i][j]
+        def generate_response():
+            parser = VectorStreamParser()
+            for chunk in gemini_api.generate_text_stream(
+                prompt=prompt,
+                system_prompt=SYSTEM_PROMPT,
+                temperature=data.get('temperature', 0.1),
+                max_output_tokens=data.get('max_tokens', 2048)
+            ):
+                yield sse_event('token', {'text': chunk})
+                vector = parser.feed(chunk)
+                if vector is not None:
+                    yield from stream_vector_events(vector, heatmap_args)
+            yield from stream_end_events(parser, local, heatmap_args, data['prompt'])
+        
+        return Response(
+            stream_with_context(generate_response()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
         
-        print("✓ Datos de mobility cargados correctamente en índex 7")
-        return {
-            'success': True,
-            'origin': f"N:{data[0]['Norigin']}, W:{data[0]['WOrigin']}",
-            'steps': f"Vertical:{vertical_step}, Horizontal:{horizontal_step}",
-            'dimensions': '20x20',
-            'max_score': data[0].get('MaxScore', 'N/A')
-        }
-    
-    except FileNotFoundError:
-        return {'success': False, 'error': 'Archivo no encontrado'}
     except Exception as e:
-        return {'success': False, 'error': str(e)}
+        return jsonify({'error': str(e)}), 500
+
+# /api/generate/batch: màxim de descripcions per petició, descripcions en paral·lel i
+# crides a la LLM per segon (la cache semàntica i el vectoritzador local no en consumeixen)
+BATCH_MAX_PROMPTS = int(os.getenv('BATCH_MAX_PROMPTS', '5000'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '16'))
+BATCH_LLM_RATE = float(os.getenv('BATCH_LLM_RATE', '10'))
 
-def load_education_data():
+def top_cells(vector, method='cosine', k=5):
     """
-    Carga el JSON de education i llena el índex 8 de la matriz unificada.
-    Cada celda contendrà el valor de education en el índex 8 del vector.
+    Les k cel·les de la graella base (20x20) més afins a un vector, amb el centre
+    geogràfic de cada cel·la.
+    """
+    store = feature_store
+    scores = similarity_grid(vector, store.features, method)
+    rows, cols, values = top_k_cells(scores, k)
+    size = store.features.shape[0]
+    cells = []
+    for row, col, value in zip(rows.tolist(), cols.tolist(), values.tolist()):
+        bounds = window_rectangle(size, LA_RECTANGLE, (row, row + 1, col, col + 1))
+        cells.append({
+            'row': row,
+            'col': col,
+            'score': round(value, 4),
+            'lat': round((bounds['north'] + bounds['south']) / 2, 6),
+            'lon': round((bounds['west'] + bounds['east']) / 2, 6)
+        })
+    return cells
+
+def batch_ndjson_lines(prompts, options):
     """
-    # Buscar el archivo education
-    json_dir = Path(__file__).parent / 'city_stats' / 'jsons'
-    education_files = list(json_dir.glob('education_matrix_*.json'))
+    Vectoritza moltes descripcions i genera línies NDJSON a mesura que acaben.
+    
+    Les descripcions repetides es calculen una sola vegada (vegeu batch.py). Cada línia
+    és {"index", "prompt", "vector", "source", ...} (més "top_k" si options['top_k'] > 0)
+    i l'última és un resum amb "done": true.
     
-    if not education_files:
-        return {'success': False, 'error': 'Archivo education no encontrado'}
+    Args:
+        prompts: Llista de descripcions
+        options: mode, deadline, top_k, method, concurrency, rate
+    """
+    start = time.time()
+    method = options.get('method', 'cosine')
+    if method not in METHODS:
+        method = 'cosine'
+    top_k = int(options.get('top_k') or 0)
+    limiter = RateLimiter(options.get('rate', BATCH_LLM_RATE))
+    base = {key: options[key] for key in ('mode', 'deadline') if key in options}
     
-    # Usar el archivo más reciente
-    json_path = sorted(education_files)[-1]
-    print(f"Cargando education desde: {json_path}")
+    def worker(prompt):
+        body, status, _ = vectorize_prompt(dict(base, prompt=prompt), remember=False, before_llm=limiter.acquire)
+        return body if status == 200 else {'error': body.get('error', 'Unknown error')}
     
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # El archivo usa 'CrimeMatrix' en lugar de 'EducationMatrix'
-        education_matrix = data[0].get('EducationMatrix') or data[0].get('CrimeMatrix')
-        vertical_step = data[0]['VerticalStep']
-        horizontal_step = data[0]['HorizontalStep']
-        
-        # Llenar el índex 8 de la matriz unificada
-        for i in range(20):
-            for j in range(20):
-                matrix_LA_alldata_20x20[i][j][8] = education_matrix[i][j]
-        
-        print("✓ Datos de education cargados correctamente en índex 8")
-        return {
-            'success': True,
-            'origin': f"N:{data[0]['Norigin']}, W:{data[0]['WOrigin']}",
-            'steps': f"Vertical:{vertical_step}, Horizontal:{horizontal_step}",
-            'dimensions': '20x20',
-            'max_score': data[0].get('MaxScore', 'N/A')
-        }
+    unique = 0
+    sources = {}
+    for prompt, positions, body in run_batch(prompts, worker, options.get('concurrency', BATCH_CONCURRENCY)):
+        unique += 1
+        line = {'prompt': prompt}
+        if 'error' in body:
+            line['error'] = body['error']
+            sources['error'] = sources.get('error', 0) + len(positions)
+        else:
+            line.update(vector=body['vector'], source=body['source'], model=body.get('model'))
+            sources[body['source']] = sources.get(body['source'], 0) + len(positions)
+            if top_k:
+                line['top_k'] = top_cells(body['vector'], method, top_k)
+        for index in positions:
+            yield json.dumps(dict({'index': index}, **line), ensure_ascii=False) + '\n'
     
-    except FileNotFoundError:
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    except Exception as e:
-        return {'success': False, 'error': str(e)}
+    yield json.dumps({
+        'done': True,
+        'total': len(prompts),
+        'unique': unique,
+        'sources': sources,
+        'elapsed': round(time.time() - start, 3)
+    }) + '\n'
 
-def load_health_data():
-    """
-    Carga el JSON de health i llena el índex 10 de la matriz unificada.
-    Cada celda contendrà el valor de health en el índex 10 del vector.
+def batch_request(body, content_type=None):
     """
-    # Buscar el archivo más reciente de health
-    json_dir = Path(__file__).parent / 'city_stats' / 'jsons'
-    health_files = list(json_dir.glob('health_matrix_20x20_*.json'))
+    Valida una petició de /api/generate/batch.
     
-    if not health_files:
-        print("Error: No se encontró ningún archivo de health")
-        return {'success': False, 'error': 'Archivo no encontrado'}
+    Accepta JSON {"prompts": [...], "top_k", "method", "mode", "deadline", "concurrency", "rate"}
+    o un CSV (Content-Type: text/csv) amb una columna 'prompt' o les descripcions a la
+    primera columna; en aquest cas les opcions van als query params.
+    
+    Retorna (prompts, options, None) o (None, None, (body, status, headers)) amb l'error.
+    """
+    if content_type and content_type.startswith('text/csv'):
+        prompts = read_prompts_csv(body['csv'], body.get('column'))
+        options = body
+    else:
+        options = body or {}
+        if not isinstance(options, dict):
+            return None, None, ({'error': 'Request body must be a JSON object'}, 400, {})
+        prompts = options.get('prompts')
+        if not isinstance(prompts, list) or not prompts:
+            return None, None, ({'error': 'prompts must be a non-empty array'}, 400, {})
+        if not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts):
+            return None, None, ({'error': 'All prompts must be non-empty strings'}, 400, {})
     
-    # Usar el archivo más reciente
-    json_path = sorted(health_files)[-1]
-    print(f"Cargando health desde: {json_path}")
+    if not prompts:
+        return None, None, ({'error': 'No prompts provided'}, 400, {})
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        return None, None, ({'error': f'Too many prompts (max {BATCH_MAX_PROMPTS})'}, 400, {})
+    if options.get('mode', 'auto') not in ('auto', 'llm', 'local'):
+        return None, None, ({'error': "mode must be 'auto', 'llm' or 'local'"}, 400, {})
     
     try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        health_data = data[0]
-        health_matrix = health_data['HealthMatrix']
-        
-        # Verificar dimensions
-        rows = len(health_matrix)
-        cols = len(health_matrix[0]) if rows > 0 else 0
-        
-        # Llenar la matriz unificada - índex 10 = health
-        for i in range(20):
-            for j in range(20):
-                if i < rows and j < cols:
-                    matrix_LA_alldata_20x20[i][j][10] = health_matrix[i][j]
-        
-        return {
-            'success': True,
-            'origin': {
-                'north': health_data.get('Norigin', 0),
-                'west': health_data.get('WOrigin', 0)
-            },
-            'steps': {
-                'vertical': health_data.get('VerticalStep', 0),
-                'horizontal': health_data.get('HorizontalStep', 0)
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            },
-            'max_score': health_data.get('MaxScore', 1.0)
+        options = {
+            'mode': options.get('mode', 'auto'),
+            'method': options.get('method', 'cosine'),
+            'top_k': max(0, min(int(options.get('top_k', 0)), 400)),
+            # El client pot demanar menys paral·lelisme o ritme, no més
+            'concurrency': max(1, min(int(options.get('concurrency', BATCH_CONCURRENCY)), BATCH_CONCURRENCY)),
+            'rate': max(0.1, min(float(options.get('rate', BATCH_LLM_RATE)), BATCH_LLM_RATE)),
+            **({'deadline': options['deadline']} if 'deadline' in options else {})
         }
+    except (TypeError, ValueError):
+        return None, None, ({'error': 'Invalid batch options'}, 400, {})
     
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    except Exception as e:
-        print(f"Error al cargar datos de health: {e}")
-        return {'success': False, 'error': str(e)}
+    return prompts, options, None
 
-def load_community_vibe_data():
+@app.route('/api/generate/batch', methods=['POST'])
+def generate_batch():
     """
-    Carga el JSON de community vibe i llena el índex 10 de la matriz unificada.
-    Cada celda contendrà el valor de community vibe en el índex 10 del vector.
+    Vectoritza moltes descripcions alhora i retorna els resultats en NDJSON
+    (una línia per descripció a mesura que acaben, més una línia final de resum).
     """
-    # Buscar el archivo más reciente de community_vibe
-    json_dir = Path(__file__).parent / 'city_stats' / 'jsons'
-    community_vibe_files = list(json_dir.glob('community_vibe_matrix_20x20_*.json'))
-    
-    if not community_vibe_files:
-        print("Error: No se encontró ningún archivo de community_vibe")
-        return {'success': False, 'error': 'Archivo no encontrado'}
-    
-    # Usar el archivo más reciente
-    json_path = sorted(community_vibe_files)[-1]
-    print(f"Cargando community_vibe desde: {json_path}")
-    
     try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        
-        community_vibe_data = data[0]
-        community_vibe_matrix = community_vibe_data['CommunityVibMatrix']
+        content_type = request.content_type or ''
+        if content_type.startswith('text/csv'):
+            body = dict(request.args, csv=request.get_data(as_text=True))
+        else:
+            body = request.get_json()
         
-        # Verificar dimensions
-        rows = len(community_vibe_matrix)
-        cols = len(community_vibe_matrix[0]) if rows > 0 else 0
+        prompts, options, error = batch_request(body, content_type)
+        if error:
+            return to_flask_response(*error)
         
-        # Llenar la matriz unificada - índex 9 = community_vibe
-        for i in range(20):
-            for j in range(20):
-                if i < rows and j < cols:
-                    matrix_LA_alldata_20x20[i][j][9] = community_vibe_matrix[i][j]
+        return Response(
+            stream_with_context(batch_ndjson_lines(prompts, options)),
+            mimetype='application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
         
-        return {
-            'success': True,
-            'origin': {
-                'north': community_vibe_data.get('Norigin', 0),
-                'west': community_vibe_data.get('WOrigin', 0)
-            },
-            'steps': {
-                'vertical': community_vibe_data.get('VerticalStep', 0),
-                'horizontal': community_vibe_data.get('HorizontalStep', 0)
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            },
-            'max_score': max(max(row) for row in community_vibe_matrix) if rows > 0 and cols > 0 else 1.0
-        }
-    
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
     except Exception as e:
-        print(f"Error al cargar datos de community_vibe: {e}")
-        return {'success': False, 'error': str(e)}
+        return jsonify({'error': str(e)}), 500
 
-def load_walkability_data():
+def chat_request_error(data):
     """
-    Carga el JSON de walkability i llena el índex 4 de la matriz unificada.
-    Cada celda contendrà el valor de walkability en el índex 4 del vector.
+    Valida el cos de /api/chat.
+    
+    Retorna (body, status, headers) amb l'error, o None si la petició és vàlida.
     """
-    # Buscar el archivo más reciente de walkability
-    json_dir = Path(__file__).parent / 'city_stats' / 'jsons'
-    walkability_files = list(json_dir.glob('walkability_matrix_20x20_*.json'))
+    if gemini_api is None:
+        return {
+            'error': 'Gemini API not initialized. Please check your GOOGLE_API_KEY in .env file.'
+        }, 500, {}
     
-    if not walkability_files:
-        print("Error: No se encontró ningún archivo de walkability")
-        return {'success': False, 'error': 'Archivo no encontrado'}
+    if not data or 'messages' not in data:
+        return {'error': 'No messages provided'}, 400, {}
     
-    # Usar el archivo más reciente
-    json_path = sorted(walkability_files)[-1]
-    print(f"Cargando walkability desde: {json_path}")
+    messages = data['messages']
     
+    if not isinstance(messages, list) or len(messages) == 0:
+        return {'error': 'Messages must be a non-empty array'}, 400, {}
+    
+    return None
+
+def chat_result_response(result):
+    """Construeix la resposta de /api/chat. Retorna (body, status, headers)."""
+    if not result['success']:
+        return {
+            'error': f"API Error: {result.get('error', 'Unknown error')}"
+        }, 500, {}
+    
+    return {
+        'output': result['text'],
+        'timestamp': time.time(),
+        'model': 'gemini-1.5-flash'
+    }, 200, {}
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    """
+    Endpoint for chat-based interactions with conversation history.
+    """
     try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        data = request.get_json()
         
-        walkability_data = data[0]
-        walkability_matrix = walkability_data['WalkabilityMatrix']
+        error = chat_request_error(data)
+        if error:
+            return to_flask_response(*error)
         
-        # Verificar dimensions
-        rows = len(walkability_matrix)
-        cols = len(walkability_matrix[0]) if rows > 0 else 0
+        # Generate chat response
+        result = gemini_api.chat(messages=data['messages'])
         
-        # Llenar la matriz unificada - índex 4 = walkability
-        for i in range(20):
-            for j in range(20):
-                if i < rows and j < cols:
-                    matrix_LA_alldata_20x20[i][j][4] = walkability_matrix[i][j]
+        return to_flask_response(*chat_result_response(result))
         
-        return {
-            'success': True,
-            'origin': {
-                'north': walkability_data['Norigin'],
-                'west': walkability_data['WOrigin']
-            },
-            'steps': {
-                'vertical': walkability_data['VerticalStep'],
-                'horizontal': walkability_data['HorizontalStep']
-            },
-            'dimensions': {
-                'rows': rows,
-                'cols': cols
-            },
-            'max_score': walkability_data.get('MaxScore', 1.0)
-        }
-    
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo {json_path}")
-        return {'success': False, 'error': 'Archivo no encontrado'}
     except Exception as e:
-        print(f"Error al cargar datos de walkability: {e}")
-        return {'success': False, 'error': str(e)}
-
-# Cargar datos al iniciar el servidor
-# Cargar datos en orden: income(0), crime(1), connectivity(2), noise(3), walkability(4), accessibility(5), wellbeing(6), mobility(7), education(8), community_vibe(9), health(10)
-income_info = load_income_data()
-crimes_info = load_crime_data()
-connectivity_info = load_connectivity_data()
-noise_info = load_noise_data()
-walkability_info = load_walkability_data()
-accessibility_info = load_accessibility_data()
-wellbeing_info = load_wellbeing_data()
-mobility_info = load_mobility_data()
-education_info = load_education_data()
-health_info = load_health_data()
-community_vibe_info = load_community_vibe_data()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Health check endpoint"""
+    return jsonify({'status': 'healthy'}), 200
+
+@app.route('/api/models', methods=['GET'])
+def list_models():
+    """List available Gemini models"""
+    try:
+        from api import GeminiAPI
+        models = GeminiAPI.list_available_models()
+        return jsonify({'models': models}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Límits geogràfics de la graella de Los Angeles
+LA_RECTANGLE = {
+    'north': 34.3344,
+    'east': -118.1236,
+    'south': 33.8624,
+    'west': -118.6057
+}
+
+# Carregar totes les capes (veure LAYERS a layers.py) dins la matriu unificada 20x20.
+# Cada cel·la és un vector [income, crimes, connectivity, noise, walkability, accessibility,
+# wellbeing, mobility, education, community_vibe, health]
+#
+# feature_store és immutable: cada petició en llegeix la referència una sola vegada i una
+# recàrrega només substitueix la referència (veure reload_feature_store).
+# Si hi ha una instantània binària al dia (python snapshot.py) s'obre amb mmap en lloc de
+# parsejar els JSON.
+feature_store = load_snapshot() or build_feature_store()
+feature_store_lock = threading.Lock()
+
+# Mapes de calor precalculats dels arquetips (archetype_cache.py). Un vector a menys
+# d'ARCHETYPE_TOLERANCE de l'arquetip (a cada component) fa servir el seu mapa; el valor
+# per defecte és menor que un pas dels controls lliscants del client (0.01)
+ARCHETYPE_TOLERANCE = float(os.getenv('ARCHETYPE_TOLERANCE', '0.005'))
+
+def build_archetype_heatmaps(store):
+    heatmaps = ArchetypeHeatmaps(store)
+    logger.info("Mapes de calor d'arquetips precalculats", extra={'count': len(heatmaps.heatmaps),
+                                                                  'seconds': round(heatmaps.build_seconds, 2)})
+    return heatmaps
+
+archetype_heatmaps = build_archetype_heatmaps(feature_store)
+
+def reload_feature_store():
+    """
+    Torna a carregar totes les capes en un FeatureStore nou i el posa en servei.
+    
+    No es substitueix si alguna capa que abans funcionava ara falla.
+    
+    Retorna (nou_store, capes_que_han_fallat).
+    """
+    global feature_store, archetype_heatmaps
+    
+    with feature_store_lock:
+        current = feature_store
+        new_store = build_feature_store()
+        
+        newly_failed = sorted(set(new_store.failed_layers()) - set(current.failed_layers()))
+        if newly_failed:
+            logger.error("Recàrrega descartada, capes amb errors", extra={'failed_layers': newly_failed})
+            return current, newly_failed
+        
+        # Els mapes dels arquetips es calculen abans del canvi: mai hi ha una finestra sense cache
+        new_archetypes = build_archetype_heatmaps(new_store)
+        feature_store = new_store
+        archetype_heatmaps = new_archetypes
+        logger.info("Capes recarregades", extra={'previous_version': current.version, 'version': new_store.version})
+        return new_store, []
+
+# Segons entre comprovacions dels JSON de capes (0 = sense vigilant)
+LAYER_WATCH_INTERVAL = float(os.getenv('LAYER_WATCH_INTERVAL', '0'))
+# Vigilant d'aquest procés (start_layer_watcher)
+layer_watcher = None
+
+def start_layer_watcher():
+    """
+    Inicia el fil que recarrega les capes quan canvien els JSON si LAYER_WATCH_INTERVAL > 0.
+    """
+    global layer_watcher
+    if LAYER_WATCH_INTERVAL <= 0:
+        return None
+    layer_watcher = LayerWatcher(reload_feature_store, interval=LAYER_WATCH_INTERVAL)
+    layer_watcher.start()
+    return layer_watcher
+
+# Respostes de /api/osm-data ja serialitzades i comprimides (una per format)
+osm_data_cache = ResponseCache()
 
 def calculate_similarity(vector1, vector2, method='cosine'):
     """
@@ -1033,32 +1083,257 @@ def calculate_similarity(vector1, vector2, method='cosine'):
         return float(similarity)
         
     except Exception as e:
-        print(f"Error calculant similitud: {e}")
+        logger.warning("Error calculant similitud: %s", e)
         return 0.0
 
-def generate_heatmap(method='cosine'):
+heatmap_duration = metrics.histogram('heatmap_compute_seconds',
+                                     'Temps de càlcul del mapa de calor per mètode i origen', ('method', 'source'))
+HEATMAP_DELTA_EPSILON = float(os.getenv('HEATMAP_DELTA_EPSILON', '0.001'))
+heatmap_sessions = HeatmapSessions(
+    max_sessions=int(os.getenv('HEATMAP_SESSIONS', '1000')),
+    ttl=float(os.getenv('HEATMAP_SESSION_TTL', '1800'))
+)
+
+def match_archetype(vector):
     """
-    Genera un mapa de calor comparant user_preference_vector amb cada cel·la de la matriu.
+    Arquetip precalculat que correspon al vector (dins d'ARCHETYPE_TOLERANCE) per a
+    les capes en servei, o None.
+    """
+    heatmaps = archetype_heatmaps
+    if heatmaps.version != feature_store.version:
+        return None
+    return heatmaps.match(vector, ARCHETYPE_TOLERANCE)
+
+def generate_heatmap(method='cosine', level=0, window=None, vector=None, archetype=None):
+    """
+    Genera un mapa de calor comparant el vector de preferències amb cada cel·la de la matriu.
     
     Args:
-        method: 'cosine' per a similitud coseno o 'ml' per a Maximum Likelihood
+        method: 'cosine', 'ml', 'manhattan', 'weighted' o 'pearson'
+        level: Nivell de la piràmide (0 = 20x20)
+        window: (row_start, row_end, col_start, col_end) dins del nivell, o None per a tot
+        vector: Vector de preferències; per defecte user_preference_vector
+        archetype: Arquetip de match_archetype(vector): es retorna el mapa precalculat
     
-    Retorna una matriu 20x20 amb valors de similitud entre 0 i 1.
+    Retorna un array NumPy (per defecte 20x20) amb valors de similitud entre 0 i 1.
     """
-    global user_preference_vector
+    if vector is None:
+        vector = user_preference_vector
     
-    if not user_preference_vector or len(user_preference_vector) != 11:
+    if not vector or len(vector) != 11:
         return None
     
-    heatmap = [[0.0 for _ in range(20)] for _ in range(20)]
+    if archetype is not None:
+        heatmaps = archetype_heatmaps
+        if heatmaps.version == feature_store.version:
+            heatmap = heatmaps.heatmap(archetype, method, level, window)
+            if heatmap is not None:
+                return heatmap
+    
+    # Només es calculen les cel·les de la finestra demanada
+    return similarity_grid(vector, window_cells(level, window), method)
+
+def window_cells(level, window=None):
+    """Cel·les (rows, cols, 11) d'una finestra d'un nivell de la piràmide."""
+    cells = feature_store.pyramid[level]
+    if window is not None:
+        row_start, row_end, col_start, col_end = window
+        cells = cells[row_start:row_end, col_start:col_end]
+    return cells
+
+def finite_float(value):
+    """float(value) que rebutja inf i nan (ValueError), com qualsevol altre valor invàlid."""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f'Valor no finit: {value}')
+    return number
+
+def heatmap_request(args, accept_header=None, extra=None):
+    """
+    Lògica de /api/heatmap compartida pel servidor Flask i pel front-end ASGI (asgi.py).
+    
+    Args:
+        args: Query params (qualsevol mapping)
+        accept_header: Capçalera Accept de la petició
+        extra: Camps addicionals de la resposta (també a la capçalera del format binari)
     
-    for i in range(20):
-        for j in range(20):
-            cell_vector = matrix_LA_alldata_20x20[i][j]
-            similarity = calculate_similarity(user_preference_vector, cell_vector, method)
-            heatmap[i][j] = similarity
+    Retorna (body, status, headers).
+    """
+    vector = user_preference_vector
+    if 'vector' in args:
+        try:
+            vector = [float(val) for val in args['vector'].split(',')]
+        except ValueError:
+            return {'error': 'All vector values must be between 0 and 1'}, 400, {}
+        error = validate_preference_vector(vector)
+        if error:
+            return {'error': error}, 400, {}
     
-    return heatmap
+    if not vector or len(vector) != 11:
+        return {
+            'error': 'No hi ha vector de preferències vàlid. Primer genera un vector fent servir /api/generate'
+        }, 400, {}
+    
+    # Obtener método desde query params
+    method = args.get('method', 'cosine')
+    if method not in METHODS:
+        method = 'cosine'
+    
+    # Nivell de la piràmide: explícit, derivat del zoom o 0 (20x20)
+    try:
+        if 'level' in args:
+            level = max(0, min(len(PYRAMID_SIZES) - 1, int(args['level'])))
+        elif 'zoom' in args:
+            level = level_for_zoom(finite_float(args['zoom']))
+        else:
+            level = 0
+        
+        viewport = None
+        if all(key in args for key in ('north', 'south', 'east', 'west')):
+            viewport = {key: finite_float(args[key]) for key in ('north', 'south', 'east', 'west')}
+    except ValueError:
+        return {'error': 'Paràmetres de zoom, nivell o viewport invàlids'}, 400, {}
+    
+    if viewport is not None and (viewport['north'] < viewport['south'] or viewport['east'] < viewport['west']):
+        return {'error': 'Viewport invertit: cal north >= south i east >= west'}, 400, {}
+    
+    window = viewport_window(PYRAMID_SIZES[level], LA_RECTANGLE, viewport)
+    
+    if window is None:
+        return {'error': 'El viewport no intersecta la graella'}, 404, {}
+    
+    archetype = match_archetype(vector)
+    session = heatmap_sessions.get(args.get('session'))
+    
+    with session.lock if session else nullcontext():
+        start = time.perf_counter()
+        with span('heatmap.compute', method=method, level=level) as compute_span:
+            if session is not None and archetype is None:
+                # Només canvia un control: actualitzar les sumes de la sessió
+                heatmap = session.heatmap((feature_store.version, level, window), window_cells(level, window),
+                                          vector, method)
+                source = 'incremental'
+            else:
+                heatmap = generate_heatmap(method, level, window, vector, archetype)
+                source = 'archetype' if archetype is not None else 'computed'
+            compute_span.set_attribute('heatmap.source', source)
+        heatmap_duration.observe(time.perf_counter() - start, method, source)
+        
+        if heatmap is None:
+            return {
+                'error': 'Error generant mapa de calor'
+            }, 500, {}
+        
+        payload = heatmap_payload(heatmap, vector, method, level, window, archetype)
+        payload.update(extra or {})
+        fmt = requested_format(args, accept_header)
+        if session is not None:
+            return session_heatmap_response(session, heatmap, payload, args.get('since'), fmt)
+    
+    # Resposta binària: la graella va com a buffer i la resta com a capçalera JSON
+    if fmt:
+        payload['grid_key'] = 'heatmap'
+        return encode_grid(heatmap, payload, fmt), 200, {'Content-Type': BINARY_MIMETYPE, 'Vary': 'Accept'}
+    
+    payload['heatmap'] = heatmap.tolist()
+    return payload, 200, {'Vary': 'Accept'}
+
+def heatmap_payload(heatmap, vector, method, level, window, archetype=None):
+    """Metadades de la resposta de /api/heatmap (tot menys la graella)."""
+    size = PYRAMID_SIZES[level]
+    row_start, row_end, col_start, col_end = window
+    
+    payload = {
+        'user_vector': vector,
+        'method': method,
+        'stats': {
+            'max_similarity': float(heatmap.max()),
+            'min_similarity': float(heatmap.min()),
+            'mean_similarity': float(heatmap.mean())
+        },
+        'level': level,
+        'grid_size': size,
+        'archetype': archetype,
+        'dataset_version': feature_store.version,
+        'window': {
+            'row': row_start,
+            'col': col_start,
+            'rows': row_end - row_start,
+            'cols': col_end - col_start
+        },
+        'rectangle': window_rectangle(size, LA_RECTANGLE, window)
+    }
+    return payload
+
+def session_heatmap_response(session, heatmap, payload, since, fmt):
+    """
+    Resposta de /api/heatmap per a una sessió: si el client té la graella del seq
+    `since` (mateixa finestra i mètode), només s'envien les cel·les que han canviat
+    més de HEATMAP_DELTA_EPSILON. S'ha de cridar amb session.lock.
+    
+    Retorna (body, status, headers).
+    """
+    window = payload['window']
+    view_key = (payload['dataset_version'], payload['level'], payload['method'],
+                window['row'], window['col'], window['rows'], window['cols'])
+    indices = session.changed_cells(view_key, heatmap, since, HEATMAP_DELTA_EPSILON)
+    values = heatmap if indices is None else heatmap.ravel()[indices]
+    
+    # La vista desada és el que descodifica el client (valors quantitzats inclosos)
+    data, params = quantize(values, fmt or 'f32')
+    seen = dequantize(data, params) if fmt else values
+    if indices is not None:
+        payload['delta'] = True
+        payload['base_seq'] = session.seq
+    payload['seq'] = session.remember(view_key, seen, indices)
+    headers = {'Vary': 'Accept', 'Cache-Control': 'no-store'}
+    
+    if indices is None:
+        if fmt:
+            payload['grid_key'] = 'heatmap'
+            return encode_grid(heatmap, payload, fmt), 200, dict(headers, **{'Content-Type': BINARY_MIMETYPE})
+        payload['heatmap'] = heatmap.tolist()
+        return payload, 200, headers
+    
+    if fmt:
+        return encode_delta(indices, data, params, payload, fmt), 200, dict(headers, **{'Content-Type': BINARY_MIMETYPE})
+    payload['delta_indices'] = indices.tolist()
+    payload['delta_values'] = values.tolist()
+    return payload, 200, headers
+
+
+def live_heatmap_frame(message, session_id, since=None):
+    """
+    Un fotograma del canal /api/heatmap/live (asgi.py): el mapa de calor d'un missatge
+    del client (vector i paràmetres de /api/heatmap), sempre en format binari i, quan
+    el client ja té una graella de la sessió, com a delta.
+    
+    Args:
+        message: Missatge JSON del client ({"vector": [...], "method", "zoom", ..., "since"})
+        session_id: Sessió incremental de la connexió
+        since: seq del darrer fotograma enviat per aquesta connexió
+    
+    Retorna (body, status, seq): body són bytes, o un dict d'error si status != 200.
+    """
+    if not isinstance(message, dict) or not isinstance(message.get('vector'), list):
+        return {'error': 'No vector provided'}, 400, since
+    
+    args = {key: str(value) for key, value in message.items()
+            if key not in ('vector', 'session', 'since') and value is not None}
+    if args.get('format') not in DTYPES:
+        args['format'] = 'u16'
+    # El client pot tenir un seq més nou (d'una resposta HTTP) que el darrer fotograma;
+    # el del fotograma és d'aquesta sessió i mana si el del client és d'una altra
+    seq = newest_seq(since, message.get('since'))
+    if seq:
+        args['since'] = seq
+    args['session'] = session_id
+    args['vector'] = ','.join(str(val) for val in message['vector'])
+    
+    body, status, _ = heatmap_request(args)
+    if status != 200:
+        return body, status, since
+    return body, status, decode_header(body).get('seq', since)
 
 @app.route('/api/heatmap', methods=['GET'])
 def get_heatmap():
@@ -1067,111 +1342,131 @@ def get_heatmap():
     
     Query params:
         method: 'cosine' (per defecte), 'ml', 'manhattan', 'weighted', o 'pearson'
+        zoom: Zoom de Leaflet; tria el nivell de la piràmide (opcional)
+        level: Nivell explícit de la piràmide, té prioritat sobre zoom (opcional)
+        north, south, east, west: Viewport del client; només es retornen
+            les tessel·les que el cobreixen (opcional)
+        format: 'json' (per defecte), 'f32', 'u16' o 'u8' per a la resposta binària
+            (també 'f32' amb Accept: application/octet-stream)
+        vector: 11 valors separats per comes (opcional). Fa la petició independent
+            de l'estat del procés, necessari quan hi ha diversos workers.
+        session: Identificador de sessió del client (opcional). Activa el recàlcul
+            incremental quan només canvien alguns controls.
+        since: 'seq' de la darrera resposta que té el client (amb session). Si
+            encara és vàlid la resposta és un delta: 'delta_indices' i
+            'delta_values' en JSON, o un missatge encode_delta en binari.
+        profile: N (només administració). Calcula el mapa N vegades i retorna
+            les piles col·lapsades del perfilador en lloc del mapa (sense session
+            ni since: no modifica cap sessió).
+    """
+    if 'profile' in request.args:
+        return to_flask_response(*profile_heatmap_request(request.args, request.headers))
+    return to_flask_response(*heatmap_request(request.args, request.headers.get('Accept')))
+
+def validate_preference_vector(vector):
+    """
+    Comprova que el vector tingui 11 valors numèrics entre 0 i 1.
+    
+    Retorna un missatge d'error, o None si és vàlid.
+    """
+    # Validar que sigui un array de 11 elements
+    if not isinstance(vector, list) or len(vector) != 11:
+        return 'Vector must have exactly 11 elements'
+    
+    # Validar que tots els valors estiguin entre 0 i 1
+    for val in vector:
+        if isinstance(val, bool) or not isinstance(val, (int, float)) or not 0 <= val <= 1:
+            return 'All vector values must be between 0 and 1'
+    
+    return None
+
+def update_vector_request(data, accept_header=None):
+    """
+    Lògica de /api/update-vector compartida pel servidor Flask i pel front-end ASGI.
+    
+    Amb 'heatmap' i/o 'top_k' al cos la resposta inclou el mapa de calor o les
+    cel·les més afins del vector nou, calculats amb aquest vector (no amb el
+    global, que pot haver canviat una altra petició).
+    
+    Retorna (body, status, headers).
     """
     global user_preference_vector
     
-    if not user_preference_vector or len(user_preference_vector) != 11:
-        return jsonify({
-            'error': 'No hi ha vector de preferències vàlid. Primer genera un vector fent servir /api/generate'
-        }), 400
+    if not data or 'vector' not in data:
+        return {'error': 'No vector provided'}, 400, {}
     
-    # Obtener método desde query params
-    method = request.args.get('method', 'cosine')
-    if method not in ['cosine', 'ml', 'manhattan', 'weighted', 'pearson']:
-        method = 'cosine'
+    new_vector = data['vector']
     
-    heatmap = generate_heatmap(method)
+    error = validate_preference_vector(new_vector)
+    if error:
+        return {'error': error}, 400, {}
     
-    if heatmap is None:
-        return jsonify({
-            'error': 'Error generant mapa de calor'
-        }), 500
+    method = data.get('method', 'cosine')
+    if method not in METHODS:
+        return {'error': f"Unknown method '{method}'"}, 400, {}
     
-    # Trobar el valor màxim i mínim per a normalització si és necessari
-    flat_values = [val for row in heatmap for val in row]
-    max_similarity = max(flat_values) if flat_values else 1.0
-    min_similarity = min(flat_values) if flat_values else 0.0
+    top_k = data.get('top_k') or 0
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 0:
+        return {'error': 'top_k must be a non-negative integer'}, 400, {}
+    # Com a /api/generate/batch: com a molt totes les cel·les de la graella base
+    top_k = min(top_k, 400)
     
-    return jsonify({
-        'heatmap': heatmap,
-        'user_vector': user_preference_vector,
-        'method': method,
-        'stats': {
-            'max_similarity': max_similarity,
-            'min_similarity': min_similarity,
-            'mean_similarity': sum(flat_values) / len(flat_values) if flat_values else 0.0
-        },
-        'rectangle': {
-            'north': 34.3344,
-            'east': -118.1236,
-            'south': 33.8624,
-            'west': -118.6057
-        }
-    })
+    # Actualitzar el vector global
+    user_preference_vector = new_vector
+    logger.info("Vector actualitzat manualment", extra={'vector': user_preference_vector})
+    
+    body = {
+        'success': True,
+        'vector': new_vector
+    }
+    if top_k:
+        body['top_k'] = top_cells(new_vector, method, top_k)
+    
+    options = data.get('heatmap')
+    if not options:
+        return body, 200, {}
+    
+    # El mapa de calor porta els camps de l'actualització (també en format binari)
+    args = {key: str(value) for key, value in (options if isinstance(options, dict) else {}).items()
+            if key != 'vector' and value is not None}
+    args.setdefault('method', method)
+    args['vector'] = ','.join(str(val) for val in new_vector)
+    heatmap, status, headers = heatmap_request(args, accept_header, extra=body)
+    if status != 200:
+        heatmap = dict(body, **heatmap)
+    return heatmap, status, headers
 
 @app.route('/api/update-vector', methods=['POST'])
 def update_vector():
     """
     Endpoint per a actualitzar el vector de preferències de l'usuari.
-    """
-    global user_preference_vector
     
+    JSON body:
+        vector: 11 valors entre 0 i 1
+        method: Mètode de similitud per al mapa de calor i el top-K (per defecte 'cosine')
+        top_k: Retorna també les N cel·les més afins (opcional)
+        heatmap: true o un objecte amb els paràmetres de /api/heatmap (zoom, viewport,
+            format, session, since...) per rebre el mapa de calor a la mateixa resposta.
+            Amb un format binari la resposta és el missatge binari i els camps
+            de l'actualització van a la capçalera.
+    """
     try:
-        data = request.get_json()
-        
-        if not data or 'vector' not in data:
-            return jsonify({'error': 'No vector provided'}), 400
-        
-        new_vector = data['vector']
-        
-        # Validar que sigui un array de 11 elements
-        if not isinstance(new_vector, list) or len(new_vector) != 11:
-            return jsonify({'error': 'Vector must have exactly 11 elements'}), 400
-        
-        # Validar que tots els valors estiguin entre 0 i 1
-        for val in new_vector:
-            if not isinstance(val, (int, float)) or val < 0 or val > 1:
-                return jsonify({'error': 'All vector values must be between 0 and 1'}), 400
-        
-        # Actualitzar el vector global
-        user_preference_vector = new_vector
-        print(f"✓ Vector actualitzat manualment: {user_preference_vector}")
-        
-        return jsonify({
-            'success': True,
-            'vector': user_preference_vector
-        }), 200
+        return to_flask_response(*update_vector_request(request.get_json(), request.headers.get('Accept')))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/osm-data')
-def get_osm_data():
-    # Información sobre los datos cargados
-    data_info = {
-        'income': income_info,
-        'crimes': crimes_info,
-        'connectivity': connectivity_info,
-        'noise': noise_info,
-        'walkability': walkability_info,
-        'accessibility': accessibility_info,
-        'wellbeing': wellbeing_info,
-        'mobility': mobility_info,
-        'education': education_info,
-        'health': health_info,
-        'community_vibe': community_vibe_info
-    }
+def build_osm_data_body(store, fmt=None):
+    """
+    Serialitza la resposta de /api/osm-data per a un FeatureStore en JSON o en format binari.
     
-    return jsonify({
+    Retorna (bytes, mimetype).
+    """
+    payload = {
         'message': 'Hola desde el servidor!',
-        'rectangle': {
-            'north': 34.3344,
-            'east': -118.1236,
-            'south': 33.8624,
-            'west': -118.6057
-        },
-        'matrix_LA_alldata_20x20': matrix_LA_alldata_20x20,
-        'data_info': data_info,
+        'rectangle': LA_RECTANGLE,
+        'data_info': store.data_info,
+        'dataset_version': store.version,
         'vector_format': {
             'description': 'Cada cel·la és un vector [income, crimes, connectivity, noise, walkability, accessibility, wellbeing, mobility, education, community_vibe, health]',
             'indices': {
@@ -1188,7 +1483,399 @@ def get_osm_data():
                 '10': 'health (0-1)'
             }
         }
-        })
+    }
+    
+    # Resposta binària: la matriu (20, 20, 11) va com a buffer i la resta com a capçalera JSON
+    if fmt:
+        payload['grid_key'] = 'matrix_LA_alldata_20x20'
+        return encode_grid(store.features, payload, fmt), BINARY_MIMETYPE
+    
+    payload['matrix_LA_alldata_20x20'] = store.matrix
+    return app.json.dumps(payload, separators=(',', ':')).encode('utf-8'), 'application/json'
+
+def osm_data_request(args, headers):
+    """
+    Lògica de /api/osm-data compartida pel servidor Flask i pel front-end ASGI (asgi.py).
+    
+    Args:
+        args: Query params
+        headers: Capçaleres de la petició (Accept, Accept-Encoding, If-None-Match)
+    
+    Retorna (body, status, headers).
+    """
+    store = feature_store
+    fmt = requested_format(args, headers.get('Accept'))
+    if 'profile' in args:
+        # Perfil de la construcció sense cache (serialització i compressió)
+        return profile_request(args, headers, lambda: PrecompressedResponse(*build_osm_data_body(store, fmt)))
+    entry = osm_data_cache.get(store.version, fmt or 'json', lambda: build_osm_data_body(store, fmt))
+    encoding = entry.select_encoding(headers.get('Accept-Encoding'))
+    
+    response_headers = {
+        'ETag': entry.etag(encoding),
+        'Vary': 'Accept, Accept-Encoding',
+        'Cache-Control': 'no-cache',
+        'X-Dataset-Version': store.version
+    }
+    
+    if entry.matches(headers.get('If-None-Match')):
+        return b'', 304, response_headers
+    
+    response_headers['Content-Type'] = entry.mimetype
+    if encoding != 'identity':
+        response_headers['Content-Encoding'] = encoding
+    return entry.bodies[encoding], 200, response_headers
+
+def osm_data_is_cached(args, headers):
+    """True si /api/osm-data es pot servir de la cache sense construir ni comprimir res."""
+    if 'profile' in args:
+        return False
+    return osm_data_cache.contains(feature_store.version, requested_format(args, headers.get('Accept')) or 'json')
+
+@app.route('/api/osm-data')
+def get_osm_data():
+    """
+    Retorna la matriu unificada de la ciutat i la informació de cada capa.
+    
+    La resposta es construeix i es comprimeix (gzip/brotli) una sola vegada per
+    versió del dataset i format, i es valida amb ETag (304 si If-None-Match coincideix).
+    
+    Query params:
+        format: 'json' (per defecte), 'f32', 'u16' o 'u8' per a la resposta binària
+            (també 'f32' amb Accept: application/octet-stream)
+        profile: N (només administració). Construeix i comprimeix la resposta N
+            vegades sense cache i retorna les piles col·lapsades del perfilador.
+    """
+    return to_flask_response(*osm_data_request(request.args, request.headers))
+
+# Catàleg de perfils precalculat pel job nocturn (persona_catalog.py); es torna a
+# comprovar si hi ha un build nou cada PERSONA_CATALOG_CHECK_INTERVAL segons
+persona_catalogs = PersonaCatalogReader(interval=float(os.getenv('PERSONA_CATALOG_CHECK_INTERVAL', '60')))
+
+def persona_list_request():
+    """
+    Lògica de /api/personas: perfils del catàleg precalculat.
+    
+    Retorna (body, status, headers).
+    """
+    catalog = persona_catalogs.get()
+    if catalog is None:
+        return {'error': 'El catàleg de perfils no està generat (python persona_catalog.py)'}, 503, {}
+    
+    return {
+        'personas': [{key: persona[key] for key in ('id', 'name', 'description')} for persona in catalog.personas],
+        'methods': catalog.methods,
+        'levels': catalog.levels,
+        'build': catalog.build,
+        'created_at': catalog.index['created_at'],
+        'dataset_version': catalog.dataset_version,
+        'stale': catalog.dataset_version != feature_store.version
+    }, 200, {'Cache-Control': 'public, max-age=300'}
+
+def persona_request(persona_id, args, headers):
+    """
+    Lògica de /api/personas/<id>: mapa de calor i top-K d'un perfil, llegits de
+    l'artefacte precalculat (cap crida a la LLM ni càlcul de similitud).
+    
+    Retorna (body, status, headers).
+    """
+    catalog = persona_catalogs.get()
+    if catalog is None:
+        return {'error': 'El catàleg de perfils no està generat (python persona_catalog.py)'}, 503, {}
+    persona = catalog.persona(persona_id)
+    if persona is None:
+        return {'error': f'Perfil desconegut: {persona_id}'}, 404, {}
+    
+    method = args.get('method', 'cosine')
+    if method not in catalog.methods:
+        method = 'cosine'
+    try:
+        level = max(0, min(len(catalog.levels) - 1, int(args.get('level', 0))))
+        k = max(0, min(catalog.index['top_k'], int(args.get('top_k', catalog.index['top_k']))))
+    except ValueError:
+        return {'error': 'level i top_k han de ser enters'}, 400, {}
+    fmt = requested_format(args, headers.get('Accept'))
+    
+    # El build és immutable: l'ETag només depèn del build i dels paràmetres
+    etag = f'"{catalog.build}-{persona_id}-{method}-{level}-{k}-{fmt or "json"}"'
+    response_headers = {'ETag': etag, 'Cache-Control': 'public, max-age=300', 'Vary': 'Accept'}
+    if etag in (headers.get('If-None-Match') or ''):
+        return b'', 304, response_headers
+    
+    payload = {
+        'persona': persona,
+        'method': method,
+        'level': level,
+        'grid_size': catalog.levels[level],
+        'rectangle': catalog.index['rectangle'],
+        'top_k': catalog.top_k(persona_id, method, k),
+        'build': catalog.build,
+        'dataset_version': catalog.dataset_version,
+        'stale': catalog.dataset_version != feature_store.version
+    }
+    
+    if fmt:
+        payload['grid_key'] = 'heatmap'
+        if fmt == 'u16':
+            # Les dades ja són uint16 a l'artefacte: es copien tal qual
+            body = encode_quantized(*catalog.heatmap(persona_id, method, level), payload, fmt)
+        else:
+            body = encode_grid(catalog.heatmap_values(persona_id, method, level), payload, fmt)
+        response_headers['Content-Type'] = BINARY_MIMETYPE
+        return body, 200, response_headers
+    
+    payload['heatmap'] = catalog.heatmap_values(persona_id, method, level).tolist()
+    return payload, 200, response_headers
+
+@app.route('/api/personas', methods=['GET'])
+def list_personas():
+    """
+    Perfils del catàleg precalculat (pàgines "millors barris per a X").
+    """
+    return to_flask_response(*persona_list_request())
+
+@app.route('/api/personas/<persona_id>', methods=['GET'])
+def get_persona(persona_id):
+    """
+    Mapa de calor i millors cel·les d'un perfil del catàleg.
+    
+    Query params:
+        method: Mètode de similitud (per defecte 'cosine')
+        level: Nivell de la piràmide (0 = 20x20)
+        top_k: Cel·les del top-K (com a molt les del build)
+        format: 'json' (per defecte), 'u16' (sense conversió), 'f32' o 'u8'
+    
+    'stale' és true si les capes en servei han canviat des del darrer build.
+    """
+    return to_flask_response(*persona_request(persona_id, request.args, request.headers))
+
+def bearer_token_matches(headers, token):
+    """Compara Authorization: Bearer <token> en temps constant (no revela el prefix encertat)."""
+    provided = headers.get('Authorization', '').encode('utf-8')
+    return hmac.compare_digest(provided, f'Bearer {token}'.encode('utf-8'))
+
+def is_admin_request(headers=None):
+    """
+    Comprova el token d'administració (Authorization: Bearer <ADMIN_TOKEN>) de les
+    capçaleres donades o de la petició Flask actual.
+    Si ADMIN_TOKEN no està definit, els endpoints d'administració queden desactivats.
+    """
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token:
+        return False
+    if headers is None:
+        headers = request.headers
+    return bearer_token_matches(headers, admin_token)
+
+# Perfilador: durada màxima de /api/admin/profile i repeticions màximes de ?profile=N
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+PROFILE_MAX_REPEAT = int(os.getenv('PROFILE_MAX_REPEAT', '1000'))
+profile_lock = threading.Lock()
+
+def profile_response(profiler):
+    """Piles col·lapsades en text pla, amb les mostres i la durada a les capçaleres."""
+    return profiler.collapsed().encode('utf-8'), 200, {
+        'Content-Type': 'text/plain; charset=utf-8',
+        'X-Profile-Samples': str(profiler.samples),
+        'X-Profile-Duration': f'{profiler.duration:.3f}'
+    }
+
+def profile_request(args, headers, func, *func_args, max_repeat=PROFILE_MAX_REPEAT):
+    """
+    Modalitat ?profile=N dels endpoints: executa func(*func_args) N vegades (com a
+    molt max_repeat) mostrejant només el fil de la petició. Requereix el token
+    d'administració.
+    
+    Retorna (body, status, headers).
+    """
+    if not is_admin_request(headers):
+        return {'error': 'Forbidden'}, 403, {}
+    try:
+        repeat = max(1, min(max_repeat, int(args.get('profile') or 1)))
+    except ValueError:
+        return {'error': 'profile ha de ser un enter'}, 400, {}
+    _, profiler = profile_call(func, *func_args, repeat=repeat)
+    return profile_response(profiler)
+
+def profile_heatmap_request(args, headers):
+    """
+    ?profile=N de /api/heatmap. Sense session ni since: cada repetició avançaria el
+    'seq' de la sessió i el client perdria la base dels seus deltes.
+    
+    Retorna (body, status, headers).
+    """
+    stateless = {key: value for key, value in args.items() if key not in ('session', 'since')}
+    return profile_request(args, headers, heatmap_request, stateless, headers.get('Accept'))
+
+def load_feature_store():
+    """Carrega les capes i els mapes dels arquetips sense posar-los en servei (per perfilar)."""
+    store = build_feature_store()
+    build_archetype_heatmaps(store)
+    return store
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload():
+    """
+    Recarrega les capes de city_stats/jsons sense reiniciar el servidor.
+    
+    Només es recarrega el worker que rep la petició; els altres ho fan quan el seu
+    vigilant (LAYER_WATCH_INTERVAL > 0) veu el fitxer .reload que s'hi escriu, en
+    com a molt dos intervals. Sense vigilant, la resta de workers continuen amb la
+    versió anterior ('broadcast': false) fins que es reiniciïn.
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if 'profile' in request.args:
+        # Perfil d'una sola càrrega de les capes, sense el lock de recàrrega ni canviar el
+        # store en servei (cada càrrega tarda mig segon)
+        return to_flask_response(*profile_request(request.args, request.headers, load_feature_store,
+                                                  max_repeat=1))
+    
+    previous_version = feature_store.version
+    store, failed = reload_feature_store()
+    
+    if failed:
+        return jsonify({
+            'error': 'Recàrrega descartada: algunes capes no s\'han pogut carregar',
+            'failed_layers': failed,
+            'version': store.version
+        }), 500
+    
+    broadcast = LAYER_WATCH_INTERVAL > 0
+    if broadcast:
+        try:
+            request_reload()
+            if layer_watcher is not None:
+                layer_watcher.acknowledge()
+        except OSError as e:
+            logger.error("No s'ha pogut avisar els altres workers: %s", e)
+            broadcast = False
+    
+    return jsonify({
+        'success': True,
+        'previous_version': previous_version,
+        'version': store.version,
+        'changed': store.version != previous_version,
+        'pid': os.getpid(),
+        'broadcast': broadcast
+    }), 200
+
+@app.route('/api/admin/profile', methods=['GET'])
+def admin_profile():
+    """
+    Perfila tot el procés mentre atén el trànsit real.
+    
+    Query params:
+        seconds: Durada del mostreig (per defecte 10, com a molt PROFILE_MAX_SECONDS)
+        interval: Segons entre mostres (per defecte 0.005)
+        idle: '1' per incloure els fils en espera
+        format: 'collapsed' (per defecte, per a flamegraph.pl o speedscope) o 'json'
+            (mostres, funcions amb més temps propi i piles col·lapsades)
+    
+    Amb diversos workers només es perfila el que rep la petició.
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    try:
+        seconds = max(0.1, min(PROFILE_MAX_SECONDS, float(request.args.get('seconds', 10))))
+        interval = max(0.001, min(1.0, float(request.args.get('interval', 0.005))))
+    except ValueError:
+        return jsonify({'error': 'seconds i interval han de ser números'}), 400
+    
+    if not profile_lock.acquire(blocking=False):
+        return jsonify({'error': 'Ja hi ha un perfil en curs'}), 409
+    try:
+        profiler = profile_for(seconds, interval, include_idle=request.args.get('idle') == '1')
+    finally:
+        profile_lock.release()
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'samples': profiler.samples,
+            'duration': round(profiler.duration, 3),
+            'interval': interval,
+            'top_functions': [{'function': name, 'samples': count} for name, count in profiler.top_functions()],
+            'collapsed': profiler.collapsed()
+        }), 200
+    return to_flask_response(*profile_response(profiler))
+
+@app.route('/api/admin/semantic-cache', methods=['GET', 'DELETE'])
+def admin_semantic_cache():
+    """
+    Estadístiques de la cache semàntica (GET) o buidar-la (DELETE).
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if request.method == 'DELETE':
+        semantic_cache.clear()
+    
+    return jsonify(semantic_cache.stats()), 200
+
+@app.route('/api/admin/llm-latency', methods=['GET'])
+def admin_llm_latency():
+    """
+    Histogrames de latència de cada model de la LLM (crides correctes) i errors.
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if gemini_api is None:
+        return jsonify({'models': {}}), 200
+    
+    return jsonify({
+        'primary': gemini_api.model_name,
+        'fallbacks': gemini_api.fallback_models,
+        'hedge_delay': gemini_api.hedge_delay(),
+        'models': gemini_api.latency.snapshot()
+    }), 200
+
+@metrics.collector
+def llm_metrics():
+    if gemini_api is None:
+        return []
+    lines = ['# HELP llm_request_duration_seconds Latència de les crides correctes a la LLM per model',
+             '# TYPE llm_request_duration_seconds histogram']
+    errors = []
+    for model, histogram in gemini_api.latency.items():
+        lines += render_histogram('llm_request_duration_seconds', histogram, ('model',), (model,))
+        errors.append(({'model': model}, histogram.errors))
+    lines += gauge_lines('llm_request_errors_total', 'Crides fallides a la LLM per model', errors, 'counter')
+    return lines + gemini_api.tokens.render()
+
+@metrics.collector
+def cache_metrics():
+    stats = semantic_cache.stats()
+    return (
+        gauge_lines('semantic_cache_requests_total', 'Consultes a la cache semàntica per resultat',
+                    [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])], 'counter')
+        + gauge_lines('semantic_cache_entries', 'Entrades de la cache semàntica', [({}, stats['entries'])])
+        + gauge_lines('semantic_cache_hit_ratio', 'Fracció de consultes resoltes per la cache semàntica',
+                      [({}, stats['hit_ratio'] or 0.0)])
+        + gauge_lines('osm_data_cache_requests_total', 'Respostes de /api/osm-data per resultat de la cache',
+                      [({'result': 'hit'}, osm_data_cache.hits), ({'result': 'miss'}, osm_data_cache.misses)],
+                      'counter')
+        + gauge_lines('heatmap_sessions', 'Sessions de mapa de calor incremental en memòria',
+                      [({}, len(heatmap_sessions))])
+    )
+
+@metrics.collector
+def dataset_metrics():
+    store = feature_store
+    return gauge_lines('dataset_info', 'Versió de les capes en servei', [({'version': store.version}, 1)])
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Mètriques del procés en format de text de Prometheus. Si METRICS_TOKEN està
+    definit cal Authorization: Bearer <METRICS_TOKEN>.
+    """
+    metrics_token = os.getenv('METRICS_TOKEN')
+    if metrics_token and not bearer_token_matches(request.headers, metrics_token):
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 # Ruta per servir l'aplicació Vue (ha d'anar AL FINAL)
 @app.route('/', defaults={'path': ''})
@@ -1204,5 +1891,6 @@ def serve_vue_app(path):
         return send_from_directory(app.static_folder, 'index.html')
 
 if __name__ == '__main__':
-    # Para producción en EC2 - escuchar en todas las interfaces
+    start_layer_watcher()
+    # Servidor de desenvolupament. En producció: gunicorn -c gunicorn.conf.py app:app
     app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,74 @@
+"""
+Mapes de calor precalculats dels arquetips del prompt de sistema.
+
+La majoria d'usuaris encaixen en un arquetip (luxe, estudiant, família...) i el
+seu vector és el vector canònic de l'arquetip o hi és molt a prop. En carregar
+(o recarregar) les capes es calculen els mapes de calor de cada arquetip, per a
+tots els mètodes i nivells de la piràmide; una petició amb un vector dins de la
+tolerància només fa una consulta al diccionari i un retall de la finestra.
+"""
+import time
+
+import numpy as np
+
+from local_vectorizer import ARCHETYPES, BASE_VECTOR
+from similarity import METHODS, similarity_grid
+
+
+def canonical_vectors():
+    """
+    Vector canònic de cada arquetip: el vector base amb els valors que l'arquetip
+    força (igual que el que dóna el vectoritzador local per a un arquetip pur).
+    """
+    vectors = {'base': list(BASE_VECTOR)}
+    for name, archetype in ARCHETYPES.items():
+        vector = list(BASE_VECTOR)
+        for index, value in archetype['values'].items():
+            vector[index - 1] = value
+        vectors[name] = vector
+    return vectors
+
+
+class ArchetypeHeatmaps:
+    """
+    Mapes de calor de tots els arquetips per a un FeatureStore concret.
+
+    Args:
+        store: FeatureStore del qual es fan servir els nivells de la piràmide
+        vectors: {nom: vector}; per defecte canonical_vectors()
+        methods: Mètodes de similitud a precalcular
+    """
+
+    def __init__(self, store, vectors=None, methods=METHODS):
+        start = time.perf_counter()
+        self.version = store.version
+        self.vectors = vectors or canonical_vectors()
+        self._names = list(self.vectors)
+        self._matrix = np.array([self.vectors[name] for name in self._names], dtype=float)
+        self.heatmaps = {}
+        for name, vector in self.vectors.items():
+            for method in methods:
+                for level, cells in enumerate(store.pyramid):
+                    heatmap = similarity_grid(vector, cells, method)
+                    heatmap.setflags(write=False)
+                    self.heatmaps[(name, method, level)] = heatmap
+        self.build_seconds = time.perf_counter() - start
+
+    def match(self, vector, tolerance):
+        """
+        Arquetip amb el vector canònic més proper si totes les components són a
+        menys de `tolerance` (distància L∞), o None.
+        """
+        if tolerance < 0:
+            return None
+        distances = np.abs(self._matrix - np.asarray(vector, dtype=float)).max(axis=1)
+        best = int(np.argmin(distances))
+        return self._names[best] if distances[best] <= tolerance else None
+
+    def heatmap(self, name, method, level, window=None):
+        """Mapa de calor precalculat (vista de només lectura), retallat a la finestra."""
+        heatmap = self.heatmaps.get((name, method, level))
+        if heatmap is None or window is None:
+            return heatmap
+        row_start, row_end, col_start, col_end = window
+        return heatmap[row_start:row_end, col_start:col_end]
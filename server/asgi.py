@@ -0,0 +1,379 @@
+"""
+Front-end HTTP asíncron (ASGI) amb les mateixes rutes que app.py.
+
+Les crides a la LLM s'esperen amb await (no ocupen cap fil mentre Gemini respon) i el
+càlcul del mapa de calor s'executa en un pool de fils acotat, de manera que milers de
+peticions lentes a la LLM no bloquegen les peticions ràpides de mapa de calor o estàtiques.
+La lògica de cada endpoint és la mateixa que la del servidor Flask (app.py); les rutes
+que no es redefineixen aquí (administració, fitxers de Vue...) les serveix l'app Flask
+muntada com a WSGI.
+
+Ús (des del directori server/):
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+Variables d'entorn:
+    HEATMAP_WORKERS      Fils per al càlcul del mapa de calor (per defecte, nombre de CPUs)
+    LLM_MAX_CONCURRENCY  Crides simultànies màximes a la LLM per procés (per defecte 256)
+    HEATMAP_LIVE_FPS     Fotogrames per segon màxims del canal /api/heatmap/live (per defecte 20)
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+import app as core
+from tracing import end_request, in_context, start_request
+from vector_stream import VectorStreamParser, sse_event
+
+# Pool acotat per a la feina de CPU (NumPy allibera el GIL durant els càlculs)
+heatmap_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('HEATMAP_WORKERS', os.cpu_count() or 1)),
+    thread_name_prefix='heatmap'
+)
+
+# Límit de crides concurrents a la LLM per no saturar l'API de Gemini
+llm_semaphore = asyncio.Semaphore(int(os.getenv('LLM_MAX_CONCURRENCY', '256')))
+
+HEATMAP_LIVE_FPS = float(os.getenv('HEATMAP_LIVE_FPS', '20'))
+
+
+def to_starlette_response(body, status=200, headers=None):
+    """Equivalent de core.to_flask_response per a Starlette."""
+    if isinstance(body, (bytes, bytearray)):
+        return Response(body, status_code=status, headers=headers)
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+async def run_cpu_bound(func, *args):
+    """Executa una funció de CPU al pool acotat sense bloquejar el bucle d'esdeveniments."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(heatmap_executor, in_context(func), *args)
+
+
+async def generate(request):
+    """Async version of /api/generate."""
+    try:
+        data = await request.json()
+
+        error = core.generate_request_error(data)
+        if error:
+            return to_starlette_response(*error)
+
+        response = core.cached_result_response(data)
+        if response:
+            return to_starlette_response(*await run_cpu_bound(core.with_generate_heatmap, response, data))
+
+        local, reason = core.generate_plan(data)
+        if reason:
+            if reason == 'confident' and core.LLM_BACKGROUND_REFINE:
+                core.llm_executor.submit(in_context(core.refine_in_background), data['prompt'], local)
+            response = core.local_result_response(local, reason)
+            return to_starlette_response(*await run_cpu_bound(core.with_generate_heatmap, response, data))
+
+        async with llm_semaphore:
+            result = await core.gemini_api.generate_text_hedged_async(
+                prompt=core.build_vector_prompt(data['prompt']),
+                deadline=core.request_deadline(data),
+                system_prompt=core.SYSTEM_PROMPT,
+                temperature=data.get('temperature', 0.1),
+                max_output_tokens=data.get('max_tokens', 2048)
+            )
+
+        response = core.generate_result_response(result, local, data['prompt'])
+        return to_starlette_response(*await run_cpu_bound(core.with_generate_heatmap, response, data))
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def generate_stream(request):
+    """Async version of /api/generate/stream (Server-Sent Events)."""
+    try:
+        data = await request.json()
+
+        error = core.generate_request_error(data)
+        if error:
+            return to_starlette_response(*error)
+
+        prompt = core.build_vector_prompt(data['prompt'])
+        heatmap_args = core.stream_heatmap_args(data)
+
+        cached = core.cached_result_response(data)
+        if cached:
+            events = await run_cpu_bound(core.stream_result_events, cached[0], heatmap_args)
+            return Response(''.join(events), media_type='text/event-stream',
+                            headers={'Cache-Control': 'no-cache'})
+
+        local, reason = core.generate_plan(data)
+        if reason:
+            if reason == 'confident' and core.LLM_BACKGROUND_REFINE:
+                core.llm_executor.submit(in_context(core.refine_in_background), data['prompt'], local)
+            events = await run_cpu_bound(core.stream_local_events, local, reason, heatmap_args)
+            return Response(''.join(events), media_type='text/event-stream',
+                            headers={'Cache-Control': 'no-cache'})
+
+        async def generate_response():
+            parser = VectorStreamParser()
+            async with llm_semaphore:
+                async for chunk in core.gemini_api.generate_text_stream_async(
+                    prompt=prompt,
+                    system_prompt=core.SYSTEM_PROMPT,
+                    temperature=data.get('temperature', 0.1),
+                    max_output_tokens=data.get('max_tokens', 2048)
+                ):
+                    yield sse_event('token', {'text': chunk})
+                    vector = parser.feed(chunk)
+                    if vector is not None:
+                        for event in await run_cpu_bound(core.stream_vector_events, vector, heatmap_args):
+                            yield event
+            for event in await run_cpu_bound(core.stream_end_events, parser, local, heatmap_args, data['prompt']):
+                yield event
+
+        return StreamingResponse(
+            generate_response(),
+            media_type='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def chat(request):
+    """Async version of /api/chat."""
+    try:
+        data = await request.json()
+
+        error = core.chat_request_error(data)
+        if error:
+            return to_starlette_response(*error)
+
+        async with llm_semaphore:
+            result = await core.gemini_api.chat_async(messages=data['messages'])
+
+        return to_starlette_response(*core.chat_result_response(result))
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def heatmap(request):
+    """/api/heatmap: el càlcul s'executa al pool acotat."""
+    if 'profile' in request.query_params:
+        result = await run_cpu_bound(core.profile_heatmap_request, request.query_params, request.headers)
+        return to_starlette_response(*result)
+    result = await run_cpu_bound(core.heatmap_request, request.query_params, request.headers.get('accept'))
+    return to_starlette_response(*result)
+
+
+async def heatmap_live(websocket):
+    """
+    /api/heatmap/live: canal WebSocket per arrossegar els controls.
+
+    El client envia missatges JSON amb el vector i els paràmetres de /api/heatmap
+    (?session= a la URL comparteix la sessió incremental amb les peticions HTTP).
+    El servidor només calcula el darrer missatge rebut (els anteriors es descarten),
+    com a molt HEATMAP_LIVE_FPS vegades per segon, i respon amb fotogrames binaris
+    (delta respecte del fotograma anterior). Els errors s'envien com a JSON.
+    """
+    await websocket.accept()
+    session_id = websocket.query_params.get('session') or f'live-{id(websocket)}'
+    loop = asyncio.get_running_loop()
+    latest = None
+    updated = asyncio.Event()
+
+    async def receive():
+        nonlocal latest
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            # Un missatge nou substitueix el pendent: només importa el vector més recent
+            latest = message
+            updated.set()
+
+    receiver = asyncio.create_task(receive())
+    interval = 1.0 / HEATMAP_LIVE_FPS if HEATMAP_LIVE_FPS > 0 else 0.0
+    seq = None
+    try:
+        while True:
+            waiter = asyncio.create_task(updated.wait())
+            done, _ = await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                # El client s'ha desconnectat
+                waiter.cancel()
+                receiver.exception()
+                break
+            updated.clear()
+            message, latest = latest, None
+            started = loop.time()
+
+            body, status, seq = await run_cpu_bound(core.live_heatmap_frame, message, session_id, seq)
+            if status == 200:
+                await websocket.send_bytes(body)
+            else:
+                await websocket.send_json(dict(body, status=status))
+
+            # Límit de fotogrames: els missatges que arribin mentrestant s'agrupen
+            await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+
+
+async def osm_data(request):
+    """
+    /api/osm-data: una resposta ja a la cache se serveix des del bucle; construir-la
+    (serialitzar i comprimir amb brotli 11 tarda segons) o ?profile=N van al pool acotat
+    perquè no bloquegin les altres connexions, WebSockets inclosos.
+    """
+    if core.osm_data_is_cached(request.query_params, request.headers):
+        return to_starlette_response(*core.osm_data_request(request.query_params, request.headers))
+    result = await run_cpu_bound(core.osm_data_request, request.query_params, request.headers)
+    return to_starlette_response(*result)
+
+
+async def update_vector(request):
+    """/api/update-vector."""
+    try:
+        data = await request.json()
+        if data and (data.get('heatmap') or data.get('top_k')):
+            # Mapa de calor o top-K a la mateixa resposta: càlcul al pool acotat
+            result = await run_cpu_bound(core.update_vector_request, data, request.headers.get('accept'))
+            return to_starlette_response(*result)
+        return to_starlette_response(*core.update_vector_request(data))
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def health(request):
+    """Health check endpoint"""
+    return JSONResponse({'status': 'healthy'})
+
+
+routes = [
+    Route('/api/generate', generate, methods=['POST']),
+    Route('/api/generate/stream', generate_stream, methods=['POST']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/heatmap', heatmap, methods=['GET']),
+    WebSocketRoute('/api/heatmap/live', heatmap_live),
+    Route('/api/osm-data', osm_data, methods=['GET']),
+    Route('/api/update-vector', update_vector, methods=['POST']),
+    Route('/api/health', health, methods=['GET']),
+    # La resta de rutes (administració, aplicació Vue...) les serveix Flask
+    Mount('/', app=WSGIMiddleware(core.app)),
+]
+
+class RequestMetricsMiddleware:
+    """
+    Mètriques HTTP (core.record_request) de les rutes que serveix Starlette; les que
+    arriben a l'app Flask muntada ja les registren els hooks de Flask. Aquí la
+    durada inclou tot el cos de la resposta (també els streams SSE).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.paths = {route.path for route in routes if isinstance(route, Route)}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        route, method = scope['path'], scope['method']
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        core.http_in_flight.inc(route)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            core.http_in_flight.dec(route)
+            core.record_request(route, method, status, time.perf_counter() - start)
+
+
+class TracingMiddleware:
+    """
+    Span arrel (tracing.py) de les rutes que serveix Starlette, amb la traça retornada
+    a les capçaleres traceparent i X-Trace-Id; l'app Flask muntada té els seus hooks.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.paths = {route.path for route in routes if isinstance(route, Route)}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope['headers'])
+        route, method = scope['path'], scope['method']
+        root, token = start_request(f'{method} {route}', headers.get(b'traceparent', b'').decode('latin-1'),
+                                    {'http.method': method, 'http.route': route})
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'traceparent', root.traceparent().encode('latin-1')),
+                    (b'x-trace-id', root.trace_id.encode('latin-1'))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_request(root, token, status)
+
+
+middleware = [
+    Middleware(RequestMetricsMiddleware),
+    Middleware(TracingMiddleware),
+    Middleware(
+        CORSMiddleware,
+        allow_origins=['*'],
+        allow_methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+        allow_headers=['Content-Type', 'Authorization'],
+        expose_headers=['traceparent', 'X-Trace-Id']
+    )
+]
+
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Amb uvicorn no hi ha post_fork: cada procés inicia el seu vigilant de capes
+    watcher = core.start_layer_watcher()
+    yield
+    if watcher:
+        watcher.stop()
+    heatmap_executor.shutdown(wait=False)
+
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
@@ -0,0 +1,148 @@
+"""
+Vectorització de moltes descripcions d'usuari alhora.
+
+Elimina duplicats, executa les descripcions úniques en paral·lel i limita el
+ritme de crides a la LLM amb un token bucket; les respostes de la cache
+semàntica o del vectoritzador local no consumeixen ritme. El servidor ho fa
+servir a POST /api/generate/batch i aquest mateix fitxer és la CLI per a CSV.
+
+Ús (des del directori server/):
+    python batch.py personas.csv --out vectors.ndjson --top-k 5
+    python batch.py personas.csv --column descripcio --concurrency 32 --rate 20
+"""
+import argparse
+import csv
+import io
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tracing import in_context
+
+
+class RateLimiter:
+    """
+    Token bucket: com a molt `rate` operacions per segon, amb ràfegues de fins a `burst`.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloqueja fins que hi ha un token disponible."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def normalize_prompt(prompt):
+    """Clau de deduplicació: sense espais sobrants i sense distingir majúscules."""
+    return re.sub(r'\s+', ' ', prompt).strip().casefold()
+
+
+def dedupe_prompts(prompts):
+    """
+    Agrupa les descripcions repetides.
+
+    Retorna una llista de (descripció, [posicions originals]) en ordre d'aparició.
+    """
+    groups = {}
+    for index, prompt in enumerate(prompts):
+        key = normalize_prompt(prompt)
+        if key not in groups:
+            groups[key] = (prompt, [])
+        groups[key][1].append(index)
+    return list(groups.values())
+
+
+def read_prompts_csv(text, column=None):
+    """
+    Descripcions d'un CSV: la columna indicada, la columna 'prompt' si la capçalera
+    la té, o la primera columna (sense capçalera).
+    """
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    wanted = (column or 'prompt').lower()
+    if wanted in header:
+        position = header.index(wanted)
+        rows = rows[1:]
+    elif column:
+        raise ValueError(f"CSV column '{column}' not found")
+    else:
+        position = 0
+    return [row[position].strip() for row in rows if len(row) > position and row[position].strip()]
+
+
+def run_batch(prompts, worker, concurrency=16):
+    """
+    Executa worker(descripció) per a cada descripció única, en paral·lel.
+
+    Genera (descripció, posicions, resultat) a mesura que acaben; si el worker
+    llança una excepció, el resultat és {'error': ...}. Cada worker s'executa en el
+    context de qui crida (els seus spans pengen de la petició).
+    """
+    groups = dedupe_prompts(prompts)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='batch') as executor:
+        futures = {executor.submit(in_context(worker), prompt): (prompt, positions) for prompt, positions in groups}
+        for future in as_completed(futures):
+            prompt, positions = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'error': str(e)}
+            yield prompt, positions, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vectoritza un CSV de descripcions i escriu NDJSON')
+    parser.add_argument('csv', help="Fitxer CSV ('-' per llegir de stdin)")
+    parser.add_argument('--column', help="Columna amb les descripcions (per defecte 'prompt' o la primera)")
+    parser.add_argument('--out', help='Fitxer NDJSON de sortida (per defecte stdout)')
+    parser.add_argument('--top-k', type=int, default=0, help='Cel·les més afins a incloure per descripció')
+    parser.add_argument('--method', default='cosine', help='Mètode de similitud per al top-K')
+    parser.add_argument('--mode', default='auto', choices=['auto', 'llm', 'local'])
+    parser.add_argument('--concurrency', type=int, help='Descripcions en paral·lel')
+    parser.add_argument('--rate', type=float, help='Crides a la LLM per segon')
+    args = parser.parse_args()
+
+    text = sys.stdin.read() if args.csv == '-' else open(args.csv, encoding='utf-8').read()
+    prompts = read_prompts_csv(text, args.column)
+
+    # Import tardà: app.py carrega les capes i inicialitza Gemini
+    import app
+
+    options = {'top_k': args.top_k, 'method': args.method, 'mode': args.mode}
+    if args.concurrency:
+        options['concurrency'] = args.concurrency
+    if args.rate:
+        options['rate'] = args.rate
+
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    try:
+        for line in app.batch_ndjson_lines(prompts, options):
+            out.write(line)
+            out.flush()
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
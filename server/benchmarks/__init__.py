@@ -0,0 +1,12 @@
+"""Scripts de mesura de rendiment del servidor (executar des del directori server/)."""
+
+
+def percentile(values, q):
+    """Percentil q (0-100) per interpolació lineal."""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
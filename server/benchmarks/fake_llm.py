@@ -0,0 +1,147 @@
+"""
+Servidor HTTP fals amb l'API REST de Gemini, amb retards injectats.
+
+Permet provar les peticions amb deadline, els duplicats i el model de reserva
+(api.py) sense cridar Gemini. Respon a generateContent, streamGenerateContent i
+countTokens amb un vector d'11 valors.
+
+Ús (des del directori server/):
+    python -m benchmarks.fake_llm --port 8090 \\
+        --delay models/gemini-2.0-flash=1.5:0.5 --delay models/gemini-2.0-flash-lite=0.3 \\
+        --slow-fraction 0.1 --slow-delay 8
+
+    GOOGLE_API_KEY=fake GEMINI_TRANSPORT=rest GEMINI_API_ENDPOINT=http://127.0.0.1:8090 python app.py
+
+--delay MODEL=MITJANA[:JITTER] fixa el retard (segons) de cada model; --slow-fraction
+és la fracció de peticions que a més triguen --slow-delay segons (la cua del p99).
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_VECTOR = [0.2, 0.5, 0.3, 0.5, 0.4, 0.0, 0.1, 0.3, 0.0, 0.3, 0.1]
+
+PATH_PATTERN = re.compile(r'^/v1beta/(?P<model>models/[^:]+):(?P<method>\w+)')
+
+
+def candidate(text):
+    return {
+        'content': {'parts': [{'text': text}], 'role': 'model'},
+        'finishReason': 'STOP',
+        'index': 0,
+        'safetyRatings': []
+    }
+
+
+class FakeLLM:
+    """Configuració de retards i comptadors de peticions."""
+
+    def __init__(self, delays=None, default_delay=(0.5, 0.1), slow_fraction=0.0, slow_delay=5.0,
+                 vector=None, seed=None):
+        self.delays = delays or {}
+        self.default_delay = default_delay
+        self.slow_fraction = slow_fraction
+        self.slow_delay = slow_delay
+        self.vector = vector or DEFAULT_VECTOR
+        self.random = random.Random(seed)
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def delay_for(self, model):
+        mean, jitter = self.delays.get(model, self.default_delay)
+        with self._lock:
+            self.requests[model] = self.requests.get(model, 0) + 1
+            delay = max(0.0, self.random.gauss(mean, jitter)) if jitter else mean
+            if self.random.random() < self.slow_fraction:
+                delay += self.slow_delay
+        return delay
+
+    def output(self):
+        return json.dumps(self.vector)
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            match = PATH_PATTERN.match(self.path)
+            if not match:
+                self._send_json({'error': {'code': 404, 'message': f'Unknown path {self.path}'}}, 404)
+                return
+
+            model, method = match.group('model'), match.group('method')
+            if method == 'countTokens':
+                text = json.dumps(request.get('contents', ''))
+                self._send_json({'totalTokens': max(1, len(text) // 4)})
+                return
+
+            time.sleep(fake.delay_for(model))
+            output = fake.output()
+            if method == 'streamGenerateContent':
+                # Array JSON en fragments, com l'API REST real
+                half = len(output) // 2
+                chunks = [{'candidates': [candidate(part)]} for part in (output[:half], output[half:])]
+                self._send_json(chunks)
+            elif method == 'generateContent':
+                self._send_json({'candidates': [candidate(output)], 'promptFeedback': {'safetyRatings': []}})
+            else:
+                self._send_json({'error': {'code': 400, 'message': f'Unknown method {method}'}}, 400)
+
+    return Handler
+
+
+def serve(fake, host='127.0.0.1', port=8090):
+    """Arrenca el servidor en un fil de fons i el retorna (server.shutdown() per aturar-lo)."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-llm', daemon=True).start()
+    return server
+
+
+def parse_delay(value):
+    model, _, spec = value.partition('=')
+    mean, _, jitter = spec.partition(':')
+    return model, (float(mean), float(jitter or 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor fals de l'API de Gemini amb retards injectats")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--delay', action='append', type=parse_delay, default=[],
+                        help='MODEL=MITJANA[:JITTER] en segons (repetible)')
+    parser.add_argument('--default-delay', type=float, default=0.5)
+    parser.add_argument('--slow-fraction', type=float, default=0.0)
+    parser.add_argument('--slow-delay', type=float, default=5.0)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    fake = FakeLLM(dict(args.delay), (args.default_delay, 0.0), args.slow_fraction, args.slow_delay, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    print(f"✓ LLM fals escoltant a http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
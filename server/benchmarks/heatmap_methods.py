@@ -0,0 +1,251 @@
+"""
+Temps de càlcul del mapa de calor per mètode, mida de graella i nombre de vectors.
+
+Mesura la implementació vectoritzada (similarity.py) amb graelles sintètiques de
+20x20, 100x100 i 500x500 cel·les i 1, 100 i 10.000 vectors, la funció per cel·la
+calculate_similarity (només als casos petits) i generate_heatmap amb les capes
+reals a cada nivell de la piràmide. Per a cada cas dóna p50, p99, mitjana,
+cel·les per segon i el pic de memòria reservada (tracemalloc), i pot desar-ho en
+JSON per comparar-ho entre commits.
+
+Ús (des del directori server/):
+    python -m benchmarks.heatmap_methods --json bench.json
+    python -m benchmarks.heatmap_methods --quick --methods cosine,pearson
+    python -m benchmarks.heatmap_methods --compare bench.json --json new.json
+
+Amb --compare el codi de sortida és 1 si algun p50 empitjora més de --threshold.
+Els casos grans (500x500 amb 10.000 vectors) tarden minuts; --quick els omet.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import percentile
+from similarity import METHODS, similarity_batch, similarity_grid
+
+GRID_SIZES = (20, 100, 500)
+VECTOR_COUNTS = (1, 100, 10000)
+QUICK_GRID_SIZES = (20, 100)
+QUICK_VECTOR_COUNTS = (1, 100)
+
+# Elements del resultat per bloc de vectors: els casos grans es calculen per blocs
+# i es descarten, com faria el servidor amb un lot
+CHUNK_ELEMENTS = 4_000_000
+
+
+def make_cells(size, seed=0):
+    return np.random.default_rng(seed).random((size, size, 11))
+
+
+def make_vectors(count, seed=1):
+    return np.random.default_rng(seed).random((count, 11))
+
+
+def vector_chunk(size):
+    return max(1, CHUNK_ELEMENTS // (size * size))
+
+
+def run_numpy(method, cells, vectors):
+    if len(vectors) == 1:
+        similarity_grid(vectors[0], cells, method)
+        return
+    chunk = vector_chunk(cells.shape[0])
+    for start in range(0, len(vectors), chunk):
+        similarity_batch(vectors[start:start + chunk], cells, method, chunk_size=chunk)
+
+
+def run_scalar(calculate_similarity, method, cell_lists, vector_lists):
+    for vector in vector_lists:
+        for cell in cell_lists:
+            calculate_similarity(vector, cell, method)
+
+
+def measure(func, repeat, budget):
+    """
+    Executa func fins a `repeat` vegades (com a mínim una) o fins a esgotar
+    `budget` segons. Retorna els temps en segons.
+    """
+    func()  # escalfament (imports, caches de NumPy)
+    samples = []
+    while len(samples) < repeat:
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+        if sum(samples) >= budget:
+            break
+    return samples
+
+
+def peak_allocation(func):
+    """Pic de memòria reservada (bytes) durant una execució, segons tracemalloc."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def case_result(implementation, method, grid, vectors, samples, peak_bytes):
+    p50 = percentile(samples, 50)
+    cells = grid * grid * vectors
+    return {
+        'implementation': implementation,
+        'method': method,
+        'grid': grid,
+        'vectors': vectors,
+        'samples': len(samples),
+        'p50_ms': round(p50 * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'cells_per_second': round(cells / p50) if p50 > 0 else None,
+        'peak_alloc_bytes': peak_bytes
+    }
+
+
+def case_key(result):
+    return result['implementation'], result['method'], result['grid'], result['vectors']
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_cases(args):
+    results = []
+
+    def report(result):
+        results.append(result)
+        print(f"{result['implementation']:>16} {result['method']:>9} {result['grid']:>4}x{result['grid']:<4} "
+              f"{result['vectors']:>6} vec  p50 {result['p50_ms']:>10.3f} ms  p99 {result['p99_ms']:>10.3f} ms  "
+              f"{result['cells_per_second'] or 0:>14,} cel/s  {result['peak_alloc_bytes'] / 2**20:>8.1f} MiB")
+        sys.stdout.flush()
+
+    for grid in args.grids:
+        cells = make_cells(grid, args.seed)
+        for count in args.vectors:
+            vectors = make_vectors(count, args.seed + 1)
+            first_chunk = vectors[:vector_chunk(grid)] if count > 1 else vectors
+            for method in args.methods:
+                samples = measure(lambda: run_numpy(method, cells, vectors), args.repeat, args.budget)
+                # El pic és el d'un bloc: els blocs següents reutilitzen la mateixa memòria
+                peak = peak_allocation(lambda: run_numpy(method, cells, first_chunk))
+                report(case_result('numpy', method, grid, count, samples, peak))
+
+    if args.no_app:
+        return results
+
+    # Import tardà: app.py carrega les capes i inicialitza Gemini
+    import app
+
+    for grid in args.grids:
+        cell_lists = make_cells(grid, args.seed).reshape(-1, 11).tolist()
+        for count in args.vectors:
+            if grid * grid * count > args.scalar_max_cells:
+                continue
+            vector_lists = make_vectors(count, args.seed + 1).tolist()
+            for method in args.methods:
+                run = lambda: run_scalar(app.calculate_similarity, method, cell_lists, vector_lists)
+                samples = measure(run, args.repeat, args.budget)
+                peak = peak_allocation(lambda: run_scalar(app.calculate_similarity, method, cell_lists,
+                                                          vector_lists[:1]))
+                report(case_result('scalar', method, grid, count, samples, peak))
+
+    vector = make_vectors(1, args.seed + 1)[0].tolist()
+    for level, cells in enumerate(app.feature_store.pyramid):
+        for method in args.methods:
+            run = lambda: app.generate_heatmap(method, level, None, vector)
+            samples = measure(run, args.repeat, args.budget)
+            report(case_result('generate_heatmap', method, cells.shape[0], 1, samples, peak_allocation(run)))
+
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Compara els p50 amb un fitxer anterior. Retorna el nombre de regressions."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {case_key(result): result for result in json.load(f)['results']}
+
+    regressions = 0
+    print(f"\nComparació amb {baseline_path} (regressió si p50 > x{threshold}):")
+    for result in results:
+        previous = baseline.get(case_key(result))
+        if not previous or not previous['p50_ms']:
+            continue
+        ratio = result['p50_ms'] / previous['p50_ms']
+        marker = '✗' if ratio > threshold else '✓'
+        regressions += ratio > threshold
+        implementation, method, grid, vectors = case_key(result)
+        print(f"{marker} {implementation:>16} {method:>9} {grid:>4}x{grid:<4} {vectors:>6} vec  "
+              f"{previous['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} ms  (x{ratio:.2f})")
+    return regressions
+
+
+def parse_list(value, cast=str):
+    return tuple(cast(item) for item in value.split(',') if item)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dels mètodes del mapa de calor')
+    parser.add_argument('--methods', type=parse_list, default=METHODS, help='Mètodes separats per comes')
+    parser.add_argument('--grids', type=lambda v: parse_list(v, int), help='Mides de graella (per defecte 20,100,500)')
+    parser.add_argument('--vectors', type=lambda v: parse_list(v, int),
+                        help='Nombre de vectors (per defecte 1,100,10000)')
+    parser.add_argument('--quick', action='store_true', help='Només graelles 20/100 i 1/100 vectors')
+    parser.add_argument('--repeat', type=int, default=30, help='Mostres màximes per cas')
+    parser.add_argument('--budget', type=float, default=2.0, help='Segons màxims per cas (mínim una mostra)')
+    parser.add_argument('--scalar-max-cells', type=int, default=40_000,
+                        help='Cel·les x vectors màxims per mesurar calculate_similarity')
+    parser.add_argument('--no-app', action='store_true', help='No mesura calculate_similarity ni generate_heatmap')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Desa els resultats en aquest fitxer JSON')
+    parser.add_argument('--compare', help='Fitxer JSON anterior amb què comparar')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Ràtio de p50 que compta com a regressió')
+    args = parser.parse_args()
+
+    unknown = set(args.methods) - set(METHODS)
+    if unknown:
+        parser.error(f"mètodes desconeguts: {', '.join(sorted(unknown))}")
+    args.grids = args.grids or (QUICK_GRID_SIZES if args.quick else GRID_SIZES)
+    args.vectors = args.vectors or (QUICK_VECTOR_COUNTS if args.quick else VECTOR_COUNTS)
+
+    results = run_cases(args)
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+            'budget': args.budget,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        print(f"✓ Resultats desats a {args.json}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+"""
+Prova de càrrega HTTP de punta a punta amb una LLM falsa.
+
+Arrenca el LLM fals (fake_llm.py) i el servidor apuntant-hi, i envia una barreja
+de peticions a /api/osm-data, /api/generate, /api/update-vector i /api/heatmap a
+un ritme objectiu (càrrega oberta: cada petició té la seva hora programada i la
+latència es compta des d'aquesta hora, també si el client s'endarrereix). Dóna
+percentils de latència i taxa d'errors per ruta.
+
+Ús (des del directori server/):
+    python -m benchmarks.load_test --rps 50 --duration 60
+    python -m benchmarks.load_test --server gunicorn --workers 4 --rps 200 --json load.json
+    python -m benchmarks.load_test --mix heatmap=8 --mix generate=2 --llm-delay 1.5:0.3
+    python -m benchmarks.load_test --target http://ec2-host:5000 --rps 100   # servidor existent
+
+--server: 'asgi' (uvicorn asgi:app), 'gunicorn' (gunicorn.conf.py, app:app) o 'flask'
+(servidor de desenvolupament). Amb --target no s'arrenca res i /api/generate
+crida la LLM que tingui configurada aquell servidor.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import percentile
+from benchmarks.fake_llm import DEFAULT_VECTOR, FakeLLM, serve
+
+# Pes de cada ruta a la barreja per defecte (un usuari mou controls més que no genera)
+DEFAULT_MIX = {'heatmap': 5, 'update-vector': 3, 'generate': 1, 'osm-data': 1}
+
+PROMPTS = [
+    "Sóc inversor i busco una casa exclusiva amb acabats premium i molta privacitat.",
+    "Sóc estudiant universitari, vull compartir pis barat i moure'm en transport públic.",
+    "Som una família amb dos fills petits, volem col·legis, parcs i tranquil·litat.",
+    "Treballo en remot com a programador i necessito fibra òptica i cafeteries a prop.",
+    "Tinc un gos i m'encanta fer senderisme a la muntanya.",
+    "Estic jubilat, necessito un pis accessible amb metges a prop i molta pau.",
+    "Busco un barri amb vida nocturna, bars i bona connexió amb el centre.",
+    "Vull un lloc tranquil, segur i no gaire car per viure sol."
+]
+
+METHODS = ('cosine', 'ml', 'manhattan', 'weighted', 'pearson')
+
+
+def random_vector(rng):
+    return [round(rng.random(), 2) for _ in range(11)]
+
+
+def build_request(route, rng, generate_mode):
+    """(method, path, body, headers) d'una petició realista a la ruta."""
+    if route == 'heatmap':
+        params = {
+            'vector': ','.join(str(val) for val in random_vector(rng)),
+            'method': rng.choice(METHODS),
+            'zoom': rng.choice((11, 12, 13, 14)),
+            'format': 'u16'
+        }
+        return 'GET', '/api/heatmap?' + urllib.parse.urlencode(params), None, {}
+    if route == 'update-vector':
+        body = {'vector': random_vector(rng)}
+        if rng.random() < 0.5:
+            body['heatmap'] = {'format': 'u16', 'zoom': rng.choice((11, 12, 13))}
+        return 'POST', '/api/update-vector', body, {}
+    if route == 'generate':
+        # Prompt únic de tant en tant: no tot ha de sortir de la cache semàntica
+        prompt = rng.choice(PROMPTS)
+        if rng.random() < 0.5:
+            prompt += f" Referència {rng.randrange(10 ** 6)}."
+        return 'POST', '/api/generate', {'prompt': prompt, 'mode': generate_mode}, {}
+    if route == 'osm-data':
+        return 'GET', '/api/osm-data?format=f32', None, {'Accept-Encoding': 'br, gzip'}
+    raise ValueError(f"Unknown route '{route}'")
+
+
+class HttpClient:
+    """Una connexió keep-alive per fil."""
+
+    def __init__(self, target, timeout):
+        parsed = urllib.parse.urlparse(target)
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.https else 80)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            connection = self._local.connection = cls(self.host, self.port, timeout=self.timeout)
+        return connection
+
+    def request(self, method, path, body=None, headers=None):
+        """Retorna (status, bytes rebuts); en un error de xarxa tanca la connexió i el propaga."""
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+            return response.status, len(data)
+        except Exception:
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.status = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency, status=None, size=0):
+        with self._lock:
+            self.latencies.append(latency)
+            self.bytes += size
+            key = str(status) if status is not None else 'exception'
+            self.status[key] = self.status.get(key, 0) + 1
+            if status is None or status >= 400:
+                self.errors += 1
+
+    def summary(self, duration):
+        count = len(self.latencies)
+        ms = lambda q: round(percentile(self.latencies, q) * 1000, 2) if count else None
+        return {
+            'requests': count,
+            'rps': round(count / duration, 2) if duration else None,
+            'errors': self.errors,
+            'error_rate': round(self.errors / count, 4) if count else None,
+            'status': self.status,
+            'p50_ms': ms(50),
+            'p90_ms': ms(90),
+            'p99_ms': ms(99),
+            'max_ms': round(max(self.latencies) * 1000, 2) if count else None,
+            'mean_bytes': round(self.bytes / count) if count else None
+        }
+
+
+def run_load(client, mix, rps, duration, warmup, workers, generate_mode, seed):
+    """
+    Envia peticions a `rps` per segon durant warmup + duration segons.
+
+    Retorna ({ruta: RouteStats}, segons mesurats, peticions que no han sortit a temps).
+    """
+    rng = random.Random(seed)
+    routes, weights = zip(*mix.items())
+    stats = {route: RouteStats() for route in routes}
+    interval = 1.0 / rps
+    total = int((warmup + duration) * rps)
+    measure_from = time.perf_counter() + warmup
+    late = [0]
+
+    def fire(route, request, scheduled):
+        try:
+            status, size = client.request(*request)
+        except Exception:
+            status, size = None, 0
+        finished = time.perf_counter()
+        # Latència des de l'hora programada: inclou la cua si el client no dóna l'abast
+        if scheduled >= measure_from:
+            stats[route].record(finished - scheduled, status, size)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='load') as executor:
+        start = time.perf_counter()
+        for i in range(total):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.1:
+                late[0] += 1
+            route = rng.choices(routes, weights)[0]
+            executor.submit(fire, route, build_request(route, rng, generate_mode), scheduled)
+
+    return stats, duration, late[0]
+
+
+def wait_until_ready(client, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if client.request('GET', '/api/health')[0] == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def start_server(kind, port, workers, env):
+    """Arrenca el servidor en un subprocés (directori server/)."""
+    server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if kind == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(workers), '--log-level', 'warning']
+    elif kind == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+        env = dict(env, GUNICORN_BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers))
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    return subprocess.Popen(command, cwd=server_dir, env=env, stdout=subprocess.DEVNULL)
+
+
+def parse_mix(values):
+    if not values:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for value in values:
+        route, _, weight = value.partition('=')
+        if route not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"ruta desconeguda '{route}'")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prova de càrrega HTTP amb una LLM falsa')
+    parser.add_argument('--rps', type=float, default=20, help='Peticions per segon objectiu')
+    parser.add_argument('--duration', type=float, default=30, help='Segons de mesura')
+    parser.add_argument('--warmup', type=float, default=5, help="Segons d'escalfament (no es compten)")
+    parser.add_argument('--mix', action='append', help='RUTA=PES (repetible): heatmap, update-vector, generate, osm-data')
+    parser.add_argument('--client-workers', type=int, default=64, help='Peticions simultànies màximes del client')
+    parser.add_argument('--timeout', type=float, default=30, help='Timeout de cada petició (segons)')
+    parser.add_argument('--generate-mode', default='llm', choices=['auto', 'llm', 'local'],
+                        help="'mode' de /api/generate (per defecte 'llm': sempre passa per la LLM falsa)")
+    parser.add_argument('--target', help='URL d\'un servidor ja en marxa (no arrenca res)')
+    parser.add_argument('--server', default='asgi', choices=['asgi', 'gunicorn', 'flask'])
+    parser.add_argument('--workers', type=int, default=1, help='Processos del servidor')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--llm-port', type=int, default=8095)
+    parser.add_argument('--llm-delay', default='0.8:0.2', help='Retard de la LLM falsa: MITJANA[:JITTER] segons')
+    parser.add_argument('--llm-slow-fraction', type=float, default=0.0)
+    parser.add_argument('--llm-slow-delay', type=float, default=5.0)
+    parser.add_argument('--llm-vector', help='Vector que retorna la LLM falsa (11 valors separats per comes)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Desa els resultats en aquest fitxer JSON')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    fake = server = llm = None
+    target = args.target
+    if not target:
+        mean, _, jitter = args.llm_delay.partition(':')
+        vector = [float(val) for val in args.llm_vector.split(',')] if args.llm_vector else DEFAULT_VECTOR
+        fake = FakeLLM(default_delay=(float(mean), float(jitter or 0)), slow_fraction=args.llm_slow_fraction,
+                       slow_delay=args.llm_slow_delay, vector=vector, seed=args.seed)
+        llm = serve(fake, port=args.llm_port)
+        env = dict(os.environ, GOOGLE_API_KEY='fake', GEMINI_TRANSPORT='rest',
+                   GEMINI_API_ENDPOINT=f'http://127.0.0.1:{args.llm_port}')
+        server = start_server(args.server, args.port, args.workers, env)
+        target = f'http://127.0.0.1:{args.port}'
+        print(f"✓ LLM fals a http://127.0.0.1:{args.llm_port}, servidor {args.server} a {target}")
+
+    client = HttpClient(target, args.timeout)
+    try:
+        if not wait_until_ready(client, 120):
+            print(f"✗ El servidor {target} no respon a /api/health")
+            sys.exit(1)
+        print(f"Carregant {target}: {args.rps} peticions/s durant {args.duration}s "
+              f"(+{args.warmup}s d'escalfament), barreja {mix}")
+        stats, duration, late = run_load(client, mix, args.rps, args.duration, args.warmup,
+                                         args.client_workers, args.generate_mode, args.seed)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+        if llm:
+            llm.shutdown()
+
+    results = {
+        'target': target,
+        'server': None if args.target else args.server,
+        'workers': None if args.target else args.workers,
+        'rps_target': args.rps,
+        'duration': duration,
+        'mix': mix,
+        'late_requests': late,
+        'routes': {route: route_stats.summary(duration) for route, route_stats in stats.items()}
+    }
+    if fake:
+        results['llm_requests'] = fake.requests
+
+    print(f"\n{'ruta':>14} {'peticions':>9} {'rps':>8} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    for route, summary in results['routes'].items():
+        print(f"{route:>14} {summary['requests']:>9} {summary['rps'] or 0:>8} "
+              f"{(summary['error_rate'] or 0) * 100:>6.2f}% {summary['p50_ms'] or 0:>9} "
+              f"{summary['p90_ms'] or 0:>9} {summary['p99_ms'] or 0:>9} {summary['max_ms'] or 0:>9}")
+    if late:
+        print(f"⚠ {late} peticions han sortit amb més de 100 ms de retard: el client no dóna l'abast "
+              f"(augmenta --client-workers o fes servir diverses màquines)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Resultats desats a {args.json}")
+
+
+if __name__ == '__main__':
+    main()
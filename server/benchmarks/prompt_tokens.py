@@ -0,0 +1,145 @@
+"""
+Tokens i latència per petició: prompt complet a cada crida vs. prompt de sistema
+reutilitzat com a context (prompt_cache.py).
+
+Ús (des del directori server/):
+    python -m benchmarks.prompt_tokens                 # només tokens
+    python -m benchmarks.prompt_tokens --live 5        # + latència amb crides reals
+    python -m benchmarks.prompt_tokens --json out.json
+
+Sense GOOGLE_API_KEY els tokens s'estimen (~4 bytes per token) i no es mesura latència.
+
+Els tokens "enviats" són els del mode que fa servir de debò el registre de contexts
+(el de gemini_api, o el que permet el SDK instal·lat si no hi ha clau). Només el mode
+'cached' treu el prompt de sistema de cada petició; amb 'system' i 'inline' (p. ex.
+google-generativeai 0.3.x) s'envia sencer cada vegada i l'únic estalvi és la
+compactació del prompt.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from benchmarks import percentile
+from prompt_cache import supported_mode
+
+load_dotenv()
+
+# Un perfil per arquetip del prompt de sistema
+SAMPLE_PROMPTS = [
+    "Sóc inversor i busco una casa exclusiva amb acabats premium i molta privacitat.",
+    "Sóc estudiant universitari, vull compartir pis barat i moure'm en transport públic.",
+    "Som una família amb dos fills petits, volem col·legis, parcs i tranquil·litat.",
+    "Treballo en remot com a programador i necessito fibra òptica i cafeteries a prop.",
+    "Tinc un gos i m'encanta fer senderisme a la muntanya.",
+    "Estic jubilat, necessito un pis accessible amb metges a prop i molta pau."
+]
+
+
+def count_tokens(model, text):
+    """Tokens reals si hi ha model, estimació en cas contrari."""
+    if model is None:
+        return round(len(text.encode('utf-8')) / 4)
+    return model.count_tokens(text).total_tokens
+
+
+def sent_tokens(model, mode, system_prompt, user_prompt):
+    """Tokens d'entrada que viatgen a cada petició en el mode del registre."""
+    if mode == 'cached':
+        return count_tokens(model, user_prompt)
+    # 'system' (system_instruction) i 'inline' envien el prompt de sistema cada vegada
+    return count_tokens(model, f"{system_prompt}\n\n{user_prompt}")
+
+
+def measure_latency(call, prompts, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for prompt in prompts:
+            start = time.perf_counter()
+            result = call(prompt)
+            latencies.append(time.perf_counter() - start)
+            if not result.get('success'):
+                print(f"⚠ {result.get('error')}")
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de tokens i latència del prompt de sistema')
+    parser.add_argument('--live', type=int, default=0, help='Repeticions de cada perfil amb crides reals a Gemini')
+    parser.add_argument('--json', help='Desa els resultats en aquest fitxer JSON')
+    args = parser.parse_args()
+
+    # Import tardà: app.py carrega les capes i inicialitza Gemini
+    import app
+
+    gemini_api = app.gemini_api
+    model = gemini_api.model if gemini_api else None
+    estimated = model is None
+
+    # Mode real del registre (crea el context com ho faria la primera petició)
+    mode = gemini_api.contexts.get(app.SYSTEM_PROMPT).mode if gemini_api else supported_mode()
+
+    system_tokens = count_tokens(model, app.SYSTEM_PROMPT)
+    full_tokens = [count_tokens(model, app.SYSTEM_PROMPT_TEMPLATE.replace('{TEXT_INPUT_USUARI}', p))
+                   for p in SAMPLE_PROMPTS]
+    user_tokens = [count_tokens(model, app.build_vector_prompt(p)) for p in SAMPLE_PROMPTS]
+    sent = [sent_tokens(model, mode, app.SYSTEM_PROMPT, app.build_vector_prompt(p)) for p in SAMPLE_PROMPTS]
+
+    results = {
+        'estimated_tokens': estimated,
+        'context_mode': mode,
+        'system_prompt_chars': {
+            'original': len(app.SYSTEM_PROMPT_TEMPLATE),
+            'compact': len(app.SYSTEM_PROMPT)
+        },
+        'system_prompt_tokens': system_tokens,
+        'tokens_per_request': {
+            'full_prompt': round(statistics.mean(full_tokens), 1),
+            'sent': round(statistics.mean(sent), 1),
+            'user_only': round(statistics.mean(user_tokens), 1)
+        }
+    }
+
+    if args.live and gemini_api is not None:
+        results['latency'] = {
+            'full_prompt': measure_latency(
+                lambda p: gemini_api.generate_text(
+                    prompt=app.SYSTEM_PROMPT_TEMPLATE.replace('{TEXT_INPUT_USUARI}', p), temperature=0.1),
+                SAMPLE_PROMPTS, args.live),
+            'cached_context': measure_latency(
+                lambda p: gemini_api.generate_text(
+                    prompt=app.build_vector_prompt(p), system_prompt=app.SYSTEM_PROMPT, temperature=0.1),
+                SAMPLE_PROMPTS, args.live)
+        }
+    elif args.live:
+        print("⚠ Sense GOOGLE_API_KEY no es pot mesurar la latència")
+
+    label = ' (estimats)' if estimated else ''
+    print(f"\nPrompt de sistema: {results['system_prompt_chars']['original']} -> "
+          f"{results['system_prompt_chars']['compact']} caràcters, {system_tokens} tokens{label}")
+    tokens = results['tokens_per_request']
+    print(f"Mode del context: {mode}")
+    print(f"Tokens per petició{label}: prompt original {tokens['full_prompt']}, "
+          f"enviats {tokens['sent']} (només usuari {tokens['user_only']})")
+    if mode != 'cached':
+        print(f"⚠ Amb el mode '{mode}' el prompt de sistema s'envia a cada petició: l'únic estalvi "
+              f"és la compactació ({tokens['full_prompt'] - tokens['sent']:.1f} tokens). "
+              "Cal un SDK amb context caching per enviar només el text de l'usuari.")
+    for name, stats in results.get('latency', {}).items():
+        print(f"Latència {name}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms ({stats['requests']} peticions)")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Resultats desats a {args.json}")
+
+
+if __name__ == '__main__':
+    main()
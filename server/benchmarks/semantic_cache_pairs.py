@@ -0,0 +1,149 @@
+"""
+Llindar de la cache semàntica (semantic_cache.py) amb parells de descripcions reals.
+
+Cada parell està etiquetat: 'same' si el vector de preferències hauria de ser el
+mateix (paràfrasis, un altre idioma, ordre diferent) i 'different' si no (sobretot
+negacions, modificadors oposats com "poc" / "molt pressupost" i perfils propers
+però oposats). Per a cada llindar es compten els
+encerts falsos (un 'different' que la cache serviria: vector equivocat) i els
+encerts perduts (un 'same' que aniria a la LLM: només cost).
+
+Ús (des del directori server/):
+    python -m benchmarks.semantic_cache_pairs
+    python -m benchmarks.semantic_cache_pairs --verbose --json pairs.json
+
+El llindar recomanat és el punt mig entre el parell 'different' més semblant (amb
+les mateixes negacions i sense modificadors oposats) i el parell 'same' menys
+semblant, si no se solapen.
+"""
+import argparse
+import json
+
+from semantic_cache import analyze, modifiers_conflict
+
+PAIRS = [
+    # Paràfrasis i traduccions: haurien de ser encerts
+    ('same', "Sóc estudiant amb poc pressupost", "Estudiant, pressupost just"),
+    ('same', "Student on a tight budget", "Sóc estudiant amb poc pressupost"),
+    ('same', "Sóc estudiant universitari, vull compartir pis barat",
+     "Sóc estudiant universitari i vull compartir un pis barat"),
+    ('same', "Som una família amb dos fills petits, volem escoles i parcs",
+     "Som una familia amb 2 fills petits i volem escoles i parcs"),
+    ('same', "Família amb fills, busquem col·legis i parcs a prop",
+     "Familia con hijos, buscamos colegios y parques cerca"),
+    ('same', "Sóc programador en remot i necessito bona fibra",
+     "Programador remot, necessito fibra bona"),
+    ('same', "Tinc un gos i m'agrada el senderisme", "Tengo un perro y me gusta el senderismo"),
+    ('same', "Estic jubilat i vull metges a prop", "Jubilat, vull tenir metges a prop"),
+    ('same', "No tinc cotxe, em moc en metro", "No tinc cotxe i em moc en metro"),
+    ('same', "Inversor amb pressupost il·limitat, busco privacitat",
+     "Inversor, pressupost il·limitat i molta privacitat"),
+    ('same', "I work remotely and need fast fiber", "I work remote and I need fast fiber"),
+    ('same', "Vull viure sense cotxe, a peu a tot arreu", "Vull viure sense cotxe i anar a peu a tot arreu"),
+    ('same', "Estudiant amb un pressupost baix", "Sóc estudiant amb poc pressupost"),
+    ('same', "Estic jubilat i vull metges a prop", "I am retired and want doctors nearby"),
+    ('same', "Busco un pis molt barat", "Busco un pis molt barat, sóc estudiant"),
+    # Sentit diferent: no haurien de ser mai encerts
+    ('different', "I have a car", "I do not have a car"),
+    ('different', "Tinc cotxe", "No tinc cotxe"),
+    ('different', "Tengo coche y necesito aparcar", "No tengo coche"),
+    ('different', "Som una familia amb fills, volem seguretat",
+     "Som una familia amb fills, no ens importa la seguretat"),
+    ('different', "Vull silenci i tranquil·litat", "No vull silenci, vull festa"),
+    ('different', "M'agrada la vida social i els bars", "No m'agrada la vida social ni els bars"),
+    ('different', "Tinc un gos", "No tinc gos"),
+    ('different', "I like nightlife", "I don't like nightlife"),
+    ('different', "Sóc estudiant", "No sóc estudiant, sóc inversor"),
+    ('different', "Necessito transport públic", "No necessito transport públic"),
+    ('different', "Sóc estudiant i vull festa", "Sóc estudiant i vull silenci"),
+    ('different', "Família amb fills", "Parella jubilada"),
+    # Modificadors oposats: el mateix concepte amb el sentit contrari
+    ('different', "Student with a large budget", "Sóc estudiant amb poc pressupost"),
+    ('different', "Estudiant amb un pressupost alt", "Sóc estudiant amb poc pressupost"),
+    ('different', "I am retired and want doctors nearby", "I am retired and want doctors far away"),
+    ('different', "Jubilat, vull metges a prop", "Jubilat, vull metges lluny"),
+    ('different', "Vull un pis molt car", "Vull un pis poc car"),
+    ('different', "Tinc molt pressupost", "Tinc poc pressupost"),
+    ('different', "Família amb fills petits", "Família amb fills grans"),
+    ('different', "Vull viure a prop del metro", "Vull viure lluny del metro"),
+    # Sentit diferent sense negació: el llindar ha de separar-los
+    ('different', "Som una família amb fills, volem parcs", "Som una família amb fills, volem bars i festa"),
+    ('different', "Estudiant universitari, em moc en metro", "Estudiant universitari, em moc en cotxe"),
+    ('different', "Jubilat, vull silenci", "Jubilat, vull vida social"),
+    ('different', "Programador en remot, necessito fibra", "Programador en remot, necessito muntanya"),
+    ('different', "Sóc inversor i busco luxe", "Sóc estudiant i busco un pis barat"),
+    ('different', "Tinc un gos i vull parcs", "Tinc un gos i vull metro"),
+    ('different', "Busco un pis amb metro a prop", "Busco un pis amb hospital a prop"),
+    ('different', "Vull viure al centre ciutat amb festa", "Vull viure a la muntanya amb silenci"),
+]
+
+THRESHOLDS = [0.8, 0.85, 0.9, 0.92, 0.93, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99]
+
+
+def score_pairs(pairs=PAIRS):
+    """Similitud de cada parell i si la cache el pot servir (mateixes negacions, modificadors no oposats)."""
+    results = []
+    for label, first, second in pairs:
+        (a, negations_a, modifiers_a), (b, negations_b, modifiers_b) = analyze(first), analyze(second)
+        results.append({
+            'label': label,
+            'first': first,
+            'second': second,
+            'similarity': round(float(a @ b), 4),
+            'same_negations': negations_a == negations_b,
+            'same_modifiers': not modifiers_conflict(modifiers_a, modifiers_b)
+        })
+    return results
+
+
+def evaluate(results, threshold):
+    """Encerts falsos i perduts amb un llindar (amb la mateixa regla que SemanticCache.lookup)."""
+    false_hits = missed = 0
+    for result in results:
+        hit = result['similarity'] >= threshold and result['same_negations'] and result['same_modifiers']
+        if hit and result['label'] == 'different':
+            false_hits += 1
+        elif not hit and result['label'] == 'same':
+            missed += 1
+    return {'threshold': threshold, 'false_hits': false_hits, 'missed': missed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Llindar de la cache semàntica amb parells etiquetats')
+    parser.add_argument('--verbose', action='store_true', help='Mostra la similitud de cada parell')
+    parser.add_argument('--json', help='Desa els resultats en aquest fitxer JSON')
+    args = parser.parse_args()
+
+    results = score_pairs()
+    if args.verbose:
+        for result in results:
+            flag = '' if result['same_negations'] else '  (negacions diferents)'
+            flag += '' if result['same_modifiers'] else '  (modificadors oposats)'
+            print(f"{result['label']:9} {result['similarity']:.3f}  {result['first']!r} / {result['second']!r}{flag}")
+        print()
+
+    same = sum(result['label'] == 'same' for result in results)
+    different = len(results) - same
+    table = [evaluate(results, threshold) for threshold in THRESHOLDS]
+    print(f"{'llindar':>8} {'encerts falsos':>15} {'encerts perduts':>16}")
+    for row in table:
+        print(f"{row['threshold']:>8.2f} {row['false_hits']:>11}/{different} {row['missed']:>12}/{same}")
+
+    closest_different = max(result['similarity'] for result in results
+                            if result['label'] == 'different' and result['same_negations']
+                            and result['same_modifiers'])
+    farthest_same = min(result['similarity'] for result in results if result['label'] == 'same')
+    recommended = None
+    if closest_different < farthest_same:
+        recommended = round((closest_different + farthest_same) / 2, 2)
+    print(f"\n'different' més semblant: {closest_different:.3f}   'same' menys semblant: {farthest_same:.3f}")
+    print(f"Llindar recomanat: {recommended}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'pairs': results, 'thresholds': table, 'recommended': recommended}, f, indent=2,
+                      ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
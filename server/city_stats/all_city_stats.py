@@ -34,6 +34,7 @@ and return the results in a JSON-serializable format.
 """
 
 import json
+import logging
 from typing import List, Dict, Any
 
 
@@ -231,6 +232,7 @@ def save_crime_matrix_json(
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
     #(nx=5, ny=5, max_records_per_parcel=10, as_json=True)
     save_crime_matrix_json(nx=4, ny=4, max_records_per_parcel=10)
     
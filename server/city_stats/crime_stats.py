@@ -1,8 +1,11 @@
 import requests
 import json
+import logging
 import time
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 # Base URL for the LA City Data Portal (Socrata Open Data API)
 BASE_URL = "https://data.lacity.org/resource"
@@ -51,20 +54,20 @@ def fetch_la_data(resource_id: str, params: dict, max_retries: int = 3):
 
         except requests.exceptions.HTTPError as e:
             # Handle specific HTTP error codes (4xx or 5xx)
-            print(f"HTTP Error on attempt {attempt + 1}: {e}")
-            print(f"Response content: {response.text}")
+            logger.error(f"HTTP Error on attempt {attempt + 1}: {e}")
+            logger.info(f"Response content: {response.text}")
             return None 
             
         except requests.exceptions.RequestException as e:
             # Handle network/connection errors (Timeout, ConnectionError, etc.)
-            print(f"Request failed on attempt {attempt + 1}: {e}")
+            logger.error(f"Request failed on attempt {attempt + 1}: {e}")
             if attempt < max_retries - 1:
                 # Exponential backoff before retrying
                 sleep_time = 2 ** attempt
-                print(f"Retrying in {sleep_time} seconds seconds...")
+                logger.info(f"Retrying in {sleep_time} seconds seconds...")
                 time.sleep(sleep_time)
             else:
-                print("Max retries reached. Giving up.")
+                logger.warning("Max retries reached. Giving up.")
                 return None
     return None
 
@@ -127,7 +130,7 @@ def get_paginated_crimes(max_records: int = 10000, bounds: dict = None):
     if bounds:
         filter_description += " AND Within Bounding Box"
     
-    print(f"\n--- Running Paginated Query: {filter_description} (Max {max_records} Records) ---")
+    logger.info(f"--- Running Paginated Query: {filter_description} (Max {max_records} Records) ---")
 
     for offset in range(0, max_records, SODA_MAX_LIMIT):
         query_params = {
@@ -137,16 +140,16 @@ def get_paginated_crimes(max_records: int = 10000, bounds: dict = None):
             "$order": "date_occ DESC"
         }
 
-        print(f"Fetching page at offset: {offset}...")
+        logger.info(f"Fetching page at offset: {offset}...")
         
         page_data = fetch_la_data(RESOURCE_ID, query_params)
         
         if page_data is None:
-            print("Stopping due to API error on this page.")
+            logger.warning("Stopping due to API error on this page.")
             break
 
         if not page_data:
-            print("Reached the end of the available data.")
+            logger.info("Reached the end of the available data.")
             break
             
         all_data.extend(page_data)
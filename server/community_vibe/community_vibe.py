@@ -10,12 +10,15 @@ Combina datos de:
 import requests
 import pandas as pd
 import json
+import logging
 import time
 from pathlib import Path
 from datetime import datetime, timedelta
 import os
 from typing import Dict, List, Tuple
 
+logger = logging.getLogger(__name__)
+
 # Configuración de coordenadas (LA bounding box)
 BOUND_W = -118.6057  # West Longitude
 BOUND_E = -118.1236  # East Longitude
@@ -61,7 +64,7 @@ def query_yelp_for_cell(lat: float, lon: float, radius: int = 1000) -> Dict:
         Dict con métricas: avg_price, trendy_ratio, review_density, total_businesses
     """
     if not YELP_API_KEY:
-        print("WARNING: YELP_API_KEY no configurada")
+        logger.warning("YELP_API_KEY no configurada")
         return {
             'avg_price': 0,
             'trendy_ratio': 0,
@@ -128,7 +131,7 @@ def query_yelp_for_cell(lat: float, lon: float, radius: int = 1000) -> Dict:
         }
         
     except requests.exceptions.RequestException as e:
-        print(f"Error consultando Yelp para ({lat}, {lon}): {e}")
+        logger.error(f"Error consultando Yelp para ({lat}, {lon}): {e}")
         return {
             'avg_price': 0,
             'trendy_ratio': 0,
@@ -141,7 +144,7 @@ def download_ladbs_permits() -> pd.DataFrame:
     Descarga permisos de construcción de LADBS (últimos 2 años)
     Filtra por valuación > $20,000 y tipos relevantes
     """
-    print("Descargando permisos de construcción de LADBS...")
+    logger.info("Descargando permisos de construcción de LADBS...")
     
     # Fecha de hace 2 años
     two_years_ago = (datetime.now() - timedelta(days=730)).strftime('%Y-%m-%dT%H:%M:%S')
@@ -162,7 +165,7 @@ def download_ladbs_permits() -> pd.DataFrame:
         df = pd.DataFrame(data)
         
         if df.empty:
-            print("No se encontraron permisos")
+            logger.warning("No se encontraron permisos")
             return df
         
         # Convertir lat/lon a float
@@ -181,12 +184,12 @@ def download_ladbs_permits() -> pd.DataFrame:
         if 'permit_type' in df.columns:
             df = df[df['permit_type'].isin(relevant_types)]
         
-        print(f"Permisos filtrados: {len(df)}")
+        logger.info(f"Permisos filtrados: {len(df)}")
         
         return df
         
     except Exception as e:
-        print(f"Error descargando permisos LADBS: {e}")
+        logger.error(f"Error descargando permisos LADBS: {e}")
         return pd.DataFrame()
 
 def assign_permit_to_cell(lat: float, lon: float) -> Tuple[int, int]:
@@ -241,7 +244,7 @@ def create_community_vibe_matrix_20x20():
     Genera la matriz 20x20 del índice de vibra comunitaria
     Combina datos de Yelp y LADBS
     """
-    print("\n=== Generando Community Vibe Matrix 20x20 ===\n")
+    logger.info("=== Generando Community Vibe Matrix 20x20 ===")
     
     # Paso 1: Descargar permisos de construcción
     permits_df = download_ladbs_permits()
@@ -259,7 +262,7 @@ def create_community_vibe_matrix_20x20():
             current += 1
             lat, lon = get_cell_center(i, j)
             
-            print(f"[{current}/{total_cells}] Procesando celda ({i}, {j}) - Centro: ({lat:.4f}, {lon:.4f})")
+            logger.info(f"[{current}/{total_cells}] Procesando celda ({i}, {j}) - Centro: ({lat:.4f}, {lon:.4f})")
             
             # Obtener datos de Yelp
             yelp_data = query_yelp_for_cell(lat, lon)
@@ -291,7 +294,7 @@ def create_community_vibe_matrix_20x20():
             for j in range(20):
                 matrix[i][j] = matrix[i][j] / max_score
     
-    print(f"\n✓ Matriz generada. Score máximo: {max_score:.2f}")
+    logger.info(f"Matriz generada. Score máximo: {max_score:.2f}")
     
     return matrix, max_score
 
@@ -329,10 +332,11 @@ def save_community_vibe_json():
     with out_path.open("w", encoding="utf-8") as fh:
         json.dump(obj, fh, indent=2, ensure_ascii=False)
     
-    print(f"\n✓ JSON guardado en: {out_path}")
+    logger.info(f"JSON guardado en: {out_path}")
     return out_path
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
     print("""
     ╔══════════════════════════════════════════════════════════════╗
     ║  Community Vibe Index Generator                              ║
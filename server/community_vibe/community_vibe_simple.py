@@ -9,9 +9,12 @@ permisos de construcción recientes (últimos 2 años).
 import requests
 import pandas as pd
 import json
+import logging
 from pathlib import Path
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 # Configuración de coordenadas
 BOUND_W = -118.6057
 BOUND_E = -118.1236
@@ -37,7 +40,7 @@ def assign_to_cell(lat: float, lon: float):
 
 def download_and_process_permits():
     """Descarga permisos y calcula inversión por celda"""
-    print("Descargando permisos de LADBS (esto puede tardar 1-2 minutos)...")
+    logger.info("Descargando permisos de LADBS (esto puede tardar 1-2 minutos)...")
     
     two_years_ago = (datetime.now() - timedelta(days=730)).strftime('%Y-%m-%dT%H:%M:%S')
     
@@ -63,7 +66,7 @@ def download_and_process_permits():
                 break
             
             all_permits.extend(data)
-            print(f"  Descargados {len(all_permits)} permisos...")
+            logger.info(f"  Descargados {len(all_permits)} permisos...")
             
             if len(data) < limit:
                 break
@@ -71,11 +74,11 @@ def download_and_process_permits():
             offset += limit
             
         except Exception as e:
-            print(f"Error: {e}")
+            logger.error(f"{e}")
             break
     
     if not all_permits:
-        print("No se encontraron permisos")
+        logger.warning("No se encontraron permisos")
         return {}
     
     df = pd.DataFrame(all_permits)
@@ -88,9 +91,9 @@ def download_and_process_permits():
     df = df.dropna(subset=['latitude', 'longitude', 'valuation'])
     df = df[df['valuation'] > 20000]  # Solo permisos > $20k
     
-    print(f"\nPermisos válidos después de filtrar: {len(df)}")
-    print(f"Inversión total: ${df['valuation'].sum():,.0f}")
-    print(f"Promedio por permiso: ${df['valuation'].mean():,.0f}")
+    logger.info(f"Permisos válidos después de filtrar: {len(df)}")
+    logger.info(f"Inversión total: ${df['valuation'].sum():,.0f}")
+    logger.info(f"Promedio por permiso: ${df['valuation'].mean():,.0f}")
     
     # Agrupar por celda
     cell_investments = {}
@@ -101,19 +104,19 @@ def download_and_process_permits():
             key = (i, j)
             cell_investments[key] = cell_investments.get(key, 0) + row['valuation']
     
-    print(f"\nCeldas con inversión: {len(cell_investments)}")
+    logger.info(f"Celdas con inversión: {len(cell_investments)}")
     
     # Normalizar
     if cell_investments:
         max_inv = max(cell_investments.values())
         cell_investments = {k: v/max_inv for k, v in cell_investments.items()}
-        print(f"Inversión máxima en una celda: ${max_inv:,.0f}")
+        logger.info(f"Inversión máxima en una celda: ${max_inv:,.0f}")
     
     return cell_investments
 
 def create_simple_matrix():
     """Genera matriz 20x20 basada solo en permisos"""
-    print("\n=== Community Vibe Matrix (LADBS Only) ===\n")
+    logger.info("=== Community Vibe Matrix (LADBS Only) ===")
     
     investments = download_and_process_permits()
     
@@ -155,8 +158,9 @@ def save_json():
     with out_path.open("w", encoding="utf-8") as fh:
         json.dump(obj, fh, indent=2, ensure_ascii=False)
     
-    print(f"\n✓ JSON guardado en: {out_path}")
-    print("\n✓ Listo para integrarse en app.py (índice 10)")
+    logger.info(f"JSON guardado en: {out_path}")
+    logger.info("Listo para integrarse en app.py (índice 10)")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
     save_json()
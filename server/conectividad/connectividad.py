@@ -1,9 +1,12 @@
 import h3
 import pandas as pd
 import json
+import logging
 from pathlib import Path
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # Configuración de coordenadas (igual que en crime_stats)
 BOUND_W = -118.6057  # West Longitude
 BOUND_E = -118.1236  # East Longitude
@@ -15,16 +18,16 @@ def load_and_process_connectivity_data(csv_path):
     Carga el CSV de conectividad y filtra por condado de LA (FIPS 6037).
     Convierte H3 a coordenadas lat/lon.
     """
-    print("Cargando datos de conectividad...")
+    logger.info("Cargando datos de conectividad...")
     df = pd.read_csv(csv_path)
     
     # Filtrar condado de LA (FIPS 06037)
     df = df[df['block_geoid'].astype(str).str.startswith('6037')]
-    print(f"Registros en condado LA: {len(df)}")
+    logger.info(f"Registros en condado LA: {len(df)}")
     
     # Filtrar solo fibra de alta velocidad (>= 100 Mbps)
     df = df[df['max_advertised_download_speed'] >= 100]
-    print(f"Registros con velocidad >= 100 Mbps: {len(df)}")
+    logger.info(f"Registros con velocidad >= 100 Mbps: {len(df)}")
     
     # Convertir H3 a Lat/Lon
     df['lat'] = df['h3_res8_id'].apply(lambda x: h3.cell_to_latlng(x)[0])
@@ -35,7 +38,7 @@ def load_and_process_connectivity_data(csv_path):
         (df['lat'] >= BOUND_S) & (df['lat'] <= BOUND_N) &
         (df['lon'] >= BOUND_W) & (df['lon'] <= BOUND_E)
     ]
-    print(f"Registros dentro del área objetivo: {len(df)}")
+    logger.info(f"Registros dentro del área objetivo: {len(df)}")
     
     return df
 
@@ -53,7 +56,7 @@ def create_connectivity_matrix_20x20(df):
     horizontal_step = lon_span / 20
     vertical_step = lat_span / 20
     
-    print("\nProcesando matriz 20x20...")
+    logger.info("Procesando matriz 20x20...")
     
     # Asignar cada punto a una celda
     for idx, row in df.iterrows():
@@ -88,7 +91,7 @@ def create_connectivity_matrix_20x20(df):
         normalized_row = [val / max_speed if max_speed > 0 else 0.0 for val in row]
         normalized_matrix.append(normalized_row)
     
-    print(f"Velocidad máxima encontrada: {max_speed} Mbps")
+    logger.info(f"Velocidad máxima encontrada: {max_speed} Mbps")
     
     return normalized_matrix, vertical_step, horizontal_step, max_speed
 
@@ -102,7 +105,7 @@ def save_connectivity_matrix_json(nx=20, ny=20):
     df = load_and_process_connectivity_data(csv_path)
     
     if len(df) == 0:
-        print("Error: No hay datos después del filtrado")
+        logger.error("No hay datos después del filtrado")
         return None
     
     # Crear matriz
@@ -130,8 +133,9 @@ def save_connectivity_matrix_json(nx=20, ny=20):
     with out_path.open("w", encoding="utf-8") as fh:
         json.dump(obj, fh, indent=2, ensure_ascii=False)
     
-    print(f"\n✓ JSON guardado en: {out_path}")
+    logger.info(f"JSON guardado en: {out_path}")
     return out_path
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
     save_connectivity_matrix_json()
\ No newline at end of file
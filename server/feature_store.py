@@ -0,0 +1,157 @@
+"""
+Magatzem immutable de les dades de la ciutat i recàrrega en calent.
+
+Un FeatureStore agrupa tot el que es deriva de les capes (matriu unificada,
+informació de cada capa, piràmide del mapa de calor i versió del dataset).
+No es modifica mai: per recarregar se'n construeix un de nou i se substitueix
+la referència global, de manera que les peticions en curs continuen amb l'antic.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from heatmap_pyramid import build_pyramid
+from layers import JSON_DIR, LAYERS, load_layers
+
+logger = logging.getLogger(__name__)
+
+
+def compute_dataset_version(features, info):
+    """
+    Versió del dataset: hash del contingut de la matriu i de la informació de les capes.
+    Les caches de respostes s'indexen per aquesta versió.
+    """
+    digest = hashlib.sha256(np.ascontiguousarray(features).tobytes())
+    digest.update(json.dumps(info, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class FeatureStore:
+    """
+    Instantània de només lectura de totes les capes carregades.
+
+    Si es carrega des d'una instantània binària (snapshot.py), la versió i la
+    piràmide ja vénen calculades i els arrays poden ser memory-mapped.
+    """
+
+    def __init__(self, features, data_info, version=None, pyramid=None):
+        features = np.asarray(features, dtype=float)
+        features.setflags(write=False)
+        self.features = features
+        self.data_info = data_info
+        self.version = version or compute_dataset_version(features, data_info)
+        self.loaded_at = time.time()
+        # Piràmide per al mapa de calor
+        self.pyramid = pyramid if pyramid is not None else build_pyramid(features)
+        for level in self.pyramid:
+            level.setflags(write=False)
+        self._matrix = None
+
+    @property
+    def matrix(self):
+        """Matriu com a llistes Python niades (per a la resposta JSON), calculada sota demanda."""
+        if self._matrix is None:
+            self._matrix = self.features.tolist()
+        return self._matrix
+
+    def failed_layers(self):
+        """Noms de les capes que no s'han pogut carregar."""
+        return [name for name, info in self.data_info.items() if not info.get('success')]
+
+
+def build_feature_store(json_dir=JSON_DIR):
+    """Carrega totes les capes i construeix un FeatureStore nou."""
+    features, data_info = load_layers(json_dir)
+    return FeatureStore(features, data_info)
+
+
+# Fitxer del directori de capes que /api/admin/reload reescriu perquè els vigilants
+# de tots els workers recarreguin (forma part de layers_signature, no de layers_digest)
+RELOAD_MARKER = '.reload'
+
+
+def layers_signature(json_dir=JSON_DIR, layers=LAYERS):
+    """
+    Empremta dels fitxers de capes (nom, mida i data de modificació) i de RELOAD_MARKER.
+    Canvia quan s'afegeix, s'elimina o es reescriu algun fitxer.
+    """
+    paths = [path for layer in layers for path in sorted(Path(json_dir).glob(layer['glob']))]
+    signature = []
+    for path in paths + [Path(json_dir) / RELOAD_MARKER]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        signature.append((path.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def request_reload(json_dir=JSON_DIR):
+    """Reescriu RELOAD_MARKER: els LayerWatcher dels altres processos recarregaran les capes."""
+    path = Path(json_dir) / RELOAD_MARKER
+    tmp = path.with_name(f'{RELOAD_MARKER}.{os.getpid()}.tmp')
+    tmp.write_text(f'{time.time()} {os.getpid()}\n', encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def layers_digest(json_dir=JSON_DIR, layers=LAYERS):
+    """
+    Empremta del contingut dels fitxers de capes (nom i sha256).
+    A diferència de layers_signature no canvia amb un checkout o una còpia que només
+    toca les dates de modificació.
+    """
+    digest = []
+    for layer in layers:
+        for path in sorted(Path(json_dir).glob(layer['glob'])):
+            try:
+                content = path.read_bytes()
+            except FileNotFoundError:
+                continue
+            digest.append((path.name, hashlib.sha256(content).hexdigest()))
+    return tuple(digest)
+
+
+class LayerWatcher(threading.Thread):
+    """
+    Fil que vigila el directori de capes i crida on_change quan els fitxers canvien.
+
+    Espera que l'empremta sigui estable durant dues comprovacions seguides per no
+    recarregar un fitxer a mig escriure.
+    """
+
+    def __init__(self, on_change, interval=5.0, json_dir=JSON_DIR):
+        super().__init__(name='layer-watcher', daemon=True)
+        self.on_change = on_change
+        self.interval = interval
+        self.json_dir = json_dir
+        self.current = layers_signature(json_dir)
+        self._stop_event = threading.Event()
+
+    def acknowledge(self):
+        """El procés ja ha recarregat pel seu compte: l'empremta actual no és un canvi."""
+        self.current = layers_signature(self.json_dir)
+
+    def run(self):
+        pending = None
+        while not self._stop_event.wait(self.interval):
+            signature = layers_signature(self.json_dir)
+            if signature == self.current:
+                pending = None
+            elif signature == pending:
+                self.current = signature
+                pending = None
+                try:
+                    self.on_change()
+                except Exception as e:
+                    logger.exception("Error recarregant capes: %s", e)
+            else:
+                pending = signature
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,55 @@
+"""
+Configuració de gunicorn per a producció (workers pre-forked).
+
+Ús (des del directori server/):
+    gunicorn -c gunicorn.conf.py app:app
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+Les capes es carreguen al procés mestre abans del fork (preload_app), de manera
+que tots els workers comparteixen les mateixes pàgines de memòria (copy-on-write;
+amb una instantània de snapshot.py, a més, mmap compartit).
+
+Variables d'entorn:
+    GUNICORN_BIND              Adreça d'escolta (per defecte 0.0.0.0:5000)
+    WEB_CONCURRENCY            Nombre de workers (per defecte, nombre de CPUs)
+    GUNICORN_WORKER_CLASS      Tipus de worker (per defecte gthread; uvicorn.workers.UvicornWorker per a asgi:app)
+    GUNICORN_THREADS           Fils per worker per a les crides lentes a la LLM (per defecte 4)
+    GUNICORN_TIMEOUT           Segons abans de matar un worker bloquejat (per defecte 120)
+    GUNICORN_GRACEFUL_TIMEOUT  Segons per acabar les peticions en curs en reiniciar (per defecte 30)
+    GUNICORN_MAX_REQUESTS      Reciclar cada worker després de N peticions (0 = mai)
+"""
+import multiprocessing
+import os
+
+# Un sol fil de BLAS per worker: el paral·lelisme ve dels workers, no de NumPy
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+# Carregar l'aplicació (i les capes) abans de fer el fork dels workers
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """
+    Els fils no sobreviuen al fork: cada worker inicia el seu propi vigilant de capes
+    (si LAYER_WATCH_INTERVAL > 0) perquè tots recarreguin quan canvien els JSON.
+    Els workers ASGI (asgi:app) l'inicien des del seu lifespan.
+    """
+    if 'uvicorn' in worker_class:
+        return
+    from app import start_layer_watcher
+    start_layer_watcher()
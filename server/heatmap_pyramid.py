@@ -0,0 +1,119 @@
+"""
+Piràmide multiresolució de la matriu de característiques de la ciutat.
+
+Cada nivell és una graella quadrada (20x20 -> 80x80 -> 320x320) construïda a partir
+de la matriu base. Quan el nivell és més gruixut que la base es fa la mitjana per
+blocs; quan és més fi s'interpola bilinealment entre centres de cel·la. El mapa de
+calor només es calcula per a les cel·les del nivell i del viewport que demana el client.
+"""
+import math
+import numpy as np
+
+# Mides dels nivells de la piràmide (cel·les per costat)
+PYRAMID_SIZES = (20, 80, 320)
+
+# Mida d'una tessel·la en cel·les; les finestres s'ajusten a múltiples d'aquesta mida
+TILE_SIZE = 20
+
+# Zoom de Leaflet on el nivell 0 omple la pantalla. Cada 2 nivells de zoom el viewport
+# es redueix 4x per costat, el mateix factor que hi ha entre nivells consecutius.
+BASE_ZOOM = 10
+ZOOM_STEPS_PER_LEVEL = 2
+
+
+def _block_mean(features, size):
+    """Agrega la graella fent la mitjana de blocs quadrats."""
+    rows, cols = features.shape[:2]
+    fr, fc = rows // size, cols // size
+    blocks = features[:size * fr, :size * fc].reshape(size, fr, size, fc, -1)
+    return blocks.mean(axis=(1, 3))
+
+
+def _interpolate_axis(features, size, axis):
+    """Interpolació lineal entre centres de cel·la al llarg d'un eix."""
+    n = features.shape[axis]
+    positions = np.clip((np.arange(size) + 0.5) * n / size - 0.5, 0, n - 1)
+    low = np.floor(positions).astype(int)
+    high = np.minimum(low + 1, n - 1)
+    shape = [1] * features.ndim
+    shape[axis] = size
+    t = (positions - low).reshape(shape)
+    return np.take(features, low, axis=axis) * (1 - t) + np.take(features, high, axis=axis) * t
+
+
+def resample_grid(features, size):
+    """
+    Retorna la graella de característiques (rows, cols, n) remostrejada a size x size.
+    """
+    rows, cols = features.shape[:2]
+    if rows == size and cols == size:
+        return features
+    if size < rows and rows % size == 0 and cols % size == 0:
+        return _block_mean(features, size)
+    resampled = _interpolate_axis(features, size, axis=0)
+    return _interpolate_axis(resampled, size, axis=1)
+
+
+def build_pyramid(features, sizes=PYRAMID_SIZES):
+    """
+    Construeix tots els nivells de la piràmide a partir de la matriu base.
+
+    Retorna una llista d'arrays (size, size, n), del més gruixut al més fi.
+    """
+    features = np.asarray(features, dtype=float)
+    return [resample_grid(features, size) for size in sizes]
+
+
+def level_for_zoom(zoom, levels=len(PYRAMID_SIZES)):
+    """Tria el nivell de la piràmide adequat per a un zoom de Leaflet."""
+    level = (int(zoom) - BASE_ZOOM) // ZOOM_STEPS_PER_LEVEL
+    return max(0, min(levels - 1, level))
+
+
+def viewport_window(size, rectangle, viewport=None, tile_size=TILE_SIZE):
+    """
+    Calcula la finestra de cel·les d'un nivell que cobreix el viewport del client.
+
+    Args:
+        size: Cel·les per costat del nivell
+        rectangle: Límits de la graella completa {'north', 'south', 'east', 'west'}
+        viewport: Límits visibles al client (mateix format) o None per a tota la graella
+        tile_size: La finestra s'arrodoneix a tessel·les d'aquesta mida
+
+    Retorna (row_start, row_end, col_start, col_end) o None si el viewport no toca la graella.
+    """
+    if viewport is None:
+        return 0, size, 0, size
+
+    vertical_step = (rectangle['north'] - rectangle['south']) / size
+    horizontal_step = (rectangle['east'] - rectangle['west']) / size
+
+    # i va de nord a sud, j va d'oest a est
+    row_start = math.floor((rectangle['north'] - viewport['north']) / vertical_step)
+    row_end = math.ceil((rectangle['north'] - viewport['south']) / vertical_step)
+    col_start = math.floor((viewport['west'] - rectangle['west']) / horizontal_step)
+    col_end = math.ceil((viewport['east'] - rectangle['west']) / horizontal_step)
+
+    tile = min(tile_size, size)
+    row_start = max(0, (row_start // tile) * tile)
+    col_start = max(0, (col_start // tile) * tile)
+    row_end = min(size, math.ceil(row_end / tile) * tile)
+    col_end = min(size, math.ceil(col_end / tile) * tile)
+
+    if row_start >= row_end or col_start >= col_end:
+        return None
+
+    return row_start, row_end, col_start, col_end
+
+
+def window_rectangle(size, rectangle, window):
+    """Límits geogràfics d'una finestra (row_start, row_end, col_start, col_end)."""
+    row_start, row_end, col_start, col_end = window
+    vertical_step = (rectangle['north'] - rectangle['south']) / size
+    horizontal_step = (rectangle['east'] - rectangle['west']) / size
+    return {
+        'north': rectangle['north'] - row_start * vertical_step,
+        'south': rectangle['north'] - row_end * vertical_step,
+        'west': rectangle['west'] + col_start * horizontal_step,
+        'east': rectangle['west'] + col_end * horizontal_step
+    }
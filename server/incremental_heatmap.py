@@ -0,0 +1,245 @@
+"""
+Recàlcul incremental del mapa de calor quan l'usuari mou un sol control.
+
+Per a cada sessió es guarden, per cel·la, les sumes de les quals depenen els
+mètodes de similitud (producte escalar, distàncies al quadrat i absoluta). Quan
+canvia una component del vector només cal la columna d'aquella característica:
+l'actualització és O(cel·les) en lloc d'O(cel·les × 11), i la similitud surt de
+les sumes sense tornar a recórrer el vector.
+
+La sessió també recorda què té el client (la darrera graella enviada, tal com
+la descodifica) per respondre només amb les cel·les que han canviat. Cada
+resposta porta un seq '<prefix>.<n>' amb un prefix aleatori per sessió: amb
+diversos workers (o després d'un reinici) cada un té la seva sessió en memòria,
+i un seq d'una altra no pot coincidir mai amb el de la que rep la petició.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from similarity import WEIGHTS
+
+# Cada quantes actualitzacions incrementals es recalculen les sumes des de zero
+# (limita l'error acumulat de coma flotant)
+RESYNC_UPDATES = 256
+
+
+class IncrementalSimilarity:
+    """
+    Sumes acumulades d'un vector contra un bloc fix de cel·les.
+
+    Args:
+        cells: Array (..., n) de cel·les (la finestra del nivell de la piràmide)
+        vector: Vector de preferències inicial
+    """
+
+    def __init__(self, cells, vector):
+        cells = np.asarray(cells, dtype=float)
+        self.shape = cells.shape[:-1]
+        self.cells = cells.reshape(-1, cells.shape[-1])
+        self.n = self.cells.shape[1]
+        self.vector = np.array(vector, dtype=float)
+        self._sums = {}
+        self._cell_stats = {}
+        self.updates = 0
+
+    def _cell_stat(self, name):
+        """Constants per cel·la (normes i mitjanes), calculades una sola vegada."""
+        stat = self._cell_stats.get(name)
+        if stat is None:
+            if name == 'norm':
+                stat = np.linalg.norm(self.cells, axis=1)
+            elif name == 'mean':
+                stat = self.cells.mean(axis=1)
+            else:  # 'centered_norm'
+                stat = np.linalg.norm(self.cells - self._cell_stat('mean')[:, None], axis=1)
+            self._cell_stats[name] = stat
+        return stat
+
+    def _full_sum(self, name):
+        v = self.vector
+        if name == 'dot':
+            return self.cells @ v
+        if name == 'sq':
+            return ((self.cells - v) ** 2).sum(axis=1)
+        if name == 'wsq':
+            return (((self.cells - v) ** 2) * WEIGHTS).sum(axis=1)
+        return np.abs(self.cells - v).sum(axis=1)  # 'abs'
+
+    def _sum(self, name):
+        sums = self._sums.get(name)
+        if sums is None:
+            sums = self._sums[name] = self._full_sum(name)
+        return sums
+
+    def set_vector(self, vector):
+        """
+        Passa al vector nou actualitzant les sumes component a component.
+
+        Si canvien més de la meitat de les components (o toca resincronitzar) les
+        sumes es descarten i es recalculen quan calguin. Retorna el nombre de
+        components que han canviat.
+        """
+        new = np.array(vector, dtype=float)
+        changed = np.flatnonzero(new != self.vector)
+        if len(changed) == 0:
+            return 0
+        if len(changed) > self.n // 2 or self.updates + len(changed) > RESYNC_UPDATES:
+            self.vector = new
+            self._sums.clear()
+            self.updates = 0
+            return len(changed)
+
+        for i in changed:
+            old, value = self.vector[i], new[i]
+            column = self.cells[:, i]
+            delta = value - old
+            for name, sums in self._sums.items():
+                if name == 'dot':
+                    sums += delta * column
+                elif name == 'sq':
+                    sums += delta * (value + old - 2.0 * column)
+                elif name == 'wsq':
+                    sums += WEIGHTS[i] * delta * (value + old - 2.0 * column)
+                else:
+                    sums += np.abs(value - column) - np.abs(old - column)
+            self.vector[i] = value
+        self.updates += len(changed)
+        return len(changed)
+
+    def similarity(self, method='cosine'):
+        """Mapa de calor (forma de la graella) amb les mateixes fórmules que similarity.py."""
+        v = self.vector
+        n = self.n
+
+        if method == 'ml':
+            similarity = np.exp(-np.maximum(self._sum('sq'), 0.0) / n / (2 * 0.3 ** 2))
+        elif method == 'manhattan':
+            similarity = 1.0 - self._sum('abs') / float(n)
+        elif method == 'weighted':
+            similarity = np.exp(-np.maximum(self._sum('wsq'), 0.0) / np.sum(WEIGHTS) / 0.2)
+        elif method == 'pearson':
+            # Covariància sense centrar el vector: sum(v·c) - sum(v)·mitjana(c)
+            v_norm = np.linalg.norm(v - v.mean())
+            c_norm = self._cell_stat('centered_norm')
+            covariance = self._sum('dot') - v.sum() * self._cell_stat('mean')
+            with np.errstate(divide='ignore', invalid='ignore'):
+                correlation = covariance / (v_norm * c_norm)
+            similarity = np.where((v_norm > 0) & (c_norm > 0), (correlation + 1) / 2, 0.0)
+        else:
+            v_norm = np.linalg.norm(v)
+            c_norm = self._cell_stat('norm')
+            with np.errstate(divide='ignore', invalid='ignore'):
+                similarity = self._sum('dot') / (v_norm * c_norm)
+            similarity = np.where((v_norm > 0) & (c_norm > 0), similarity, 0.0)
+
+        return np.clip(similarity, 0.0, 1.0).reshape(self.shape)
+
+
+class HeatmapSession:
+    """Estat incremental i vista del client d'una sessió."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.block_key = None
+        self.incremental = None
+        self.view_key = None
+        self.view = None
+        self.prefix = secrets.token_hex(8)
+        self.counter = 0
+        self.seq = f'{self.prefix}.0'
+        self.last_used = time.monotonic()
+
+    def heatmap(self, block_key, cells, vector, method):
+        """
+        Mapa de calor del vector sobre les cel·les; reutilitza les sumes si el bloc
+        (versió, nivell, finestra) és el mateix de la petició anterior.
+        """
+        if self.block_key != block_key:
+            self.block_key = block_key
+            self.incremental = IncrementalSimilarity(cells, vector)
+        else:
+            self.incremental.set_vector(vector)
+        return self.incremental.similarity(method)
+
+    def changed_cells(self, view_key, grid, since, epsilon):
+        """
+        Índexs (plans) de les cel·les on la graella difereix més d'epsilon del que
+        té el client, o None si el client no té una vista vàlida (seq diferent,
+        una altra finestra o mètode) o si el delta no surt a compte.
+        """
+        if self.view is None or view_key != self.view_key or str(since) != self.seq:
+            return None
+        indices = np.flatnonzero(np.abs(grid.ravel() - self.view) > epsilon)
+        # Índex (4 bytes) + valor: a partir de la meitat de cel·les no compensa
+        if len(indices) * 2 > grid.size:
+            return None
+        return indices
+
+    def remember(self, view_key, seen, indices=None):
+        """
+        Desa el que el client tindrà després de la resposta: la graella sencera
+        (indices None) o els valors nous de les cel·les del delta. Retorna el seq nou.
+        """
+        if indices is None:
+            self.view_key = view_key
+            self.view = np.array(seen, dtype=float).ravel()
+        else:
+            self.view[indices] = seen
+        self.counter += 1
+        self.seq = f'{self.prefix}.{self.counter}'
+        return self.seq
+
+
+def newest_seq(*seqs):
+    """
+    El seq més avançat d'una mateixa sessió: d'entre els que comparteixen el prefix
+    del primer vàlid, el de comptador més alt. None si no n'hi ha cap de vàlid.
+    """
+    parsed = []
+    for seq in seqs:
+        if isinstance(seq, str):
+            prefix, _, counter = seq.rpartition('.')
+            if prefix and counter.isdigit():
+                parsed.append((prefix, int(counter), seq))
+    if not parsed:
+        return None
+    prefix = parsed[0][0]
+    return max((item for item in parsed if item[0] == prefix), key=lambda item: item[1])[2]
+
+
+class HeatmapSessions:
+    """
+    Sessions incrementals en memòria, expulsades per LRU o per inactivitat.
+
+    Args:
+        max_sessions: Sessions màximes (0 desactiva el camí incremental)
+        ttl: Segons d'inactivitat abans d'expulsar una sessió
+    """
+
+    def __init__(self, max_sessions=1000, ttl=1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Sessió amb aquest id (creada si no existeix), o None si estan desactivades."""
+        if self.max_sessions <= 0 or not session_id:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or now - session.last_used > self.ttl:
+                session = self._sessions[session_id] = HeatmapSession()
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def __len__(self):
+        return len(self._sessions)
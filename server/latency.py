@@ -0,0 +1,99 @@
+"""
+Histogrames de latència en memòria.
+
+Cada histograma guarda comptadors per cubetes (per exportar-los) i una finestra
+de les últimes mostres per calcular percentils recents (p50, p95...) que fan
+servir, per exemple, les peticions duplicades a la LLM (api.py).
+
+Una petició cancel·lada abans d'acabar (la perdedora d'un duplicat) és una mostra
+censurada: només se sap que hauria trigat almenys el temps transcorregut. Entra a
+la finestra dels percentils amb aquest valor (fita inferior), però no als comptadors
+de les cubetes, que són només de crides acabades. Sense aquestes mostres la
+finestra només veuria les respostes ràpides i el p95 aniria baixant.
+"""
+import bisect
+import threading
+from collections import deque
+
+# Límits superiors de les cubetes, en segons
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+
+class LatencyHistogram:
+    """Histograma acumulatiu més finestra mòbil per a percentils."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=500):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self.censored = 0
+        self._window = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self._window.append(seconds)
+
+    def observe_censored(self, seconds):
+        """Petició cancel·lada després de `seconds` segons (la latència real és >= seconds)."""
+        with self._lock:
+            self.censored += 1
+            self._window.append(seconds)
+
+    def observe_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def percentile(self, q, min_samples=1):
+        """Percentil q (0-100) de les mostres recents, o None si n'hi ha menys de min_samples."""
+        with self._lock:
+            samples = sorted(self._window)
+        if len(samples) < max(1, min_samples):
+            return None
+        position = (len(samples) - 1) * q / 100
+        lower = int(position)
+        upper = min(lower + 1, len(samples) - 1)
+        return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+    def snapshot(self):
+        """Estat del histograma (comptadors acumulats per cubeta i percentils recents)."""
+        with self._lock:
+            cumulative = []
+            total = 0
+            for bound, count in zip(self.buckets, self.counts):
+                total += count
+                cumulative.append(['+Inf' if bound == float('inf') else bound, total])
+            snapshot = {'count': self.count, 'sum': round(self.sum, 6), 'errors': self.errors,
+                        'censored': self.censored, 'buckets': cumulative}
+        for q in (50, 95, 99):
+            value = self.percentile(q)
+            snapshot[f'p{q}'] = round(value, 4) if value is not None else None
+        return snapshot
+
+
+class LatencyRegistry:
+    """Histogrames amb nom (un per model, ruta...), creats sota demanda."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=500):
+        self.buckets = buckets
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, LatencyHistogram(self.buckets, self.window))
+        return histogram
+
+    def items(self):
+        return list(self._histograms.items())
+
+    def snapshot(self):
+        return {name: histogram.snapshot() for name, histogram in self.items()}
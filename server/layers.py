@@ -0,0 +1,151 @@
+"""
+Registre declaratiu de les capes de dades de la ciutat i carregador únic.
+
+Cada capa indica el seu nom, l'índex que ocupa dins del vector de cada cel·la,
+el patró dels fitxers JSON (s'agafa el més recent) i les claus on pot estar la
+matriu. Afegir una capa nova és afegir una entrada a LAYERS.
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Mida de la graella unificada i del vector de cada cel·la
+GRID_SIZE = 20
+VECTOR_SIZE = 11
+
+JSON_DIR = Path(__file__).parent / 'city_stats' / 'jsons'
+
+# Ordre del vector: income(0), crimes(1), connectivity(2), noise(3), walkability(4),
+# accessibility(5), wellbeing(6), mobility(7), education(8), community_vibe(9), health(10)
+#
+# edge_pad: si la matriu és més petita que la graella, es repeteix l'última fila/columna
+#           (si no, les cel·les que falten queden a 0)
+# extra:    camps addicionals del JSON que es copien a la informació de la capa
+# max_score_from_matrix: max_score és el màxim de la matriu en lloc del camp MaxScore del JSON
+LAYERS = [
+    {'name': 'income', 'index': 0, 'glob': 'income_matrix_20x20*.json',
+     'matrix_keys': ['matrix'], 'edge_pad': True},
+    {'name': 'crimes', 'index': 1, 'glob': 'crime_matrix_20x20_*.json',
+     'matrix_keys': ['CrimeMatrix'], 'edge_pad': True},
+    {'name': 'connectivity', 'index': 2, 'glob': 'connectivity_matrix_20x20_*.json',
+     'matrix_keys': ['ConnectivityMatrix'], 'edge_pad': True,
+     'extra': {'max_speed': 'MaxSpeed'}},
+    {'name': 'noise', 'index': 3, 'glob': 'noise_matrix_20x20_*.json',
+     'matrix_keys': ['NoiseMatrix'], 'edge_pad': True},
+    {'name': 'walkability', 'index': 4, 'glob': 'walkability_matrix_20x20_*.json',
+     'matrix_keys': ['WalkabilityMatrix']},
+    {'name': 'accessibility', 'index': 5, 'glob': 'accessibility_matrix_20x20_*.json',
+     'matrix_keys': ['AccessibilityMatrix']},
+    {'name': 'wellbeing', 'index': 6, 'glob': 'wellbeing_matrix_20x20_*.json',
+     'matrix_keys': ['WellbeingMatrix']},
+    {'name': 'mobility', 'index': 7, 'glob': 'mobility*.json',
+     'matrix_keys': ['MobilityMatrix']},
+    # El fitxer d'education usa 'CrimeMatrix' en lloc de 'EducationMatrix'
+    {'name': 'education', 'index': 8, 'glob': 'education_matrix_*.json',
+     'matrix_keys': ['EducationMatrix', 'CrimeMatrix']},
+    {'name': 'community_vibe', 'index': 9, 'glob': 'community_vibe_matrix_20x20_*.json',
+     'matrix_keys': ['CommunityVibMatrix'], 'max_score_from_matrix': True},
+    {'name': 'health', 'index': 10, 'glob': 'health_matrix_20x20_*.json',
+     'matrix_keys': ['HealthMatrix']},
+]
+
+
+def find_layer_file(layer, json_dir=JSON_DIR):
+    """Retorna el fitxer més recent (per nom) que encaixa amb el patró de la capa, o None."""
+    files = sorted(Path(json_dir).glob(layer['glob']))
+    return files[-1] if files else None
+
+
+def load_layer(layer, store, json_dir=JSON_DIR):
+    """
+    Carrega una capa i escriu la seva matriu a store[:, :, layer['index']].
+
+    Retorna la informació de la capa (origen, passos, dimensions...) o un error.
+    """
+    json_path = find_layer_file(layer, json_dir)
+
+    if json_path is None:
+        logger.error("No se encontró ningún archivo de %s", layer['name'])
+        return {'success': False, 'error': 'Archivo no encontrado'}
+
+    logger.info("Cargando %s", layer['name'], extra={'path': str(json_path)})
+
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            layer_data = json.load(f)[0]
+
+        raw_matrix = next(
+            (layer_data[key] for key in layer['matrix_keys'] if layer_data.get(key) is not None),
+            None
+        )
+        if raw_matrix is None:
+            raise KeyError(f"cap de les claus {layer['matrix_keys']}")
+
+        matrix = np.asarray(raw_matrix, dtype=float)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(raw_matrix), -1)
+        rows, cols = matrix.shape
+
+        # Copiar (i retallar) la matriu a la columna de la capa
+        size = store.shape[0]
+        window = matrix[:size, :size]
+        if layer.get('edge_pad') and window.size:
+            window = np.pad(window, ((0, size - window.shape[0]), (0, size - window.shape[1])), mode='edge')
+        store[:window.shape[0], :window.shape[1], layer['index']] = window
+
+        matrix_max = float(matrix.max()) if matrix.size else 1.0
+        if layer.get('max_score_from_matrix'):
+            max_score = matrix_max
+        else:
+            max_score = layer_data.get('MaxScore', matrix_max)
+
+        info = {
+            'success': True,
+            'origin': {
+                'north': layer_data.get('Norigin', 0),
+                'west': layer_data.get('WOrigin', 0)
+            },
+            'steps': {
+                'vertical': layer_data.get('VerticalStep', 0),
+                'horizontal': layer_data.get('HorizontalStep', 0)
+            },
+            'dimensions': {
+                'rows': rows,
+                'cols': cols
+            },
+            'max_score': max_score,
+            'source': json_path.name
+        }
+        for field, key in layer.get('extra', {}).items():
+            info[field] = layer_data.get(key, 1.0)
+
+        return info
+
+    except FileNotFoundError:
+        logger.error("No se encontró el archivo %s", json_path)
+        return {'success': False, 'error': 'Archivo no encontrado'}
+    except Exception as e:
+        logger.error("Error al cargar datos de %s: %s", layer['name'], e)
+        return {'success': False, 'error': str(e)}
+
+
+def load_layers(json_dir=JSON_DIR, layers=LAYERS, grid_size=GRID_SIZE, max_workers=None):
+    """
+    Carrega totes les capes en paral·lel dins d'una matriu (grid_size, grid_size, VECTOR_SIZE).
+
+    Cada capa escriu una columna diferent de la matriu, així que no cal sincronització.
+
+    Retorna (features, data_info) on data_info conté la informació de cada capa pel seu nom.
+    """
+    store = np.zeros((grid_size, grid_size, VECTOR_SIZE))
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(layers))) as pool:
+        infos = list(pool.map(lambda layer: load_layer(layer, store, json_dir), layers))
+
+    data_info = {layer['name']: info for layer, info in zip(layers, infos)}
+    return store, data_info
@@ -0,0 +1,193 @@
+"""
+Vectoritzador local (només CPU) de la descripció de l'usuari.
+
+Tradueix el text al vector d'11 preferències amb les mateixes heurístiques
+d'arquetips i regles de ponderació del prompt de sistema (SYSTEM_PROMPT_TEMPLATE
+a app.py), però amb paraules clau en lloc de la LLM. Respon en microsegons i
+retorna una confiança: el servidor només crida la LLM quan és baixa, o quan
+la LLM no està disponible fa servir aquest resultat directament.
+
+Les paraules clau es busquen com a paraules senceres dins de cada frase, i una
+paraula clau precedida d'una negació ("no tinc cotxe", "sin coche", "I don't
+have a car") no compta. Les llistes eviten paraules que en un altre idioma o com
+a nom propi volen dir una altra cosa ('car' és "costós" en català, 'pau' és un
+nom, 'cat' és l'abreviatura de català).
+"""
+import re
+import time
+import unicodedata
+
+# "Valor Base" de cada índex al prompt de sistema (índex 1 -> posició 0)
+BASE_VECTOR = [0.2, 0.5, 0.3, 0.5, 0.4, 0.0, 0.1, 0.3, 0.0, 0.3, 0.1]
+
+# Arquetips del prompt: paraules clau (català, castellà i anglès, sense accents) i
+# valors forçats per índex (1-based, com al prompt)
+ARCHETYPES = {
+    'luxe': {
+        'keywords': ['inversor', 'exclusiu', 'exclusivo', 'exclusive', 'il·limitat', 'ilimitado',
+                     'unlimited', 'premium', 'luxe', 'lujo', 'luxury', 'privacitat', 'privacidad',
+                     'privacy', 'rico', 'rich', 'mansio', 'mansion'],
+        'values': {1: 1.0, 2: 0.0, 10: 0.8}
+    },
+    'estudiant': {
+        'keywords': ['universitat', 'universidad', 'university', 'estudiant', 'estudiante',
+                     'student', 'compartir pis', 'compartir piso', 'roommate', 'barat', 'barato',
+                     'cheap', 'estalvi', 'ahorro', 'becari', 'becario', 'internship', 'poc pressupost',
+                     'poco presupuesto', 'tight budget', 'low budget'],
+        'values': {1: 0.0, 3: 0.9, 8: 0.9, 9: 1.0}
+    },
+    'familia': {
+        'keywords': ['fills', 'hijos', 'kids', 'children', 'nens', 'ninos', 'col·legi', 'col·legis',
+                     'colegio', 'colegios', 'escola', 'escoles', 'escuela', 'schools', 'parcs',
+                     'school', 'parc', 'parque', 'park', 'familia', 'family', 'tranquil·litat',
+                     'tranquilidad'],
+        'values': {2: 0.1, 4: 0.9, 9: 1.0}
+    },
+    'nomada': {
+        'keywords': ['wfh', 'remot', 'remoto', 'remote', 'programador', 'developer', 'fibra',
+                     'fiber', 'coworking', 'teletreball', 'teletrabajo', 'nomada', 'nomad',
+                     'gamer', 'freelance'],
+        'values': {3: 1.0, 5: 0.8}
+    },
+    'natura': {
+        'keywords': ['gos', 'perro', 'dog', 'gat', 'gato', 'mascota', 'pet', 'muntanya',
+                     'montana', 'mountain', 'senderisme', 'senderismo', 'hiking', 'aire lliure',
+                     'aire libre', 'outdoor', 'natura', 'naturaleza', 'nature'],
+        'values': {7: 1.0, 4: 0.8}
+    },
+    'gent_gran': {
+        'keywords': ['jubilat', 'jubilado', 'retired', 'jubilacio', 'jubilacion', 'retirement',
+                     'accessible', 'metges', 'medicos', 'doctors', 'gent gran', 'elderly',
+                     'ancia', 'anciano'],
+        'values': {6: 1.0, 11: 1.0, 4: 1.0}
+    }
+}
+
+# Regles per índex de la secció "DEFINICIÓ DELS 11 ÍNDEXS" (s'apliquen després dels arquetips)
+INDEX_RULES = [
+    (['silenci', 'silencio', 'quiet', 'silence'], {4: 1.0}),
+    (['festa', 'fiesta', 'party', 'nightlife', 'bars', 'centre ciutat', 'centro ciudad'], {4: 0.0, 10: 1.0}),
+    (['vida social', 'social', 'ambient jove', 'ambiente joven', 'oci', 'ocio'], {10: 1.0}),
+    (['a peu', 'a pie', 'walkable', 'walking', 'sense cotxe', 'sin coche', 'without car'], {5: 1.0}),
+    (['cadira de rodes', 'silla de ruedas', 'wheelchair', 'mobilitat reduida', 'movilidad reducida'], {6: 1.0}),
+    (['transport public', 'transporte publico', 'public transport', 'metro', 'autobus', 'autobusos',
+      'autobuses', 'buses', 'en bus', 'el bus', 'the bus', 'by bus', 'bici', 'bike'], {8: 1.0}),
+    (['cotxe', 'coche', 'a car', 'my car', 'own car', 'conduir', 'conducir', 'drive', 'driving'], {8: 0.0}),
+    (['hospital', 'malaltia', 'enfermedad', 'illness', 'cronica', 'chronic', 'salut', 'salud', 'health'], {11: 1.0}),
+    (['seguretat', 'seguridad', 'safe', 'safety', 'segura', 'barri segur', 'barrio seguro'], {2: 0.1}),
+]
+
+# Negacions: una paraula clau no compta si n'hi ha una entre les NEGATION_WINDOW
+# paraules anteriors de la mateixa frase
+NEGATORS = frozenset(['no', 'not', 'sense', 'sin', 'without', 'ni', 'nor', 'never', 'mai', 'nunca',
+                      'tampoc', 'tampoco'])
+NEGATION_WINDOW = 4
+# La negació no travessa la puntuació ni les conjuncions ("no tinc cotxe i em moc
+# en metro" no nega el metro; per negar-ne dos es fa servir "ni")
+CLAUSE_SPLIT = re.compile(r"[.,;:!?()\n]+|\b(?:but|pero|però|and|i|y)\b")
+
+
+def normalize_text(text):
+    """Minúscules, sense accents i amb espais simples (la punt volada es conserva)."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r"[a-z0-9·]+", text))
+
+
+def _compile(keywords):
+    """Una sola expressió regular per llista de paraules clau (paraules senceres)."""
+    alternatives = '|'.join(re.escape(normalize_text(keyword)) for keyword in keywords)
+    return re.compile(rf'(?<![a-z0-9·])(?:{alternatives})(?![a-z0-9·])')
+
+
+def split_clauses(text):
+    """Frases normalitzades del text ("don't" -> "do not" perquè la negació sigui una paraula)."""
+    text = re.sub(r"n['’]t\b", ' not', text.lower())
+    return [clause for clause in map(normalize_text, CLAUSE_SPLIT.split(text)) if clause]
+
+
+def is_negated(clause, start):
+    """True si hi ha una negació a les NEGATION_WINDOW paraules anteriors a la posició start."""
+    return any(word in NEGATORS for word in clause[:start].split()[-NEGATION_WINDOW:])
+
+
+def find_keywords(pattern, clauses):
+    """
+    Paraules clau del patró trobades a les frases.
+
+    Retorna (afirmades, negades): conjunts de paraules clau diferents.
+    """
+    affirmed, negated = set(), set()
+    for clause in clauses:
+        for match in pattern.finditer(clause):
+            (negated if is_negated(clause, match.start()) else affirmed).add(match.group())
+    return affirmed, negated
+
+
+ARCHETYPE_PATTERNS = {name: _compile(archetype['keywords']) for name, archetype in ARCHETYPES.items()}
+RULE_PATTERNS = [(_compile(keywords), values) for keywords, values in INDEX_RULES]
+
+
+class LocalVector:
+    """Resultat del vectoritzador local."""
+
+    def __init__(self, vector, confidence, archetypes, rules, elapsed_ms):
+        self.vector = vector
+        self.confidence = confidence
+        self.archetypes = archetypes
+        self.rules = rules
+        self.elapsed_ms = elapsed_ms
+
+    def to_dict(self):
+        return {
+            'vector': self.vector,
+            'confidence': self.confidence,
+            'archetypes': self.archetypes,
+            'rules': self.rules,
+            'elapsed_ms': self.elapsed_ms
+        }
+
+
+def vectorize(text):
+    """
+    Converteix la descripció de l'usuari en el vector d'11 preferències.
+
+    La confiança creix amb les paraules clau reconegudes: un arquetip clar amb
+    diverses coincidències s'acosta a 1; un text sense cap coincidència dóna el
+    vector base amb confiança 0.
+    """
+    start = time.perf_counter()
+    clauses = split_clauses(text)
+    vector = list(BASE_VECTOR)
+
+    # Arquetips per nombre de coincidències; el més fort s'aplica l'últim i mana
+    hits = {}
+    for name, pattern in ARCHETYPE_PATTERNS.items():
+        count = len(find_keywords(pattern, clauses)[0])
+        if count:
+            hits[name] = count
+    archetypes = sorted(hits, key=hits.get)
+    for name in archetypes:
+        for index, value in ARCHETYPES[name]['values'].items():
+            vector[index - 1] = value
+
+    rules = 0
+    for pattern, values in RULE_PATTERNS:
+        if find_keywords(pattern, clauses)[0]:
+            rules += 1
+            for index, value in values.items():
+                vector[index - 1] = value
+
+    # Seguretat dels arquetips que la forcen (luxe, família) té prioritat sobre les regles
+    for name in ('luxe', 'familia'):
+        if name in hits:
+            vector[1] = min(vector[1], ARCHETYPES[name]['values'][2])
+
+    archetype_hits = sum(hits.values())
+    confidence = min(1.0, 0.3 * archetype_hits + 0.1 * rules)
+    if len(archetypes) > 2:
+        # Massa arquetips barrejats: les sobreescriptures es contradiuen
+        confidence *= 0.6
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return LocalVector(vector, round(confidence, 3), archetypes[::-1], rules, round(elapsed_ms, 3))
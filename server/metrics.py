@@ -0,0 +1,161 @@
+"""
+Mètriques en memòria exportades en el format de text de Prometheus (/metrics).
+
+Comptadors, indicadors i histogrames amb etiquetes. Cada operació és un diccionari
+i un lock (els histogrames fan servir LatencyHistogram de latency.py sense finestra
+de percentils), de manera que es poden deixar actius en producció. Les mètriques
+que ja existeixen en altres objectes (latència de la LLM, cache semàntica, versió
+del dataset) s'hi afegeixen amb col·lectors que es consulten en cada exportació.
+
+Cada procés té les seves mètriques: amb diversos workers de gunicorn cada raspat
+veu les del worker que el rep.
+"""
+import threading
+
+from latency import DEFAULT_BUCKETS, LatencyHistogram
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_histogram(name, histogram, labelnames=(), labelvalues=()):
+    """Línies _bucket/_sum/_count d'un LatencyHistogram."""
+    snapshot = histogram.snapshot()
+    lines = []
+    for bound, count in snapshot['buckets']:
+        le = '+Inf' if bound == '+Inf' else _number(bound)
+        lines.append(f"{name}_bucket{_labels(labelnames, labelvalues, {'le': le})} {count}")
+    lines.append(f"{name}_sum{_labels(labelnames, labelvalues)} {_number(snapshot['sum'])}")
+    lines.append(f"{name}_count{_labels(labelnames, labelvalues)} {snapshot['count']}")
+    return lines
+
+
+class Metric:
+    """Base: nom, tipus, descripció i noms de les etiquetes."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self):
+        lines = self.header()
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, *labelvalues, value):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, seconds, *labelvalues):
+        histogram = self._values.get(labelvalues)
+        if histogram is None:
+            with self._lock:
+                histogram = self._values.setdefault(labelvalues, LatencyHistogram(self.buckets, window=0))
+        histogram.observe(seconds)
+
+    def render(self):
+        lines = self.header()
+        for labelvalues, histogram in sorted(self._values.items()):
+            lines += render_histogram(self.name, histogram, self.labelnames, labelvalues)
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunt de mètriques i col·lectors d'un procés."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, func):
+        """
+        Afegeix una funció que retorna línies de text ja formatades (es crida a cada
+        exportació). Es pot fer servir com a decorador.
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            try:
+                lines += collector()
+            except Exception as e:
+                lines.append(f'# collector {getattr(collector, "__name__", "?")} failed: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+def gauge_lines(name, help, samples, kind='gauge'):
+    """Línies d'una mètrica a partir de [(etiquetes dict, valor)]."""
+    lines = [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+    return lines
@@ -0,0 +1,361 @@
+"""
+Catàleg de perfils precalculat (pàgines "millors barris per a X").
+
+Un job (nocturn, p. ex. amb cron) llegeix el catàleg de perfils (personas.json),
+obté el vector de cada descripció, calcula amb similarity_batch els mapes de calor
+de tots els perfils alhora per a cada mètode i nivell de la piràmide i el top-K de
+cel·les, i ho escriu com un artefacte de només lectura. El servidor l'obre amb mmap
+i respon les pàgines del catàleg sense cap crida a la LLM ni cap càlcul.
+
+Els vectors de la LLM es desen a vectors.json i només es tornen a demanar quan
+canvia la descripció (o amb --refresh); els del vectoritzador local es recalculen
+a cada execució, de manera que passen a ser de la LLM quan aquesta està disponible.
+
+Ús (des del directori server/):
+    python persona_catalog.py                          # personas.json -> city_stats/persona_catalog/
+    python persona_catalog.py --mode local --top-k 20
+    0 3 * * *  cd /ruta/server && python persona_catalog.py     # cron, cada nit
+
+Estructura:
+    city_stats/persona_catalog/CURRENT                      -> build actiu
+    city_stats/persona_catalog/vectors.json                 vectors per descripció
+    city_stats/persona_catalog/<build>/index.json           perfils, mètodes, nivells, versió del dataset
+    city_stats/persona_catalog/<build>/heatmaps_<mida>.npy  uint16 (mètodes, perfils, mida, mida)
+    city_stats/persona_catalog/<build>/params_<mida>.npy    offset i scale de cada mapa (com wire_format)
+    city_stats/persona_catalog/<build>/top_k_cells.npy      fila i columna (mètodes, perfils, K, 2)
+    city_stats/persona_catalog/<build>/top_k_scores.npy     similitud (mètodes, perfils, K)
+    city_stats/persona_catalog/<build>/top_k_centers.npy    lat i lon del centre de cada cel·la
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from batch import RateLimiter, normalize_prompt, run_batch
+from heatmap_pyramid import window_rectangle
+from similarity import METHODS, similarity_batch, top_k_cells
+from wire_format import dequantize
+
+logger = logging.getLogger(__name__)
+
+CATALOG_PATH = Path(__file__).parent / 'personas.json'
+CATALOG_DIR = Path(__file__).parent / 'city_stats' / 'persona_catalog'
+DEFAULT_TOP_K = 10
+
+# Fonts de vector que es desen a vectors.json. Només els de la LLM: els locals es
+# recalculen cada vegada i un encert de la cache semàntica podria ser un fals positiu
+# que quedaria fixat al catàleg per sempre
+CACHED_SOURCES = ('llm',)
+
+
+def read_catalog(path=CATALOG_PATH):
+    """
+    Perfils del catàleg: llista de {"id", "name", "description"} i opcionalment
+    "vector" (11 valors) per fixar el vector sense vectoritzar la descripció.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        personas = json.load(f)
+
+    seen = set()
+    for persona in personas:
+        if not persona.get('id') or persona['id'] in seen:
+            raise ValueError(f"Perfil sense id o amb id repetit: {persona.get('id')!r}")
+        if not persona.get('description') and not persona.get('vector'):
+            raise ValueError(f"El perfil {persona['id']} no té ni descripció ni vector")
+        if persona.get('vector') is not None and len(persona['vector']) != 11:
+            raise ValueError(f"El vector del perfil {persona['id']} ha de tenir 11 valors")
+        seen.add(persona['id'])
+    return personas
+
+
+def load_vector_cache(catalog_dir=CATALOG_DIR):
+    try:
+        with open(Path(catalog_dir) / 'vectors.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_vector_cache(cache, catalog_dir=CATALOG_DIR):
+    catalog_dir = Path(catalog_dir)
+    catalog_dir.mkdir(parents=True, exist_ok=True)
+    tmp = catalog_dir / '.vectors.json.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, catalog_dir / 'vectors.json')
+
+
+def resolve_vectors(personas, vectorize, cache, refresh=False, concurrency=4):
+    """
+    Vector de cada perfil: el del catàleg, el de la cache (si la descripció no ha
+    canviat) o el de vectorize(descripció) -> {'vector', 'source', 'model'}.
+    Actualitza `cache` amb els vectors nous de la LLM.
+
+    Retorna una llista de {'vector', 'source', 'model'} en l'ordre del catàleg.
+    """
+    resolved = [None] * len(personas)
+    pending = []
+    for row, persona in enumerate(personas):
+        if persona.get('vector') is not None:
+            resolved[row] = {'vector': [float(value) for value in persona['vector']], 'source': 'catalog',
+                             'model': None}
+            continue
+        entry = None if refresh else cache.get(normalize_prompt(persona['description']))
+        if entry is not None and entry.get('source') in CACHED_SOURCES:
+            resolved[row] = dict(entry, cached=True)
+        else:
+            pending.append(persona['description'])
+
+    rows = {}
+    for row, persona in enumerate(personas):
+        if resolved[row] is None:
+            rows.setdefault(normalize_prompt(persona['description']), []).append(row)
+
+    for description, _, result in run_batch(pending, vectorize, concurrency):
+        if 'error' in result:
+            raise RuntimeError(f"No s'ha pogut vectoritzar {description!r}: {result['error']}")
+        entry = {'vector': result['vector'], 'source': result['source'], 'model': result.get('model')}
+        key = normalize_prompt(description)
+        if entry['source'] in CACHED_SOURCES:
+            cache[key] = entry
+        for row in rows[key]:
+            resolved[row] = entry
+    return resolved
+
+
+def quantize_heatmaps(scores):
+    """
+    Quantitza molts mapes alhora a uint16 entre el mínim i el màxim de cada mapa
+    (com wire_format.quantize). Retorna (dades, paràmetres (..., 2) offset i scale).
+    """
+    low = scores.min(axis=(-2, -1))
+    high = scores.max(axis=(-2, -1))
+    levels = np.iinfo(np.uint16).max
+    scale = np.where(high > low, (high - low) / levels, 1.0)
+    data = np.rint((scores - low[..., None, None]) / scale[..., None, None]).astype('<u2')
+    return data, np.stack([low, scale], axis=-1)
+
+
+def build_artifact(store, personas, vectors, rectangle, methods=METHODS, top_k=DEFAULT_TOP_K):
+    """
+    Calcula els mapes de tots els perfils (una passada de similarity_batch per mètode
+    i nivell) i el top-K de cel·les del nivell base.
+
+    Retorna (index, {nom del fitxer: array}).
+    """
+    matrix = np.array([entry['vector'] for entry in vectors], dtype=float)
+    arrays = {}
+    levels = [cells.shape[0] for cells in store.pyramid]
+    base_size = store.pyramid[0].shape[0]
+    top_k = max(1, min(top_k, base_size * base_size))
+    top_rows, top_cols, top_scores = [], [], []
+
+    for size, cells in zip(levels, store.pyramid):
+        scores = np.stack([similarity_batch(matrix, cells, method) for method in methods])
+        arrays[f'heatmaps_{size}.npy'], arrays[f'params_{size}.npy'] = quantize_heatmaps(scores)
+        if size == base_size:
+            top_rows, top_cols, top_scores = top_k_cells(scores, top_k)
+
+    centers = np.empty(top_rows.shape + (2,))
+    for row in range(base_size):
+        for col in range(base_size):
+            bounds = window_rectangle(base_size, rectangle, (row, row + 1, col, col + 1))
+            mask = (top_rows == row) & (top_cols == col)
+            centers[mask] = ((bounds['north'] + bounds['south']) / 2, (bounds['west'] + bounds['east']) / 2)
+
+    arrays['top_k_cells.npy'] = np.stack([top_rows, top_cols], axis=-1).astype('<u2')
+    arrays['top_k_scores.npy'] = top_scores.astype('<f4')
+    arrays['top_k_centers.npy'] = centers
+
+    index = {
+        'dataset_version': store.version,
+        'methods': list(methods),
+        'levels': levels,
+        'top_k': top_k,
+        'rectangle': rectangle,
+        'personas': [
+            {'id': persona['id'], 'name': persona.get('name'), 'description': persona.get('description'),
+             'vector': entry['vector'], 'source': entry['source'], 'model': entry.get('model')}
+            for persona, entry in zip(personas, vectors)
+        ]
+    }
+    fingerprint = json.dumps(index, sort_keys=True).encode('utf-8')
+    index['build'] = hashlib.sha1(fingerprint).hexdigest()[:16]
+    index['created_at'] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    return index, arrays
+
+
+def write_artifact(index, arrays, catalog_dir=CATALOG_DIR):
+    """
+    Escriu el build i el marca com a actiu (canvi atòmic de CURRENT).
+
+    Retorna el directori del build.
+    """
+    catalog_dir = Path(catalog_dir)
+    target = catalog_dir / index['build']
+    tmp = catalog_dir / f".{index['build']}.tmp"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    for name, array in arrays.items():
+        np.save(tmp / name, np.ascontiguousarray(array))
+    with open(tmp / 'index.json', 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+
+    pointer_tmp = catalog_dir / '.CURRENT.tmp'
+    pointer_tmp.write_text(index['build'], encoding='utf-8')
+    os.replace(pointer_tmp, catalog_dir / 'CURRENT')
+    return target
+
+
+def prune_builds(catalog_dir=CATALOG_DIR, keep=3):
+    """Esborra els builds antics (es conserven els `keep` més recents i l'actiu)."""
+    catalog_dir = Path(catalog_dir)
+    current = (catalog_dir / 'CURRENT').read_text(encoding='utf-8').strip()
+    builds = sorted((path for path in catalog_dir.iterdir() if (path / 'index.json').exists()),
+                    key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in builds[keep:]:
+        if path.name != current:
+            shutil.rmtree(path)
+
+
+class PersonaCatalog:
+    """Un build del catàleg obert amb mmap (només lectura)."""
+
+    def __init__(self, target):
+        target = Path(target)
+        with open(target / 'index.json', 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        self.build = self.index['build']
+        self.dataset_version = self.index['dataset_version']
+        self.methods = self.index['methods']
+        self.levels = self.index['levels']
+        self.personas = self.index['personas']
+        self.rows = {persona['id']: row for row, persona in enumerate(self.personas)}
+        self.heatmaps = [np.load(target / f'heatmaps_{size}.npy', mmap_mode='r') for size in self.levels]
+        self.params = [np.load(target / f'params_{size}.npy', mmap_mode='r') for size in self.levels]
+        self.top_cells = np.load(target / 'top_k_cells.npy', mmap_mode='r')
+        self.top_scores = np.load(target / 'top_k_scores.npy', mmap_mode='r')
+        self.top_centers = np.load(target / 'top_k_centers.npy', mmap_mode='r')
+
+    def persona(self, persona_id):
+        row = self.rows.get(persona_id)
+        return None if row is None else self.personas[row]
+
+    def heatmap(self, persona_id, method, level):
+        """Mapa quantitzat (uint16) i els seus paràmetres {'offset', 'scale'}."""
+        row, m = self.rows[persona_id], self.methods.index(method)
+        offset, scale = self.params[level][m, row]
+        return self.heatmaps[level][m, row], {'offset': float(offset), 'scale': float(scale)}
+
+    def heatmap_values(self, persona_id, method, level):
+        data, params = self.heatmap(persona_id, method, level)
+        return dequantize(data, params)
+
+    def top_k(self, persona_id, method, k=None):
+        """Cel·les més afins del nivell base, en el format de top_cells d'app.py."""
+        row, m = self.rows[persona_id], self.methods.index(method)
+        k = self.index['top_k'] if k is None else k
+        return [
+            {'row': int(cell[0]), 'col': int(cell[1]), 'score': round(float(score), 4),
+             'lat': round(float(center[0]), 6), 'lon': round(float(center[1]), 6)}
+            for cell, score, center in zip(self.top_cells[m, row, :k], self.top_scores[m, row, :k],
+                                           self.top_centers[m, row, :k])
+        ]
+
+
+class PersonaCatalogReader:
+    """
+    Build actiu del catàleg. Comprova CURRENT com a molt cada `interval` segons, de
+    manera que el servidor agafa el build nou del job nocturn sense reiniciar.
+    """
+
+    def __init__(self, catalog_dir=CATALOG_DIR, interval=60.0):
+        self.catalog_dir = Path(catalog_dir)
+        self.interval = interval
+        self._catalog = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """PersonaCatalog actiu, o None si el job no s'ha executat mai."""
+        if self._checked is None or time.monotonic() - self._checked >= self.interval:
+            with self._lock:
+                if self._checked is None or time.monotonic() - self._checked >= self.interval:
+                    self._refresh()
+                    self._checked = time.monotonic()
+        return self._catalog
+
+    def _refresh(self):
+        try:
+            build = (self.catalog_dir / 'CURRENT').read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            return
+        if self._catalog is not None and self._catalog.build == build:
+            return
+        try:
+            self._catalog = PersonaCatalog(self.catalog_dir / build)
+            logger.info("Catàleg de perfils carregat", extra={'build': build,
+                                                             'personas': len(self._catalog.personas)})
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("No es pot obrir el build %s del catàleg de perfils: %s", build, e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precalcula els mapes de calor i el top-K del catàleg de perfils')
+    parser.add_argument('--catalog', default=str(CATALOG_PATH), help='Fitxer JSON del catàleg')
+    parser.add_argument('--out', default=str(CATALOG_DIR), help='Directori dels builds')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Cel·les del top-K per perfil i mètode')
+    parser.add_argument('--mode', default='auto', choices=['auto', 'llm', 'local'],
+                        help='Com es vectoritzen les descripcions noves')
+    parser.add_argument('--refresh', action='store_true', help='Torna a vectoritzar totes les descripcions')
+    parser.add_argument('--rate', type=float, default=1.0, help='Crides a la LLM per segon')
+    parser.add_argument('--keep', type=int, default=3, help='Builds anteriors que es conserven')
+    args = parser.parse_args()
+
+    personas = read_catalog(args.catalog)
+
+    # Import tardà: app.py carrega les capes i inicialitza Gemini
+    import app
+
+    start = time.perf_counter()
+    limiter = RateLimiter(args.rate)
+
+    def vectorize(description):
+        body, status, _ = app.vectorize_prompt({'prompt': description, 'mode': args.mode}, remember=False,
+                                               before_llm=limiter.acquire)
+        return body if status == 200 else {'error': body.get('error', 'Unknown error')}
+
+    cache = load_vector_cache(args.out)
+    vectors = resolve_vectors(personas, vectorize, cache, args.refresh)
+    save_vector_cache(cache, args.out)
+
+    index, arrays = build_artifact(app.feature_store, personas, vectors, app.LA_RECTANGLE, top_k=args.top_k)
+    target = write_artifact(index, arrays, args.out)
+    prune_builds(args.out, args.keep)
+
+    sources = {}
+    for entry in vectors:
+        source = 'cache' if entry.get('cached') else entry['source']
+        sources[source] = sources.get(source, 0) + 1
+    size = sum(path.stat().st_size for path in target.iterdir())
+    logger.info("Catàleg de perfils escrit a %s", target,
+                extra={'personas': len(personas), 'vectors': sources, 'bytes': size,
+                       'seconds': round(time.perf_counter() - start, 2)})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Perfilador per mostreig per trobar punts calents amb trànsit real.
+
+Un fil de fons llegeix la pila de Python dels fils del procés (sys._current_frames)
+cada `interval` segons i compta quantes vegades apareix cada pila. No instrumenta
+cap funció: el cost és proporcional al nombre de fils i a la freqüència de mostreig,
+no a la feina que fan les peticions.
+
+El resultat es retorna en format de piles col·lapsades (una línia per pila,
+"fil;funció (fitxer:línia);... N"), que entenen flamegraph.pl, speedscope.app o
+inferno per dibuixar el flamegraph.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+# Funcions on un fil espera sense fer feina (fitxer, funció de la fulla de la pila)
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('socketserver.py', 'serve_forever'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+    ('base_events.py', '_run_once'),
+}
+
+# Mínim d'interval de canvi de fil mentre es perfila una petició (vegeu profile_call)
+_switch_lock = threading.Lock()
+_switch_users = 0
+_switch_previous = None
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Mostreja les piles dels fils del procés (o només dels de `thread_ids`).
+
+        with SamplingProfiler(interval=0.005) as profiler:
+            time.sleep(10)
+        print(profiler.collapsed())
+    """
+
+    def __init__(self, interval=0.005, thread_ids=None, include_idle=False, max_depth=128, exclude_ids=()):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.exclude_ids = set(exclude_ids)
+        self.include_idle = include_idle
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self, names):
+        skip = self.exclude_ids | {threading.get_ident()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in skip or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f'thread-{thread_id}'))
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def _run(self):
+        start = time.perf_counter()
+        names = {}
+        while not self._stop.is_set():
+            if self.thread_ids is None or len(names) < len(self.thread_ids):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self._sample(names)
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.duration = time.perf_counter() - start
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def collapsed(self):
+        """Piles col·lapsades, de més a menys freqüents."""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit=20):
+        """Funcions amb més mostres en la fulla de la pila (temps propi)."""
+        own = collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+        return own.most_common(limit)
+
+
+def profile_for(seconds, interval=0.005, include_idle=False):
+    """Perfila tot el procés (excepte el fil que la crida, que queda bloquejat) durant `seconds` segons."""
+    with SamplingProfiler(interval, include_idle=include_idle, exclude_ids={threading.get_ident()}) as profiler:
+        time.sleep(seconds)
+    return profiler
+
+
+def _lower_switch_interval(interval):
+    global _switch_users, _switch_previous
+    with _switch_lock:
+        if _switch_users == 0:
+            _switch_previous = sys.getswitchinterval()
+            sys.setswitchinterval(min(_switch_previous, interval))
+        _switch_users += 1
+
+
+def _restore_switch_interval():
+    global _switch_users
+    with _switch_lock:
+        _switch_users -= 1
+        if _switch_users == 0:
+            sys.setswitchinterval(_switch_previous)
+
+
+def profile_call(func, *args, repeat=1, interval=0.001):
+    """
+    Executa func(*args) `repeat` vegades mostrejant només el fil actual.
+
+    Mentre dura, l'interval de canvi de fil de l'intèrpret baixa fins a `interval`:
+    amb el valor per defecte (5 ms) el fil del perfilador no aconseguiria el GIL
+    a temps durant el codi Python pur d'una petició de pocs mil·lisegons.
+
+    Retorna (resultat de la darrera crida, perfilador).
+    """
+    _lower_switch_interval(interval)
+    try:
+        with SamplingProfiler(interval, thread_ids={threading.get_ident()}, include_idle=True) as profiler:
+            for _ in range(repeat):
+                result = func(*args)
+    finally:
+        _restore_switch_interval()
+    return result, profiler
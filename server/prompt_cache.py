@@ -0,0 +1,161 @@
+"""
+Context estàtic del prompt de sistema reutilitzat entre peticions.
+
+El prompt de sistema (heurístiques d'arquetips i definició dels índexs) és igual
+a totes les peticions; només canvia el text de l'usuari. El registre l'indexa pel
+hash del prefix i el prepara una sola vegada segons el que permeti el SDK:
+
+    'cached'   -> context caching del proveïdor (genai.caching.CachedContent):
+                  per petició només viatja el text de l'usuari
+    'system'   -> GenerativeModel(system_instruction=...)
+    'inline'   -> SDK sense cap de les dues (p. ex. google-generativeai 0.3.x):
+                  el prefix es concatena amb el text de l'usuari, sempre idèntic
+                  i al davant perquè el proveïdor pugui aprofitar la cache implícita
+
+Només 'cached' redueix els tokens d'entrada per petició. Amb 'system' el prompt de
+sistema també es factura a cada crida, i amb 'inline' viatja sencer. Amb la versió
+fixada a requirements.txt (google-generativeai 0.3.2) el mode és sempre 'inline':
+en producció l'únic estalvi és compact_prompt (uns 40 de ~1000 tokens; vegeu
+benchmarks/prompt_tokens.py). A més, el context caching del proveïdor té un mínim
+de tokens per sobre de la mida d'aquest prompt, de manera que actualitzar el SDK
+tampoc no n'hi donaria més sense allargar el context que es desa.
+"""
+import hashlib
+import inspect
+import logging
+import os
+import re
+import threading
+import time
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# Vida del context a la cache del proveïdor (segons)
+PROMPT_CACHE_TTL = int(os.getenv('PROMPT_CACHE_TTL', '3600'))
+
+
+def compact_prompt(text):
+    """
+    Treu l'espai en blanc que no aporta res al model (sagnats, espais finals i
+    línies buides repetides) sense canviar el contingut del prompt.
+    """
+    lines = [line.strip() for line in text.strip().splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
+
+def prefix_hash(text):
+    """Identificador estable d'un prefix de prompt."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _supports_system_instruction():
+    return 'system_instruction' in inspect.signature(genai.GenerativeModel.__init__).parameters
+
+
+def supported_mode(ttl=PROMPT_CACHE_TTL):
+    """
+    Mode que intentarà el registre amb el SDK instal·lat, sense crear cap context.
+    'cached' encara pot acabar en 'system' si el proveïdor rebutja el context.
+    """
+    if getattr(genai, 'caching', None) is not None and ttl > 0:
+        return 'cached'
+    if _supports_system_instruction():
+        return 'system'
+    return 'inline'
+
+
+class PromptContext:
+    """Un prompt de sistema preparat per a un model concret."""
+
+    def __init__(self, key, system_prompt, mode, model, expires_at=None):
+        self.key = key
+        self.system_prompt = system_prompt
+        self.mode = mode
+        self.model = model
+        self.expires_at = expires_at
+        self.created_at = time.time()
+        self.uses = 0
+
+    @property
+    def expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def contents(self, user_prompt):
+        """Contingut que s'envia per petició."""
+        if self.mode == 'inline':
+            return f"{self.system_prompt}\n\n{user_prompt}"
+        return user_prompt
+
+
+class PromptContextRegistry:
+    """
+    Registre local (per procés) de contexts indexat pel hash del prompt de sistema.
+    """
+
+    def __init__(self, model_name, safety_settings=None, ttl=PROMPT_CACHE_TTL):
+        self.model_name = model_name
+        self.safety_settings = safety_settings
+        self.ttl = ttl
+        self._contexts = {}
+        self._lock = threading.Lock()
+
+    def get(self, system_prompt):
+        """Retorna el PromptContext del prompt, creant-lo (o renovant-lo) si cal."""
+        key = prefix_hash(system_prompt)
+        context = self._contexts.get(key)
+        if context is None or context.expired:
+            with self._lock:
+                context = self._contexts.get(key)
+                if context is None or context.expired:
+                    context = self._create(key, system_prompt)
+                    self._contexts[key] = context
+        context.uses += 1
+        return context
+
+    def _create(self, key, system_prompt):
+        caching = getattr(genai, 'caching', None)
+        if caching is not None and self.ttl > 0:
+            try:
+                cached = caching.CachedContent.create(
+                    model=self.model_name,
+                    display_name=f'system-prompt-{key}',
+                    system_instruction=system_prompt,
+                    ttl=f'{self.ttl}s'
+                )
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+                logger.info("Prompt de sistema %s a la cache del proveïdor", key, extra={'ttl': self.ttl})
+                # Es renova una mica abans que caduqui al proveïdor
+                return PromptContext(key, system_prompt, 'cached', model,
+                                     expires_at=time.time() + self.ttl * 0.9)
+            except Exception as e:
+                # P. ex. prompt per sota del mínim de tokens del proveïdor
+                logger.warning("Context caching no disponible (%s), es fa servir system_instruction", e)
+
+        if _supports_system_instruction():
+            model = genai.GenerativeModel(
+                self.model_name,
+                safety_settings=self.safety_settings,
+                system_instruction=system_prompt
+            )
+            return PromptContext(key, system_prompt, 'system', model)
+
+        logger.warning("El SDK no permet context caching ni system_instruction: el prompt de sistema %s "
+                       "s'envia sencer a cada petició", key, extra={'chars': len(system_prompt)})
+        model = genai.GenerativeModel(self.model_name, safety_settings=self.safety_settings)
+        return PromptContext(key, system_prompt, 'inline', model)
+
+    def stats(self):
+        """Estat del registre (per a diagnòstic)."""
+        return [
+            {
+                'key': context.key,
+                'mode': context.mode,
+                'chars': len(context.system_prompt),
+                'uses': context.uses,
+                'created_at': context.created_at,
+                'expires_at': context.expires_at
+            }
+            for context in self._contexts.values()
+        ]
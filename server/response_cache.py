@@ -0,0 +1,109 @@
+"""
+Cache de respostes estàtiques precomprimides (gzip i brotli) amb ETag fort.
+
+Cada entrada es construeix una sola vegada per versió del dataset i variant
+(per exemple 'json' o 'f32'); a partir d'aquí servir-la només costa triar la
+codificació i comparar l'ETag.
+"""
+import gzip
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli és opcional: sense ell només se serveix gzip
+    brotli = None
+
+
+class PrecompressedResponse:
+    """
+    Cos d'una resposta en totes les codificacions suportades.
+    """
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.bodies = {'identity': body}
+        self.bodies['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=11)
+        self.etag_base = hashlib.sha256(body).hexdigest()[:32]
+
+    def etag(self, encoding):
+        """ETag fort; cada codificació té el seu sufix (com fa Apache)."""
+        suffix = '' if encoding == 'identity' else f'-{encoding}'
+        return f'"{self.etag_base}{suffix}"'
+
+    def matches(self, if_none_match):
+        """Comprova la capçalera If-None-Match contra qualsevol codificació d'aquest cos."""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*':
+                return True
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            tag = tag.strip('"')
+            if tag.split('-')[0] == self.etag_base:
+                return True
+        return False
+
+    def select_encoding(self, accept_encoding):
+        """Tria la millor codificació disponible segons Accept-Encoding."""
+        accepted = {
+            token.split(';')[0].strip().lower()
+            for token in (accept_encoding or '').split(',')
+            if not token.strip().endswith(';q=0')
+        }
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding
+        return 'identity'
+
+
+class ResponseCache:
+    """
+    Respostes precomprimides indexades per (versió del dataset, variant).
+
+    Quan canvia la versió les entrades antigues es descarten.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Comptadors per a /metrics (lock propi: no esperen cap construcció)
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def contains(self, version, variant):
+        """True si la variant ja està construïda per a la versió (servir-la no costa res)."""
+        return (version, variant) in self._entries
+
+    def get(self, version, variant, build):
+        """
+        Retorna l'entrada de la variant per a la versió donada.
+
+        Args:
+            version: Versió del dataset
+            variant: Nom de la variant ('json', 'f32', ...)
+            build: Funció sense arguments que retorna (body_bytes, mimetype)
+        """
+        key = (version, variant)
+        entry = self._entries.get(key)
+        if entry is not None:
+            with self._stats_lock:
+                self.hits += 1
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                with self._stats_lock:
+                    self.misses += 1
+                body, mimetype = build()
+                entry = PrecompressedResponse(body, mimetype)
+                # Només es mantenen les entrades de la versió actual
+                self._entries = {k: v for k, v in self._entries.items() if k[0] == version}
+                self._entries[key] = entry
+        return entry
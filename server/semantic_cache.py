@@ -0,0 +1,344 @@
+"""
+Cache semàntica de resultats descripció -> vector de preferències.
+
+Les descripcions gairebé iguals ("soc estudiant amb poc pressupost", "estudiant,
+pressupost just") han de reutilitzar el vector que ja va donar la LLM. Cada text
+es converteix en un embedding local (n-grames de caràcters amb hashing, més els
+arquetips i regles que reconeix local_vectorizer, que fan coincidir textos en
+idiomes diferents) i es busca el més proper en un índex en memòria. Si la
+similitud cosinus supera el llindar, es reutilitza el seu vector.
+
+Les negacions canvien el sentit d'una descripció amb molt poques paraules ("tinc
+cotxe" / "no tinc cotxe"): un concepte negat és un feature diferent de l'afirmat,
+i només hi ha encert si les dues descripcions neguen exactament el mateix. Els
+modificadors de grau i distància ("poc" / "molt pressupost", "metges a prop" /
+"lluny") també: cada un s'enganxa al concepte o paraula que modifica i no hi ha
+encert si les dues descripcions li donen un sentit oposat.
+"""
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from local_vectorizer import ARCHETYPE_PATTERNS, NEGATION_WINDOW, NEGATORS, RULE_PATTERNS, find_keywords, split_clauses
+
+EMBEDDING_DIM = 1024
+NGRAM_SIZES = (3, 4, 5)
+# Pes de cada concepte (arquetip o regle) respecte d'una paraula lliure
+CONCEPT_WEIGHT = 2.0
+# Marca on hi havia un concepte (no és cap paraula: normalize_text no la produeix)
+CONCEPT_MARK = '#'
+
+EVICTION_POLICIES = ('lru', 'lfu', 'fifo')
+
+# Modificadors de grau i distància (normalitzats, sense accents) per sentit. Els
+# de MODIFIERS_AFTER van darrere del que modifiquen ("pressupost alt", "metges a
+# prop"), la resta davant ("poc pressupost", "large budget"); si en aquesta
+# direcció no hi ha res, es prova l'altra.
+MODIFIERS = {
+    **dict.fromkeys('poc poca pocs poques poco pocos little few low tight small petit petita petits '
+                    'petites pequeno pequena baix baixa bajo baja just justo ajustat ajustada ajustado '
+                    'limitat limitada limitado limited escas escasa escaso modest modesto'.split(), 'low'),
+    **dict.fromkeys('molt molta molts moltes mucho mucha muchos muchas muy much many lots very large big '
+                    'huge gran grans grande grandes alt alta alto high generous ample amplio'.split(), 'high'),
+    **dict.fromkeys('prop aprop cerca near nearby close proper proxim proxima proximo'.split(), 'near'),
+    **dict.fromkeys('lluny lejos far away allunyat allunyada alejado alejada lejano distant'.split(), 'far'),
+}
+MODIFIERS_AFTER = frozenset('petit petita petits petites pequeno pequena baix baixa bajo baja just justo '
+                            'ajustat ajustada ajustado limitat limitada limitado escas escasa escaso grans '
+                            'grande grandes alt alta alto ample amplio prop aprop cerca nearby proper proxim '
+                            'proxima proximo lluny lejos away allunyat allunyada alejado alejada '
+                            'lejano'.split())
+# Paraules (no més enllà) entre un modificador i el que modifica, sense comptar les buides
+MODIFIER_WINDOW = 2
+# Noms que es modifiquen sovint i tenen el mateix sentit en cada idioma
+TOPICS = {
+    **dict.fromkeys(['pressupost', 'presupuesto', 'budget'], 'pressupost'),
+    **dict.fromkeys(['preu', 'precio', 'price', 'lloguer', 'alquiler', 'rent'], 'preu'),
+}
+
+# Paraules buides (català, castellà i anglès) que no canvien el perfil. Les
+# negacions (local_vectorizer.NEGATORS) i els modificadors no ho són mai.
+STOPWORDS = frozenset(
+    'a al als amb an and are as at busco but de del dels do does el els em en es from have i in is la '
+    'las les li lo los m me ens nos my o of on or per pero perque por que quiero so soc som son the to '
+    'tinc tengo un una uns unes vull y yo i\'m i am we with'.split()
+) - NEGATORS - set(MODIFIERS)
+
+
+def _bucket(feature, dim):
+    """Índex i signe del feature (hashing trick amb signe per reduir col·lisions)."""
+    digest = zlib.crc32(feature.encode('utf-8'))
+    return digest % dim, 1.0 if (digest >> 31) & 1 else -1.0
+
+
+def _topic(word):
+    return f'w:{TOPICS.get(word, word)}'
+
+
+def _modifier_target(words, position, step):
+    """Posició de la paraula que modifica words[position] en la direcció step (o None)."""
+    seen = 0
+    index = position + step
+    while 0 <= index < len(words) and seen < MODIFIER_WINDOW:
+        word = words[index]
+        if word not in STOPWORDS and word not in MODIFIERS:
+            return index
+        if word not in STOPWORDS:
+            seen += 1
+        index += step
+    return None
+
+
+def modifiers_conflict(first, second):
+    """True si dos conjunts de modificadors ('<feature>=<sentit>') donen un sentit diferent al mateix feature."""
+    if first == second:
+        return False
+    senses = {}
+    for modifier in first:
+        feature, sense = modifier.rsplit('=', 1)
+        senses.setdefault(feature, set()).add(sense)
+    other = {}
+    for modifier in second:
+        feature, sense = modifier.rsplit('=', 1)
+        other.setdefault(feature, set()).add(sense)
+    return any(senses[feature] != other[feature] for feature in senses.keys() & other.keys())
+
+
+def analyze(text, dim=EMBEDDING_DIM):
+    """
+    Embedding normalitzat (L2) d'un text, el conjunt del que nega i els seus modificadors.
+
+    Les paraules clau que reconeix el vectoritzador local es substitueixen pel seu
+    concepte (arquetip o regla), de manera que "student on a tight budget" i "soc
+    estudiant amb poc pressupost" coincideixen; si la paraula clau va negada el
+    feature és 'not:<concepte>'. La resta de paraules (sense les buides) aporten la
+    paraula sencera i els seus n-grames de caràcters, amb pes total 1 per paraula
+    perquè les paraules llargues no dominin; la primera paraula amb contingut
+    després d'una negació aporta a més 'not:<paraula>'.
+
+    Cada modificador (MODIFIERS) s'enganxa al concepte o paraula del costat i
+    aporta '<sentit>:<feature>', també quan forma part de la paraula clau ("poc
+    pressupost" és l'arquetip estudiant i a més 'low' de 'w:pressupost'), de manera
+    que "large budget" i "poc pressupost" no es confonen.
+
+    Retorna (embedding, negations, modifiers): negations és un frozenset de
+    features 'not:...' i modifiers un frozenset de '<feature>=<sentit>'.
+    """
+    clauses = split_clauses(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    negations = set()
+    modifiers = set()
+
+    def add(feature, weight):
+        index, sign = _bucket(feature, dim)
+        vector[index] += sign * weight
+
+    def modify(feature, sense):
+        add(f'{sense}:{feature}', CONCEPT_WEIGHT)
+        modifiers.add(f'{feature}={sense}')
+
+    def fold(match, mark):
+        # El modificador d'una paraula clau de diverses paraules ("poc pressupost") es conserva
+        words = match.group().split()
+        nouns = [word for word in words if word not in MODIFIERS and word not in STOPWORDS]
+        if nouns and len(nouns) < len(words):
+            for word in words:
+                if word in MODIFIERS:
+                    modify(_topic(nouns[-1]), MODIFIERS[word])
+        return f' {mark} '
+
+    # Conceptes independents de l'idioma
+    concepts = [(f'archetype:{name}', pattern) for name, pattern in ARCHETYPE_PATTERNS.items()]
+    concepts += [(f'rule:{position}', pattern) for position, (pattern, _) in enumerate(RULE_PATTERNS)]
+    marks = {}
+    for feature, pattern in concepts:
+        affirmed, negated = find_keywords(pattern, clauses)
+        if affirmed:
+            add(feature, CONCEPT_WEIGHT * len(affirmed))
+        if negated:
+            add(f'not:{feature}', CONCEPT_WEIGHT * len(negated))
+            negations.add(f'not:{feature}')
+        if affirmed or negated:
+            mark = f'{CONCEPT_MARK}{len(marks)}'
+            marks[mark] = feature
+            clauses = [pattern.sub(lambda match: fold(match, mark), clause) for clause in clauses]
+
+    for clause in clauses:
+        words = clause.split()
+        for position, word in enumerate(words):
+            if word not in MODIFIERS:
+                continue
+            if position + 1 < len(words) and words[position + 1] in MODIFIERS:
+                # Modifica el modificador següent ("molt poc", "far away")
+                continue
+            step = 1 if word not in MODIFIERS_AFTER else -1
+            target = _modifier_target(words, position, step)
+            if target is None:
+                target = _modifier_target(words, position, -step)
+            if target is not None:
+                modify(marks.get(words[target]) or _topic(words[target]), MODIFIERS[word])
+
+        pending = 0
+        for word in words:
+            if word in marks:
+                # La negació anterior ja s'ha aplicat al concepte
+                pending = 0
+                continue
+            if word in MODIFIERS:
+                # Ja és un feature del que modifica
+                pending = max(0, pending - 1)
+                continue
+            if word in NEGATORS:
+                pending = NEGATION_WINDOW
+            elif word not in STOPWORDS and pending:
+                add(f'not:{word}', CONCEPT_WEIGHT)
+                negations.add(f'not:{word}')
+                pending = 0
+            else:
+                pending = max(0, pending - 1)
+            if word in STOPWORDS:
+                continue
+            add(f'w:{word}', 0.5)
+            padded = f' {word} '
+            ngrams = [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+            for ngram in ngrams:
+                add(ngram, 0.5 / len(ngrams))
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector, frozenset(negations), frozenset(modifiers)
+
+
+def embed(text, dim=EMBEDDING_DIM):
+    """Embedding normalitzat (L2) d'un text (vegeu analyze)."""
+    return analyze(text, dim)[0]
+
+
+class SemanticCache:
+    """
+    Índex en memòria d'embeddings amb el vector de preferències associat.
+
+    Args:
+        threshold: Similitud cosinus mínima per considerar un encert (0-1)
+        max_entries: Entrades màximes; en arribar-hi se n'expulsa una segons eviction
+        eviction: 'lru' (la menys usada recentment), 'lfu' (la menys usada) o 'fifo'
+        ttl: Segons de vida de cada entrada (0 = sense caducitat)
+    """
+
+    def __init__(self, threshold=0.92, max_entries=10000, eviction='lru', ttl=0, dim=EMBEDDING_DIM):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"eviction must be one of {EVICTION_POLICIES}")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.eviction = eviction
+        self.ttl = ttl
+        self.dim = dim
+        # Matriu preassignada: una fila per entrada, la cerca és un sol producte matriu-vector
+        self._embeddings = np.zeros((max_entries, dim), dtype=np.float32)
+        self._entries = [None] * max_entries
+        self._negations = [None] * max_entries
+        self._modifiers = [None] * max_entries
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self._size
+
+    def lookup(self, text):
+        """
+        Busca el text més semblant ja vist.
+
+        Retorna un dict amb vector, prompt, similarity i metadades, o None si no
+        n'hi ha cap per sobre del llindar que negui el mateix que el text i no en
+        contradigui els modificadors.
+        """
+        query, negations, modifiers = analyze(text, self.dim)
+        now = time.time()
+        with self._lock:
+            if self._size == 0:
+                self.misses += 1
+                return None
+            similarities = self._embeddings[:self._size] @ query
+            for slot in np.flatnonzero(similarities >= self.threshold):
+                if self._negations[slot] != negations or modifiers_conflict(self._modifiers[slot], modifiers) or (
+                        self.ttl > 0 and now - self._entries[slot]['created_at'] > self.ttl):
+                    similarities[slot] = -1.0
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[slot]
+            entry['hits'] += 1
+            entry['last_used'] = now
+            self.hits += 1
+            return dict(entry, similarity=round(similarity, 4))
+
+    def insert(self, text, vector, **metadata):
+        """Desa el vector d'un text (si ja n'hi ha un de pràcticament idèntic, el substitueix)."""
+        if self.max_entries == 0:
+            return
+        query, negations, modifiers = analyze(text, self.dim)
+        now = time.time()
+        entry = {
+            'prompt': text,
+            'vector': list(vector),
+            'created_at': now,
+            'last_used': now,
+            'hits': 0,
+            **metadata
+        }
+        with self._lock:
+            slot = None
+            if self._size:
+                similarities = self._embeddings[:self._size] @ query
+                best = int(np.argmax(similarities))
+                if (similarities[best] >= 0.999 and self._negations[best] == negations
+                        and self._modifiers[best] == modifiers):
+                    slot = best
+            if slot is None:
+                if self._size < self.max_entries:
+                    slot = self._size
+                    self._size += 1
+                else:
+                    slot = self._victim()
+            self._embeddings[slot] = query
+            self._entries[slot] = entry
+            self._negations[slot] = negations
+            self._modifiers[slot] = modifiers
+
+    def _victim(self):
+        """Posició de l'entrada a expulsar segons la política."""
+        entries = self._entries[:self._size]
+        if self.eviction == 'lfu':
+            key = lambda i: (entries[i]['hits'], entries[i]['last_used'])
+        elif self.eviction == 'fifo':
+            key = lambda i: entries[i]['created_at']
+        else:
+            key = lambda i: entries[i]['last_used']
+        return min(range(self._size), key=key)
+
+    def clear(self):
+        with self._lock:
+            self._entries = [None] * self.max_entries
+            self._negations = [None] * self.max_entries
+            self._modifiers = [None] * self.max_entries
+            self._size = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': self._size,
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'eviction': self.eviction,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None
+        }
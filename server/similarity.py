@@ -0,0 +1,149 @@
+"""
+Càlcul vectoritzat de similituds entre vectors de preferències i cel·les de la ciutat.
+
+Reprodueix els mateixos mètodes que `calculate_similarity` (app.py) però opera
+directament sobre arrays NumPy, sense cap bucle Python per cel·la.
+"""
+import numpy as np
+
+# Mètodes disponibles (mateix ordre que el desplegable del client)
+METHODS = ('cosine', 'ml', 'manhattan', 'weighted', 'pearson')
+
+# Pesos del mètode 'weighted' (veure calculate_similarity a app.py)
+WEIGHTS = np.array([
+    1.2,  # 0: income
+    1.5,  # 1: crimes
+    1.0,  # 2: connectivity
+    1.0,  # 3: noise
+    0.8,  # 4: walkability
+    1.3,  # 5: accessibility
+    0.9,  # 6: wellbeing
+    0.9,  # 7: mobility
+    1.1,  # 8: education
+    0.8,  # 9: community_vibe
+    1.2   # 10: health
+])
+
+
+def _squared_distances(vectors, cells, weights=None):
+    """
+    Distància euclidiana al quadrat (opcionalment ponderada) entre cada vector i cada cel·la.
+    Retorna una matriu (K, M).
+    """
+    if weights is not None:
+        vectors = vectors * np.sqrt(weights)
+        cells = cells * np.sqrt(weights)
+    sq = (np.sum(vectors ** 2, axis=1)[:, None]
+          + np.sum(cells ** 2, axis=1)[None, :]
+          - 2.0 * vectors @ cells.T)
+    return np.maximum(sq, 0.0)
+
+
+def _similarity_2d(vectors, cells, method):
+    """
+    Similitud entre K vectors (K, n) i M cel·les (M, n). Retorna (K, M) dins [0, 1].
+    """
+    n = cells.shape[1]
+
+    if method == 'ml':
+        # Distància euclidiana normalitzada + transformació gaussiana (sigma = 0.3)
+        distance = np.sqrt(_squared_distances(vectors, cells)) / np.sqrt(n)
+        similarity = np.exp(-(distance ** 2) / (2 * 0.3 ** 2))
+
+    elif method == 'manhattan':
+        # Suma de diferències absolutes, normalitzada per la distància màxima (n)
+        distance = np.abs(vectors[:, None, :] - cells[None, :, :]).sum(axis=2)
+        similarity = 1.0 - distance / float(n)
+
+    elif method == 'weighted':
+        distance = np.sqrt(_squared_distances(vectors, cells, WEIGHTS)) / np.sqrt(np.sum(WEIGHTS))
+        similarity = np.exp(-(distance ** 2) / 0.2)
+
+    elif method == 'pearson':
+        # Correlació de Pearson = cosinus dels vectors centrats
+        v_centered = vectors - vectors.mean(axis=1, keepdims=True)
+        c_centered = cells - cells.mean(axis=1, keepdims=True)
+        v_norm = np.linalg.norm(v_centered, axis=1)
+        c_norm = np.linalg.norm(c_centered, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = (v_centered @ c_centered.T) / np.outer(v_norm, c_norm)
+        # Vectors constants (desviació zero) -> similitud 0
+        correlation = np.where(np.outer(v_norm > 0, c_norm > 0), correlation, np.nan)
+        similarity = np.where(np.isnan(correlation), 0.0, (correlation + 1) / 2)
+
+    else:
+        # 'cosine' i mètode per defecte
+        v_norm = np.linalg.norm(vectors, axis=1)
+        c_norm = np.linalg.norm(cells, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = (vectors @ cells.T) / np.outer(v_norm, c_norm)
+        similarity = np.where(np.outer(v_norm > 0, c_norm > 0), similarity, 0.0)
+
+    return np.clip(similarity, 0.0, 1.0)
+
+
+def similarity_grid(user_vector, cells, method='cosine'):
+    """
+    Calcula la similitud entre un vector de l'usuari i totes les cel·les d'una graella.
+
+    Args:
+        user_vector: Vector de preferències (n valors)
+        cells: Array de forma (..., n), per exemple (20, 20, 11)
+        method: 'cosine', 'ml', 'manhattan', 'weighted' o 'pearson'
+
+    Retorna un array amb la forma de la graella (sense l'últim eix) i valors entre 0 i 1.
+    """
+    cells = np.asarray(cells, dtype=float)
+    vector = np.asarray(user_vector, dtype=float).reshape(1, -1)
+    flat = cells.reshape(-1, cells.shape[-1])
+    return _similarity_2d(vector, flat, method)[0].reshape(cells.shape[:-1])
+
+
+def similarity_batch(vectors, cells, method='cosine', chunk_size=256):
+    """
+    Calcula la similitud de molts vectors contra la mateixa graella en una sola passada.
+
+    Args:
+        vectors: Array (K, n) de vectors de preferències
+        cells: Array de forma (..., n)
+        method: Mètode de similitud
+        chunk_size: Nombre de vectors processats alhora (limita la memòria temporal)
+
+    Retorna un array (K, ...) amb un mapa de calor per vector.
+    """
+    cells = np.asarray(cells, dtype=float)
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=float))
+    flat = cells.reshape(-1, cells.shape[-1])
+
+    if method == 'manhattan':
+        # Manhattan necessita un temporal (K, M, n): limitar-lo a ~4M elements
+        chunk_size = max(1, min(chunk_size, 4_000_000 // max(flat.size, 1)))
+
+    result = np.empty((vectors.shape[0], flat.shape[0]))
+    for start in range(0, vectors.shape[0], chunk_size):
+        stop = start + chunk_size
+        result[start:stop] = _similarity_2d(vectors[start:stop], flat, method)
+
+    return result.reshape((vectors.shape[0],) + cells.shape[:-1])
+
+
+def top_k_cells(scores, k):
+    """
+    Les k cel·les amb més puntuació de cada mapa de calor.
+
+    Args:
+        scores: Array (..., rows, cols) de similituds (un o més mapes)
+        k: Nombre de cel·les
+
+    Retorna (rows, cols, values), cada un de forma (..., k), ordenats de més a menys.
+    """
+    scores = np.asarray(scores, dtype=float)
+    grid_shape = scores.shape[-2:]
+    flat = scores.reshape(scores.shape[:-2] + (-1,))
+    k = max(0, min(k, flat.shape[-1]))
+    # argpartition és O(M); només s'ordenen els k guanyadors
+    candidates = np.argpartition(-flat, k - 1, axis=-1)[..., :k] if k else flat[..., :0].astype(int)
+    order = np.argsort(-np.take_along_axis(flat, candidates, axis=-1), axis=-1, kind='stable')
+    indices = np.take_along_axis(candidates, order, axis=-1)
+    rows, cols = np.unravel_index(indices, grid_shape)
+    return rows, cols, np.take_along_axis(flat, indices, axis=-1)
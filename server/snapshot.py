@@ -0,0 +1,127 @@
+"""
+Instantània binària versionada de la matriu unificada de la ciutat.
+
+Compila les capes JSON a arrays .npy (matriu base + nivells de la piràmide) i una
+metadada JSON. El servidor els obre amb np.load(mmap_mode='r'): l'arrencada no
+ha de parsejar cap JSON i diversos workers comparteixen les mateixes pàgines a
+través de la page cache del sistema operatiu.
+
+Ús (des del directori server/):
+    python snapshot.py                 # compila les capes actuals
+    python snapshot.py --json-dir DIR --out DIR
+
+Estructura:
+    city_stats/snapshots/CURRENT              -> versió activa
+    city_stats/snapshots/<versió>/meta.json
+    city_stats/snapshots/<versió>/features.npy
+    city_stats/snapshots/<versió>/level_<mida>.npy
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+
+from feature_store import FeatureStore, build_feature_store, layers_digest
+from layers import JSON_DIR
+from structured_log import configure_logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = Path(__file__).parent / 'city_stats' / 'snapshots'
+
+
+def write_snapshot(store, json_dir=JSON_DIR, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Escriu un FeatureStore com a instantània i la marca com a activa.
+
+    Retorna el directori de la instantània.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    target = snapshot_dir / store.version
+    tmp = snapshot_dir / f'.{store.version}.tmp'
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    np.save(tmp / 'features.npy', np.ascontiguousarray(store.features))
+    for level in store.pyramid:
+        np.save(tmp / f'level_{level.shape[0]}.npy', np.ascontiguousarray(level))
+
+    meta = {
+        'version': store.version,
+        'created_at': time.time(),
+        'shape': list(store.features.shape),
+        'dtype': str(store.features.dtype),
+        'levels': [level.shape[0] for level in store.pyramid],
+        'data_info': store.data_info,
+        'layers_digest': [list(entry) for entry in layers_digest(json_dir)]
+    }
+    with open(tmp / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+
+    # Canvi atòmic del punter a la versió activa
+    pointer_tmp = snapshot_dir / '.CURRENT.tmp'
+    pointer_tmp.write_text(store.version, encoding='utf-8')
+    os.replace(pointer_tmp, snapshot_dir / 'CURRENT')
+
+    return target
+
+
+def load_snapshot(json_dir=JSON_DIR, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Obre la instantània activa amb memory mapping.
+
+    Retorna un FeatureStore, o None si no n'hi ha cap, si està incompleta o malmesa,
+    o si el contingut dels JSON de les capes ha canviat des que es va compilar (la
+    instantània estaria desactualitzada). Les dates de modificació no compten: un
+    checkout nou no invalida una instantània bona.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    try:
+        version = (snapshot_dir / 'CURRENT').read_text(encoding='utf-8').strip()
+        target = snapshot_dir / version
+        with open(target / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    current_digest = [list(entry) for entry in layers_digest(json_dir)]
+    if meta.get('layers_digest') != current_digest:
+        logger.warning("Instantània %s desactualitzada, es carreguen els JSON", version)
+        return None
+
+    try:
+        features = np.load(target / 'features.npy', mmap_mode='r')
+        pyramid = [np.load(target / f'level_{size}.npy', mmap_mode='r') for size in meta['levels']]
+    except (OSError, ValueError, KeyError) as e:
+        logger.error("Instantània %s malmesa, es carreguen els JSON: %s", version, e, extra={'path': str(target)})
+        return None
+    logger.info("Instantània %s carregada amb mmap", version, extra={'path': str(target)})
+    return FeatureStore(features, meta['data_info'], version=meta['version'], pyramid=pyramid)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compila les capes JSON a una instantània binària')
+    parser.add_argument('--json-dir', default=str(JSON_DIR), help='Directori dels JSON de capes')
+    parser.add_argument('--out', default=str(SNAPSHOT_DIR), help='Directori de les instantànies')
+    args = parser.parse_args()
+
+    configure_logging(fmt='text')
+
+    store = build_feature_store(args.json_dir)
+    failed = store.failed_layers()
+    if failed:
+        logger.error("No es pot compilar la instantània, capes amb errors", extra={'failed_layers': failed})
+        raise SystemExit(1)
+
+    path = write_snapshot(store, args.json_dir, args.out)
+    logger.info("Instantània %s escrita a %s", store.version, path)
@@ -0,0 +1,204 @@
+"""
+Logs estructurats (JSON) amb nivells, mostreig i escriptura en segon pla.
+
+Els mòduls del servidor fan servir `logging` de la llibreria estàndard:
+
+    logger = logging.getLogger(__name__)
+    logger.info("Vector de preferències desat", extra={'vector': vector, 'source': 'llm'})
+
+configure_logging() (es crida en importar app.py) hi afegeix:
+  - Una línia JSON per registre amb l'hora, el nivell, el logger, el missatge, els
+    camps d'`extra` i la traça activa (trace_id/span_id de tracing.py).
+  - Mostreig per punt del codi: cada línia que registra INFO o DEBUG pot emetre
+    LOG_BURST registres per segon; a partir d'aquí només en passa una fracció
+    LOG_SAMPLE_RATE, i el següent que passa porta el camp 'suppressed' amb els
+    descartats. Els WARNING i ERROR no es mostregen mai.
+  - Una cua acotada (QueueHandler): el fil de la petició només hi deixa el registre
+    i un fil de fons l'escriu a stdout. Si la cua s'omple els registres es descarten
+    en lloc de bloquejar la petició.
+
+Variables d'entorn:
+    LOG_LEVEL        Nivell mínim (per defecte INFO)
+    LOG_FORMAT       'json' (per defecte) o 'text' per a la consola de desenvolupament
+    LOG_BURST        Registres INFO/DEBUG per segon i punt del codi sense mostreig (per defecte 20)
+    LOG_SAMPLE_RATE  Fracció dels registres que superen LOG_BURST que s'escriuen (per defecte 0.01)
+    LOG_QUEUE_SIZE   Registres màxims pendents d'escriure (per defecte 10000)
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from tracing import current_span
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOG_BURST = int(os.getenv('LOG_BURST', '20'))
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Atributs propis de LogRecord: la resta són camps d'`extra`
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+# Símbols dels missatges de consola (format 'text')
+LEVEL_SYMBOLS = {'WARNING': '⚠ ', 'ERROR': '✗ ', 'CRITICAL': '✗ ', 'INFO': '✓ '}
+
+
+def record_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in RESERVED_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línia JSON per registre."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        entry.update(record_fields(record))
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Missatge amb el símbol del nivell i els camps com a clau=valor."""
+
+    def format(self, record):
+        fields = ' '.join(f'{key}={value}' for key, value in record_fields(record).items()
+                          if key not in ('trace_id', 'span_id'))
+        line = f"{LEVEL_SYMBOLS.get(record.levelname, '')}{record.getMessage()}"
+        if fields:
+            line += f'  [{fields}]'
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class TraceFilter(logging.Filter):
+    """Afegeix la traça activa (s'executa al fil de la petició, abans de la cua)."""
+
+    def filter(self, record):
+        span = current_span()
+        if span is not None and span.trace_id:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Limita els registres INFO/DEBUG de cada punt del codi (fitxer i línia) a `burst`
+    per segon i, per sobre, en deixa passar una fracció `rate`.
+    """
+
+    def __init__(self, burst=LOG_BURST, rate=LOG_SAMPLE_RATE):
+        super().__init__()
+        self.burst = burst
+        self.rate = rate
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window, count, suppressed = self._sites.get(site, (now, 0, 0))
+            if now - window >= 1.0:
+                window, count = now, 0
+            count += 1
+            keep = count <= self.burst or random.random() < self.rate
+            self._sites[site] = (window, count, 0 if keep else suppressed + 1)
+        if keep and suppressed:
+            record.suppressed = suppressed
+        return keep
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que no bloqueja mai: si la cua és plena el registre es descarta.
+    El fil que escriu s'inicia (o es reinicia després d'un fork de gunicorn) sota demanda.
+    """
+
+    def __init__(self, handlers, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.target_handlers = handlers
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Després d'un fork el fil del pare no existeix: cua i fil nous
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = logging.handlers.QueueListener(self.queue, *self.target_handlers,
+                                                            respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # El missatge i l'excepció es formaten al fil de la petició (els arguments
+        # poden canviar després); la resta de camps es formaten al fil que escriu
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def stop(self):
+        """Atura el fil que escriu després de buidar la cua (en sortir del procés)."""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+_handler = None
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """
+    Configura el logger arrel del procés (idempotent). Retorna el handler de la cua.
+    """
+    global _handler
+    if _handler is not None:
+        return _handler
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+
+    _handler = DroppingQueueHandler([output])
+    _handler.addFilter(SamplingFilter())
+    _handler.addFilter(TraceFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_handler)
+    atexit.register(_handler.stop)
+    return _handler
@@ -0,0 +1,308 @@
+"""
+Traces lleugeres compatibles amb OpenTelemetry.
+
+Cada petició té una traça (capçalera W3C `traceparent` d'entrada o una de nova) i
+cada etapa (cache, vectoritzador local, prompt, crida a Gemini, parseig, mapa de
+calor...) hi obre un span amb @traced o `with span(...)`. L'identificador de la
+traça es retorna al client (capçaleres `traceparent` i `X-Trace-Id`).
+
+Els spans acabats es desen per lots en un fil de fons en format OTLP/JSON:
+    TRACE_FILE                    Fitxer JSONL (una ExportTraceServiceRequest per línia,
+                                  el format del receptor otlpjsonfile del collector)
+    OTEL_EXPORTER_OTLP_ENDPOINT   Collector OTLP/HTTP (p. ex. http://localhost:4318)
+    TRACE_SAMPLE_RATE             Fracció de traces exportades (per defecte 1)
+    OTEL_SERVICE_NAME             Nom del servei (per defecte hackeps-server)
+
+Sense cap exportador els spans no es creen i només es propaga l'identificador.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+
+TRACE_FILE = os.getenv('TRACE_FILE')
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1'))
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'hackeps-server')
+
+logger = logging.getLogger(__name__)
+
+# Span (o context de traça) actiu en aquest fil o tasca asyncio
+_current = contextvars.ContextVar('current_span', default=None)
+
+
+class TraceContext:
+    """Traça sense span propi (quan no s'exporta res o la traça no és mostrejada)."""
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def set_attribute(self, key, value):
+        pass
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+class Span(TraceContext):
+    def __init__(self, name, parent, attributes=None, kind=1):
+        super().__init__(parent.trace_id, os.urandom(8).hex(), True)
+        self.name = name
+        self.parent_span_id = parent.span_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, error=None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f'{type(error).__name__}: {error}'
+        _processor.enqueue(self)
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+        if self.parent_span_id:
+            span['parentSpanId'] = self.parent_span_id
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def export_request(spans):
+    """Cos OTLP/JSON (ExportTraceServiceRequest) per a una llista de spans."""
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': [span.to_otlp() for span in spans]}]
+        }]
+    }
+
+
+class BatchProcessor:
+    """Cua de spans acabats que un fil de fons exporta per lots (no bloqueja les peticions)."""
+
+    def __init__(self, exporters, max_queue=10000, batch_size=512, interval=1.0):
+        self.exporters = exporters
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.exporters)
+
+    def enqueue(self, span):
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                # El fil s'inicia sota demanda: després del fork dels workers de gunicorn
+                self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._export(batch)
+
+    def _export(self, batch):
+        payload = export_request(batch)
+        for exporter in self.exporters:
+            try:
+                exporter(payload)
+            except Exception as e:
+                logger.warning("Error exportant %d spans: %s", len(batch), e)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+def jsonl_exporter(path):
+    lock = threading.Lock()
+
+    def export(payload):
+        line = json.dumps(payload, separators=(',', ':'))
+        with lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    return export
+
+
+def otlp_http_exporter(endpoint):
+    url = endpoint.rstrip('/') + '/v1/traces'
+
+    def export(payload):
+        request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        urllib.request.urlopen(request, timeout=5).close()
+    return export
+
+
+_exporters = []
+if TRACE_FILE:
+    _exporters.append(jsonl_exporter(TRACE_FILE))
+if OTLP_ENDPOINT:
+    _exporters.append(otlp_http_exporter(OTLP_ENDPOINT))
+_processor = BatchProcessor(_exporters)
+
+
+def parse_traceparent(header):
+    """(trace_id, parent_span_id, sampled) d'una capçalera traceparent, o None si no és vàlida."""
+    parts = (header or '').strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32:
+        return None
+    return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+
+
+def current_span():
+    """Span actiu, o None fora d'una petició."""
+    return _current.get()
+
+
+def start_request(name, traceparent=None, attributes=None):
+    """
+    Obre el span arrel d'una petició (continua la traça de `traceparent` si és vàlida)
+    i el fa actiu. Retorna (span, token) per a end_request.
+    """
+    incoming = parse_traceparent(traceparent)
+    if incoming:
+        trace_id, parent_id, sampled = incoming
+    else:
+        trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE
+
+    parent = TraceContext(trace_id, parent_id, sampled)
+    if _processor.enabled and sampled:
+        root = Span(name, parent, attributes, kind=2)
+    else:
+        root = TraceContext(trace_id, os.urandom(8).hex(), sampled)
+    return root, _current.set(root)
+
+
+def end_request(root, token, status=None):
+    if status is not None:
+        root.set_attribute('http.status_code', status)
+    if isinstance(root, Span):
+        root.end(error=RuntimeError(f'HTTP {status}') if status and status >= 500 else None)
+    try:
+        _current.reset(token)
+    except ValueError:
+        # El token és d'un altre context (p. ex. resposta en streaming)
+        _current.set(None)
+
+
+class span:
+    """
+    Span fill del span actiu, com a context manager:
+
+        with span('llm.parse', model=name) as s:
+            s.set_attribute('vector.valid', True)
+    """
+
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is None or not parent.sampled or not _processor.enabled:
+            return parent or TraceContext(None, None, False)
+        self._span = Span(self.name, parent, self.attributes)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is not None:
+            _current.reset(self._token)
+            self._span.end(error=exc)
+        return False
+
+
+def traced(name):
+    """Decorador: executa la funció (síncrona o async) dins d'un span."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_context(func):
+    """
+    Vincula func al context actual (span actiu inclòs) per executar-la en un altre fil:
+    executor.submit(in_context(func), ...).
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
@@ -0,0 +1,91 @@
+"""
+Parser incremental del vector de preferències i format Server-Sent Events.
+
+La LLM retorna el vector com a text ("[0.9, 0.5, ...]") en fragments. En lloc
+d'esperar la resposta completa, el parser consumeix cada fragment a mesura que
+arriba i retorna el vector en el moment que es tanca el claudàtor.
+"""
+import json
+
+from layers import VECTOR_SIZE
+
+
+def sse_event(event, data):
+    """Formata un esdeveniment SSE amb nom i dades JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class VectorStreamParser:
+    """
+    Extreu un array JSON de números d'un text que arriba per fragments.
+
+    Cada caràcter es llegeix una sola vegada: els números es converteixen a
+    float en arribar la coma i el vector es dóna per complet amb el ']'.
+    Text previ al '[' (o blocs ```json) s'ignora; si l'array no és vàlid
+    (valors no numèrics, mida incorrecta) es descarta i se'n busca un altre.
+    """
+
+    def __init__(self, size=VECTOR_SIZE):
+        self.size = size
+        self.text = ''
+        self.values = []
+        self.vector = None
+        self._inside = False
+        self._token = ''
+
+    @property
+    def done(self):
+        return self.vector is not None
+
+    def feed(self, chunk):
+        """
+        Afegeix un fragment de text.
+
+        Retorna el vector (llista de floats) la primera vegada que es completa,
+        None en qualsevol altre cas.
+        """
+        self.text += chunk
+        if self.done:
+            return None
+
+        for char in chunk:
+            if not self._inside:
+                if char == '[':
+                    self._inside = True
+                    self.values = []
+                    self._token = ''
+                continue
+
+            if char in ',]':
+                if not self._push_token():
+                    continue
+                if char == ']':
+                    if len(self.values) == self.size:
+                        self.vector = self.values
+                        return self.vector
+                    self._reset()
+            elif char == '[':
+                # Array niat o reinici: es comença de nou
+                self.values = []
+                self._token = ''
+            elif not char.isspace():
+                self._token += char
+        return None
+
+    def _push_token(self):
+        """Converteix el número acumulat. Si no és vàlid, descarta l'array actual."""
+        if not self._token:
+            # "[]" o coma sobrant: només és vàlid si encara no hi ha valors
+            return True
+        try:
+            self.values.append(float(self._token))
+        except ValueError:
+            self._reset()
+            return False
+        self._token = ''
+        return True
+
+    def _reset(self):
+        self._inside = False
+        self.values = []
+        self._token = ''
@@ -1,9 +1,12 @@
 import requests
 import time
 import json
+import logging
 from pathlib import Path
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # URL de la API pública de Overpass
 OVERPASS_URL = "http://overpass-api.de/api/interpreter"
 
@@ -65,7 +68,7 @@ def get_tyrion_score(bbox):
         response.raise_for_status() # Lanzar error si falla la conexión
         data = response.json()
     except Exception as e:
-        print(f"Error en la llamada API: {e}")
+        logger.error(f"Error en la llamada API: {e}")
         return 0 # O manejar el reintento
 
     # 3. Calculamos el puntaje procesando los resultados
@@ -104,8 +107,8 @@ def create_walkability_matrix_20x20():
     # Crear matriz vacía
     matrix = [[0.0 for _ in range(20)] for _ in range(20)]
     
-    print("\nProcesando matriz 20x20 de walkability...")
-    print(f"Área: N:{BOUND_N}, S:{BOUND_S}, W:{BOUND_W}, E:{BOUND_E}")
+    logger.info("Procesando matriz 20x20 de walkability...")
+    logger.info(f"Área: N:{BOUND_N}, S:{BOUND_S}, W:{BOUND_W}, E:{BOUND_E}")
     
     total_cells = 400
     processed = 0
@@ -128,7 +131,7 @@ def create_walkability_matrix_20x20():
             matrix[i][j] = score
             
             processed += 1
-            print(f"Celda [{i},{j}]: Score {score} | Progreso: {processed}/{total_cells}")
+            logger.info(f"Celda [{i},{j}]: Score {score} | Progreso: {processed}/{total_cells}")
             
             # Pausa de cortesía para no sobrecargar la API
             time.sleep(1.5)
@@ -140,7 +143,7 @@ def create_walkability_matrix_20x20():
             if val > max_score:
                 max_score = val
     
-    print(f"\nScore máximo encontrado: {max_score}")
+    logger.info(f"Score máximo encontrado: {max_score}")
     
     # Normalizar entre 0 y 1
     normalized_matrix = []
@@ -179,8 +182,9 @@ def save_walkability_matrix_json(nx=20, ny=20):
     with out_path.open("w", encoding="utf-8") as fh:
         json.dump(obj, fh, indent=2, ensure_ascii=False)
     
-    print(f"\n✓ JSON guardado en: {out_path}")
+    logger.info(f"JSON guardado en: {out_path}")
     return out_path
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
     save_walkability_matrix_json()
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Format binari compacte per enviar graelles (matriu de la ciutat, mapes de calor) al client.
+
+Estructura del missatge (little-endian):
+
+    [uint32: mida de la capçalera][capçalera JSON UTF-8][dades]
+
+La capçalera s'omple amb espais perquè les dades comencin en un offset múltiple de 4
+i el client pugui crear directament un Float32Array/Uint16Array sobre el buffer.
+Conté 'dtype', 'shape' i, per als formats quantitzats, 'offset' i 'scale'
+(valor = offset + q * scale), a més de qualsevol metadada de la resposta.
+
+Un missatge delta (encode_delta) porta 'delta_count' en lloc de 'shape' i les
+dades són [uint32 índexs][valors] de les cel·les que han canviat.
+"""
+import json
+import numpy as np
+
+BINARY_MIMETYPE = 'application/octet-stream'
+
+# Formats acceptats al query param ?format=
+DTYPES = {
+    'f32': '<f4',
+    'u16': '<u2',
+    'u8': 'u1'
+}
+
+
+def requested_format(args, accept_header):
+    """
+    Decideix el format de resposta a partir del query param 'format' o de la capçalera Accept.
+
+    Retorna 'f32', 'u16', 'u8' o None (JSON).
+    """
+    fmt = args.get('format')
+    if fmt in DTYPES:
+        return fmt
+    if fmt == 'json':
+        return None
+    if accept_header and BINARY_MIMETYPE in accept_header:
+        return 'f32'
+    return None
+
+
+def quantize(values, fmt='f32'):
+    """
+    Converteix valors al tipus del format.
+
+    Retorna (dades, paràmetres): per als formats quantitzats els paràmetres són
+    'offset' i 'scale' (valor = offset + q * scale); per a 'f32' és buit.
+    """
+    values = np.asarray(values, dtype=float)
+    if fmt == 'f32':
+        return values.astype('<f4'), {}
+
+    levels = np.iinfo(np.dtype(DTYPES[fmt])).max
+    low = float(values.min()) if values.size else 0.0
+    high = float(values.max()) if values.size else 0.0
+    scale = (high - low) / levels if high > low else 1.0
+    data = np.rint((values - low) / scale).astype(DTYPES[fmt])
+    return data, {'offset': low, 'scale': scale}
+
+
+def dequantize(data, params):
+    """Valors (float64) que reconstrueix el client a partir de quantize()."""
+    values = np.asarray(data, dtype=float)
+    if params:
+        values = params['offset'] + values * params['scale']
+    return values
+
+
+def _message(meta, *arrays):
+    header_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    # Alinear l'inici de les dades a 4 bytes
+    header_bytes += b' ' * (-(4 + len(header_bytes)) % 4)
+
+    return len(header_bytes).to_bytes(4, 'little') + header_bytes + b''.join(a.tobytes() for a in arrays)
+
+
+def encode_grid(grid, header=None, fmt='f32'):
+    """
+    Serialitza una graella NumPy amb una capçalera JSON petita.
+
+    Args:
+        grid: Array de qualsevol forma (per exemple (20, 20) o (20, 20, 11))
+        header: Metadades addicionals (rectangle, stats, ...), han de ser serialitzables a JSON
+        fmt: 'f32' (float32), 'u16' o 'u8' (quantitzat linealment entre min i max)
+
+    Retorna els bytes del missatge.
+    """
+    grid = np.asarray(grid, dtype=float)
+    data, params = quantize(grid, fmt)
+    meta = dict(header or {})
+    meta['dtype'] = fmt
+    meta['shape'] = list(grid.shape)
+    meta.update(params)
+    return _message(meta, data)
+
+
+def encode_quantized(data, params, header=None, fmt='u16'):
+    """
+    Serialitza una graella ja quantitzada (p. ex. desada així en un artefacte) sense
+    tornar-la a convertir. params són els 'offset' i 'scale' de quantize().
+    """
+    meta = dict(header or {})
+    meta['dtype'] = fmt
+    meta['shape'] = list(data.shape)
+    meta.update(params)
+    return _message(meta, np.asarray(data, dtype=DTYPES[fmt]))
+
+
+def encode_delta(indices, data, params, header=None, fmt='f32'):
+    """
+    Serialitza els canvis d'una graella: els índexs (pla, uint32) de les cel·les
+    canviades seguits dels nous valors ja quantitzats amb quantize().
+
+    La capçalera porta 'delta_count' en lloc de 'shape'; els índexs ocupen
+    4 * delta_count bytes, de manera que els valors també queden alineats.
+    """
+    meta = dict(header or {})
+    meta['dtype'] = fmt
+    meta['delta_count'] = int(len(indices))
+    meta.update(params)
+    return _message(meta, np.asarray(indices, dtype='<u4'), data)
+
+
+def decode_header(payload):
+    """Capçalera JSON d'un missatge, sense llegir les dades."""
+    header_length = int.from_bytes(payload[:4], 'little')
+    return json.loads(payload[4:4 + header_length].decode('utf-8'))
+
+
+def decode_grid(payload):
+    """
+    Operació inversa d'encode_grid i encode_delta (útil per a scripts i proves).
+
+    Retorna (header, grid) amb la graella en float64; per a un delta, grid són els
+    valors nous i header['indices'] les posicions.
+    """
+    header = decode_header(payload)
+    offset = 4 + int.from_bytes(payload[:4], 'little')
+    if 'delta_count' in header:
+        count = header['delta_count']
+        header['indices'] = np.frombuffer(payload, dtype='<u4', count=count, offset=offset)
+        offset += 4 * count
+    data = np.frombuffer(payload, dtype=DTYPES[header['dtype']], offset=offset)
+    grid = dequantize(data.reshape(header.get('shape', [-1])), header if header['dtype'] != 'f32' else {})
+    return header, grid